@@ -0,0 +1,427 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import cubo as cb
+import cubo_arrow
+import metricas
+import turmas as tm
+from dados import (carregar_com_snapshot, mapa_cursos_evasao, pares_evasao,
+                   preparar_evasao, preparar_saida)
+from filtros import IndiceFiltros
+from ingestao import carregar_cubo_publicado
+
+# ---------------------------------------
+# Análises das abas, sem Streamlit
+# ---------------------------------------
+# As agregações de cada aba do dashboard são funções puras de uma Base (as
+# tabelas de uma versão dos dados e as estruturas derivadas delas) e do
+# estado dos filtros. O dashboard guarda as estruturas por processo e chama
+# estas funções; o modo em lote (lote.py) as chama para todos os campi e
+# cursos e grava os resultados em PASTA_RELATORIOS, que o dashboard e os
+# relatórios noturnos leem (Artefatos) quando a versão dos dados confere.
+
+PASTA_RELATORIOS = "relatorios"
+MANIFESTO = "manifesto.json"
+
+INSCRITOS = ["incritos_vest", "incritos_sisu", "incritos_provare"]
+TIPOS_INGRESSO = ["ingressantes_vest", "ingressantes_sisu",
+                  "ingressantes_provare"]
+MEDIDAS_EVASAO = ["entradas_vest", "entradas_sisu", "entradas_provare",
+                  "evasao_vest", "evasao_sisu", "evasao_provare",
+                  "evasao_total"]
+PERCENTUAIS_EVASAO = ["perc_vest", "perc_sisu", "perc_provare", "perc_total"]
+
+
+# Somas acumuladas por ano de cada curso: totais do intervalo do slider.
+# Só medidas de contagem, cujas diferenças de somas são exatas (a média de
+# Permanência continua vindo do cubo filtrado).
+def acumulados_cursos(cubo):
+    somas = cb.SomasPorAno(
+        cubo, ["campus", "grau", "turno", "curso_nome"],
+        cb.MEDIDAS + ["vagas_vest"])
+    return somas, IndiceFiltros(somas.grupos, colunas=somas.chaves)
+
+
+def acumulados_evasao(df_e):
+    return cb.SomasPorAno(df_e.assign(linhas=1), ["campus", "curso"],
+                          MEDIDAS_EVASAO)
+
+
+class Base:
+    def __init__(self, df, df_evasao, indice, cubo, indice_cubo, somas_ano,
+                 indice_grupos, somas_evasao, mapa_evasao, cubo_tabela=None):
+        self.df = df
+        self.df_evasao = df_evasao
+        self.indice = indice
+        self.cubo = cubo
+        self.indice_cubo = indice_cubo
+        self.somas_ano = somas_ano
+        self.indice_grupos = indice_grupos
+        self.somas_evasao = somas_evasao
+        self.mapa_evasao = mapa_evasao
+        # Com o cubo em pa.Table (cubo_arrow.CuboArrow) as agregações usam
+        # o backend Arrow; o pandas é a referência
+        self.cubo_tabela = cubo_tabela
+        self.motor = cb if cubo_tabela is None else cubo_arrow
+        self.versao = df.attrs.get("versao")
+        self.versao_evasao = df_evasao.attrs.get("versao")
+
+    def recorte_cubo(self, filtros, anos):
+        if self.cubo_tabela is not None:
+            return self.cubo_tabela.recortar(filtros, {"ano": anos})
+        return self.cubo.take(
+            self.indice_cubo.selecionar(filtros, {"ano": anos}))
+
+    def totais_por_curso(self, filtros, anos):
+        return self.somas_ano.totais(
+            anos[0], anos[1], self.indice_grupos.selecionar(filtros))
+
+
+def carregar_base(caminho_saida="saida.csv",
+                  caminho_evasao="evasao_processos.csv", backend="pandas"):
+    df = carregar_com_snapshot(caminho_saida, preparar_saida)
+    df_evasao = carregar_com_snapshot(caminho_evasao, preparar_evasao)
+    cubo = carregar_cubo_publicado(caminho_saida, df.attrs.get("versao"))
+    return montar_base(df, df_evasao, cubo, backend)
+
+
+def montar_base(df, df_evasao, cubo=None, backend="pandas"):
+    if cubo is None:
+        cubo = cb.construir_cubo(df)
+    somas_ano, indice_grupos = acumulados_cursos(cubo)
+    return Base(df, df_evasao, IndiceFiltros(df), cubo, IndiceFiltros(cubo),
+                somas_ano, indice_grupos, acumulados_evasao(df_evasao),
+                mapa_cursos_evasao(df, df_evasao),
+                cubo_arrow.CuboArrow(cubo) if backend == "arrow" else None)
+
+
+# Limites do slider de anos para os filtros (todos os anos se a seleção não
+# tiver linhas)
+def limites_anos(indice, filtros):
+    anos = indice.opcoes("ano", indice.selecionar(filtros))
+    if not anos:
+        anos = indice.opcoes("ano")
+    return int(anos[0]), int(anos[-1])
+
+
+# ---------------------------------------
+# Agregações de cada aba
+# ---------------------------------------
+# filtros: {"campus", "grau", "turno", "curso_nome": seleção}, seleção vazia
+# não filtra; anos: (inicio, fim). Cada função devolve {nome: tabela ou
+# valor} com os dados de entrada dos gráficos da aba.
+
+def visao_geral(base, filtros, anos):
+    motor = base.motor
+    cubo_f = base.recorte_cubo(filtros, anos)
+    totais_curso = base.totais_por_curso(filtros, anos)
+    d = {}
+    d["totais"] = cb.somar(
+        totais_curso, ["ingressantes_geral", "formados_geral"])
+    d["permanencia_media"] = motor.media_permanencia(cubo_f)
+    d["df_plot"] = motor.somar(
+        cubo_f, ["ingressantes_geral", "formados_geral"], por="ano")
+    d["df_vagas_ano"] = motor.somar(cubo_f, ["vagas"], por="ano")
+
+    # Calcula a média da permanência por ano, ignorando valores <= 0
+    df_permanencia = motor.media_permanencia(cubo_f, por="ano")
+    # Multiplica somente a coluna Permanencia por 100
+    df_permanencia["Permanencia"] = df_permanencia["Permanencia"] * 100
+    df_permanencia["Permanencia"] = df_permanencia["Permanencia"].round(2)
+    d["df_permanencia"] = df_permanencia
+
+    df_tipo = motor.somar(cubo_f, TIPOS_INGRESSO).reset_index()
+    df_tipo.columns = ["Tipo", "Quantidade"]
+    d["df_tipo"] = df_tipo
+
+    df_ocup_curso = motor.media_permanencia(cubo_f, por="curso_nome")
+    df_ocup_curso["Permanencia"] = df_ocup_curso["Permanencia"] * 100
+    df_ocup_curso["Permanencia"] = df_ocup_curso["Permanencia"].round(2)
+    d["df_ocup_curso"] = df_ocup_curso.sort_values(
+        "Permanencia", ascending=True)
+    return d
+
+
+def inscricoes(base, filtros, anos):
+    motor = base.motor
+    cubo_f = base.recorte_cubo(filtros, anos)
+    totais_curso = base.totais_por_curso(filtros, anos)
+    d = {}
+    d["df_insc"] = motor.somar(cubo_f, INSCRITOS, por="ano")
+    df_total_insc = motor.somar(cubo_f, INSCRITOS).reset_index()
+    df_total_insc.columns = ["Processo", "Total de Inscritos"]
+    d["df_total_insc"] = df_total_insc
+
+    df_vest_curso = cb.somar(totais_curso, ["incritos_vest"], por="curso_nome")
+    d["df_vest_curso"] = df_vest_curso.sort_values(
+        "incritos_vest", ascending=True)
+
+    df_rel_vest_vagas = motor.agregar(cubo_f, "curso_nome", {
+        "incritos_vest": "sum",
+        "vagas": "sum",
+        "ano": "min"  # pega o menor ano do filtro para cada curso
+    })
+    # Aplica a regra: dobra inscritos_por_vaga para anos >= 2014
+    df_rel_vest_vagas["inscritos_por_vaga"] = metricas.concorrencia_corrigida(
+        df_rel_vest_vagas["incritos_vest"], df_rel_vest_vagas["vagas"],
+        df_rel_vest_vagas["ano"])
+    d["df_rel_vest_vagas"] = df_rel_vest_vagas.sort_values(
+        "inscritos_por_vaga", ascending=True)
+
+    # Vagas do vestibular conforme regra: até 2013 = vagas, a partir de 2014 = vagas * 0.5
+    # Agrupa por curso
+    df_vest = cb.somar(
+        totais_curso, ["incritos_vest", "vagas_vest"], por="curso_nome")
+    df_vest["concorrencia_vest"] = metricas.concorrencia_vest(
+        df_vest["incritos_vest"], df_vest["vagas_vest"])
+
+    # Ordena por concorrência
+    d["df_vest"] = df_vest.sort_values("concorrencia_vest", ascending=True)
+    return d
+
+
+def matriculados(base, filtros, anos):
+    motor = base.motor
+    series_cols = ["primeiro_ano", "segundo_ano",
+                   "terceiro_ano", "quarto_ano", "quinto_ano", "sexto_ano"]
+    cubo_f = base.recorte_cubo(filtros, anos)
+    aux = motor.filtrar_valores(cubo_f, "curso_nome", filtros["curso_nome"])
+    df_series = motor.somar(aux, series_cols, por=["ano", "curso_nome"])
+    d = {}
+    d["df_series_melt"] = df_series.melt(
+        id_vars=["ano", "curso_nome"],
+        value_vars=series_cols,
+        var_name="Série",
+        value_name="Alunos"
+    )
+    d["df_formados"] = motor.somar(
+        aux, ["formados_geral", "formados_min"], por=["ano", "curso_nome"])
+    return d
+
+
+# A evasão só usa campus, curso e anos dos filtros
+def evasao(base, filtros, anos):
+    campi, cursos = filtros["campus"], filtros["curso_nome"]
+    somas_evasao = base.somas_evasao
+    d = {}
+    # Aplica os mesmos filtros do dashboard principal
+    filtro_evasao = base.df_evasao
+    if campi:
+        filtro_evasao = filtro_evasao[filtro_evasao["campus"].isin(campi)]
+    if cursos:
+        # O curso em evasao_processos.csv não tem grau/turno/campus: usa a
+        # correspondência pré-calculada (campus, curso) -> curso_nome
+        pares = pares_evasao(base.mapa_evasao, cursos)
+        filtro_evasao = filtro_evasao[pd.MultiIndex.from_frame(
+            filtro_evasao[["campus", "curso"]]).isin(pares)]
+    filtro_evasao = filtro_evasao[(filtro_evasao["ano"] >= anos[0]) & (
+        filtro_evasao["ano"] <= anos[1])]
+    d["filtro_evasao"] = filtro_evasao
+
+    # Totais do intervalo a partir das somas acumuladas de cada (campus, curso)
+    grupos_evasao = somas_evasao.grupos
+    sel_grupos = np.ones(len(grupos_evasao), dtype=bool)
+    if campi:
+        sel_grupos &= grupos_evasao["campus"].isin(campi).to_numpy()
+    if cursos:
+        sel_grupos &= pd.MultiIndex.from_frame(
+            grupos_evasao[["campus", "curso"]]).isin(pares)
+    totais_evasao = somas_evasao.totais(
+        anos[0], anos[1], np.flatnonzero(sel_grupos))
+
+    d["evasao_total"] = cb.somar(totais_evasao, ["evasao_total"], por="curso")
+
+    perc_total = filtro_evasao.groupby("curso", observed=True)[
+        PERCENTUAIS_EVASAO].mean().reset_index()
+    # Fixar 2 casas decimais nas colunas de percentual
+    for col in PERCENTUAIS_EVASAO:
+        perc_total[col] = perc_total[col].round(2)
+    d["perc_total"] = perc_total
+
+    # Distribuição percentual de evasão por tipo em um curso específico
+    if not filtro_evasao.empty:
+        curso_sel = filtro_evasao["curso"].iloc[0]
+        df_curso = filtro_evasao[filtro_evasao["curso"] == curso_sel]
+        df_curso_long = df_curso.melt(
+            id_vars=["ano", "campus", "curso"],
+            value_vars=["perc_vest", "perc_sisu", "perc_provare"],
+            var_name="tipo_ingresso",
+            value_name="percentual"
+        )
+        dist_tipo = df_curso_long.groupby("tipo_ingresso", observed=True)[
+            "percentual"].mean().reset_index()
+        dist_tipo["percentual"] = dist_tipo["percentual"].round(2)
+        d["curso_sel"] = curso_sel
+        d["dist_tipo"] = dist_tipo
+
+    # Evolução de entradas vs evadidos por modalidade ao longo do tempo
+    evasao_ano = filtro_evasao.groupby("ano", observed=True)[
+        MEDIDAS_EVASAO[:-1]].sum().reset_index()
+    evasao_ano["vest_nao_evadidos"] = evasao_ano["entradas_vest"] - \
+        evasao_ano["evasao_vest"]
+    evasao_ano["sisu_nao_evadidos"] = evasao_ano["entradas_sisu"] - \
+        evasao_ano["evasao_sisu"]
+    evasao_ano["provare_nao_evadidos"] = evasao_ano["entradas_provare"] - \
+        evasao_ano["evasao_provare"]
+    df_long = pd.melt(
+        evasao_ano,
+        id_vars=["ano"],
+        value_vars=["vest_nao_evadidos", "evasao_vest",
+                    "sisu_nao_evadidos", "evasao_sisu",
+                    "provare_nao_evadidos", "evasao_provare"],
+        var_name="tipo",
+        value_name="quantidade"
+    )
+    df_long["modalidade"] = df_long["tipo"].apply(
+        lambda x: "Vestibular" if "vest" in x else ("SISU" if "sisu" in x else "Provare"))
+    df_long["status"] = df_long["tipo"].apply(
+        lambda x: "Não Evadidos" if "nao_evadidos" in x else "Evadidos")
+    d["df_long"] = df_long
+
+    # Tabela de totais de evasão por tipo de ingresso e total geral, e totais de entradas
+    soma_evasao = totais_evasao[somas_evasao.medidas].sum()
+    totais = {
+        "Vestibular": {
+            "Entradas": soma_evasao["entradas_vest"],
+            "Evasão": soma_evasao["evasao_vest"]
+        },
+        "SISU": {
+            "Entradas": soma_evasao["entradas_sisu"],
+            "Evasão": soma_evasao["evasao_sisu"]
+        },
+        "Provare": {
+            "Entradas": soma_evasao["entradas_provare"],
+            "Evasão": soma_evasao["evasao_provare"]
+        },
+        "Total Geral": {
+            "Entradas": soma_evasao[["entradas_vest", "entradas_sisu", "entradas_provare"]].sum(),
+            "Evasão": soma_evasao["evasao_total"]
+        }
+    }
+    df_totais = pd.DataFrame([
+        {"Tipo de Ingresso": k,
+            "Total de Entradas": v["Entradas"], "Total de Evasão": v["Evasão"]}
+        for k, v in totais.items()
+    ])
+    # Se quiser mostrar percentual de evasão sobre entradas:
+    taxa = pd.Series(metricas.taxa_evasao(
+        df_totais["Total de Evasão"], df_totais["Total de Entradas"]))
+    df_totais["% Evasão/Entradas"] = taxa.map(
+        lambda x: f"{x:.2f}%").where(taxa.notna(), "-")
+    d["df_totais"] = df_totais
+    return d
+
+
+ANALISES = {
+    "visao_geral": visao_geral,
+    "inscricoes": inscricoes,
+    "matriculados": matriculados,
+    "evasao": evasao,
+}
+
+
+def turmas(base):
+    return tm.construir_turmas(base.df)
+
+
+# ---------------------------------------
+# Artefatos pré-calculados
+# ---------------------------------------
+# Cada estado dos filtros calculado em lote fica numa pasta com um
+# <análise>.<nome>.parquet por tabela e um <análise>.json com os demais
+# valores (totais, médias, curso em destaque). O manifesto, trocado por
+# último e de uma vez, diz a versão dos dados e onde está cada estado.
+
+def chave_estado(filtros, anos):
+    # Seleções valem pelo conjunto; grau e turno não mudam a evasão, que
+    # é procurada com eles vazios
+    return json.dumps(
+        [sorted(map(str, filtros.get(col) or []))
+         for col in ("campus", "grau", "turno", "curso_nome")]
+        + [[int(anos[0]), int(anos[1])]])
+
+
+def _valor_json(valor):
+    if isinstance(valor, pd.Series):
+        return {"serie": {str(k): _valor_json(v) for k, v in valor.items()}}
+    if isinstance(valor, np.generic):
+        return valor.item()
+    return valor
+
+
+def _valor_lido(valor):
+    if isinstance(valor, dict) and "serie" in valor:
+        return pd.Series(valor["serie"])
+    return valor
+
+
+def gravar_analise(pasta, nome, d):
+    valores = {}
+    for chave, valor in d.items():
+        if isinstance(valor, pd.DataFrame):
+            valor.to_parquet(os.path.join(pasta, f"{nome}.{chave}.parquet"))
+        else:
+            valores[chave] = _valor_json(valor)
+    with open(os.path.join(pasta, f"{nome}.json"), "w",
+              encoding="utf-8") as f:
+        json.dump({"tabelas": [k for k, v in d.items()
+                               if isinstance(v, pd.DataFrame)],
+                   "valores": valores}, f, ensure_ascii=False)
+
+
+def ler_analise(pasta, nome):
+    with open(os.path.join(pasta, f"{nome}.json"), encoding="utf-8") as f:
+        conteudo = json.load(f)
+    d = {chave: _valor_lido(valor)
+         for chave, valor in conteudo["valores"].items()}
+    for chave in conteudo["tabelas"]:
+        d[chave] = pd.read_parquet(
+            os.path.join(pasta, f"{nome}.{chave}.parquet"))
+    return d
+
+
+class Artefatos:
+    def __init__(self, pasta, manifesto):
+        self.pasta = pasta
+        self.manifesto = manifesto
+        self.versao = manifesto["versao"]
+        self.versao_evasao = manifesto["versao_evasao"]
+        self.estados = {e["chave"]: e["pasta"] for e in manifesto["estados"]}
+
+    def ler(self, nome, filtros, anos):
+        # None quando o estado não foi calculado em lote (ou a geração já foi
+        # trocada por um lote mais novo)
+        pasta = self.estados.get(chave_estado(filtros, anos))
+        if pasta is None:
+            return None
+        try:
+            return ler_analise(os.path.join(self.pasta, pasta), nome)
+        except FileNotFoundError:
+            return None
+
+    def turmas(self):
+        try:
+            return pd.read_parquet(os.path.join(self.pasta, "turmas.parquet"))
+        except FileNotFoundError:
+            return None
+
+
+def caminho_manifesto(pasta=PASTA_RELATORIOS):
+    return os.path.join(pasta, MANIFESTO)
+
+
+def abrir_artefatos(versao, versao_evasao, pasta=PASTA_RELATORIOS):
+    # Artefatos da versão dos dados pedida, ou None (sem lote ou de outra
+    # versão)
+    try:
+        with open(caminho_manifesto(pasta), encoding="utf-8") as f:
+            manifesto = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if (manifesto.get("versao"), manifesto.get("versao_evasao")) != (
+            versao, versao_evasao):
+        return None
+    return Artefatos(os.path.join(pasta, manifesto["geracao"]), manifesto)
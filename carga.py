@@ -0,0 +1,394 @@
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+import pandas as pd
+import streamlit
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from tornado.websocket import websocket_connect
+
+from desempenho import LIMIAR_REGRESSAO, PASTA_RESULTADOS, commit_atual
+
+# ---------------------------------------
+# Carga de sessões simultâneas num processo do dashboard
+# ---------------------------------------
+# python carga.py [sessoes ...]                (padrão: 1 5 10 20)
+# python carga.py comparar antes.json depois.json
+#
+# Para cada número de sessões sobe um "streamlit run dashboard.py" sem
+# navegador, aquece os caches com uma sessão e conecta N sessões pelo
+# websocket, mandando as mesmas mensagens que o navegador manda. Cada sessão
+# faz PASSOS interações sorteadas (campi, graus, turnos, cursos, o intervalo
+# de anos, a aba aberta e os seletores da Turma), com uma pausa sorteada
+# entre elas, como um coordenador lendo a tela. Metade das sessões usa
+# "Calcular só a aba aberta": nelas trocar de aba e mudar a Turma reexecutam
+# só o fragmento, como no navegador; nas outras as abas são trocadas no
+# navegador, sem reexecução, e só a Turma reexecuta o seu fragmento.
+#
+# A latência de uma interação vai do envio da mensagem até o fim da
+# reexecução (script_finished). Saem p50/p95/p99 por número de sessões e
+# por interação, as reexecuções por segundo e a memória residente (RSS) do
+# servidor depois do aquecimento, no fim e no pico. O resultado vai para
+# PASTA_RESULTADOS/carga-<data>-<commit>.json; comparar aponta os números de
+# sessões em que o p95 ou o pico de RSS cresceram, ou a vazão caiu, além de
+# LIMIAR_REGRESSAO.
+
+SESSOES = [1, 5, 10, 20]
+PASSOS = 20
+PAUSA_MEDIA = 1.0
+FRACAO_SOB_DEMANDA = 0.5
+PESOS = {"campus": 2, "grau": 1, "turno": 1, "curso": 3, "anos": 3,
+         "aba": 3, "turma": 2}
+SCRIPT = "dashboard.py"
+ESPERA_SERVIDOR = 120
+ABA_TURMA = "🎯 Turma"
+
+# Tipo do widget no Element -> campo do valor no WidgetState
+CAMPOS_VALOR = {"multiselect": "string_array_value",
+                "slider": "double_array_value",
+                "selectbox": "string_value",
+                "radio": "int_value",
+                "checkbox": "bool_value"}
+
+
+# ---------------------------------------
+# Servidor
+# ---------------------------------------
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def iniciar_servidor(porta, log):
+    processo = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", SCRIPT,
+         "--server.headless=true", f"--server.port={porta}",
+         "--server.fileWatcherType=none", "--browser.gatherUsageStats=false"],
+        stdout=log, stderr=subprocess.STDOUT)
+    limite = time.monotonic() + ESPERA_SERVIDOR
+    while time.monotonic() < limite:
+        if processo.poll() is not None:
+            raise RuntimeError(f"O servidor saiu com código {processo.returncode}")
+        try:
+            with urllib.request.urlopen(
+                    f"http://localhost:{porta}/_stcore/health", timeout=1):
+                return processo
+        except OSError:
+            time.sleep(0.2)
+    processo.terminate()
+    raise RuntimeError(f"O servidor não respondeu em {ESPERA_SERVIDOR} s")
+
+
+def memoria_processo(pid):
+    # (RSS atual, pico de RSS) em bytes; só no Linux
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            campos = dict(linha.split(":", 1) for linha in f if ":" in linha)
+    except OSError:
+        return None, None
+    return (int(campos["VmRSS"].split()[0]) * 1024,
+            int(campos["VmHWM"].split()[0]) * 1024)
+
+
+# ---------------------------------------
+# Sessão simulada
+# ---------------------------------------
+
+class Sessao:
+    def __init__(self, url, rng, sob_demanda):
+        self.url = url
+        self.rng = rng
+        self.sob_demanda = sob_demanda
+        self.widgets = {}  # chave -> (tipo, proto, fragmento)
+        self.valores = {}  # id -> WidgetState enviado a cada reexecução
+        self.pagina = ""
+        self.aba = None
+        self.medidas = []
+
+    async def conectar(self):
+        self.conexao = await websocket_connect(
+            self.url, subprotocols=["streamlit"], max_message_size=2**30)
+
+    def fechar(self):
+        self.conexao.close()
+
+    async def reexecutar(self, interacao, fragmento=""):
+        msg = BackMsg()
+        estado = msg.rerun_script
+        estado.page_script_hash = self.pagina
+        estado.fragment_id = fragmento
+        estado.widget_states.widgets.extend(self.valores.values())
+        inicio = time.perf_counter()
+        await self.conexao.write_message(msg.SerializeToString(), binary=True)
+        vistos = set()
+        erro = False
+        while True:
+            dados = await self.conexao.read_message()
+            if dados is None:
+                raise ConnectionError("O servidor fechou o websocket")
+            fwd = ForwardMsg.FromString(dados)
+            tipo = fwd.WhichOneof("type")
+            if tipo == "new_session":
+                self.pagina = fwd.new_session.page_script_hash
+            elif (tipo == "delta"
+                  and fwd.delta.WhichOneof("type") == "new_element"):
+                elemento = fwd.delta.new_element
+                tipo_elemento = elemento.WhichOneof("type")
+                if tipo_elemento == "exception":
+                    erro = True
+                elif tipo_elemento in CAMPOS_VALOR:
+                    widget = getattr(elemento, tipo_elemento)
+                    # O id termina com a chave (key=) do widget
+                    chave = widget.id.split("-", 2)[-1]
+                    self.widgets[chave] = (tipo_elemento, widget,
+                                           fwd.delta.fragment_id)
+                    vistos.add(widget.id)
+            elif tipo == "script_finished":
+                break
+        duracao = time.perf_counter() - inicio
+        if not fragmento:
+            # Widgets que sumiram (ou mudaram de id com as opções) saem do
+            # estado, como no navegador
+            self.valores = {i: v for i, v in self.valores.items()
+                            if i in vistos}
+            self.widgets = {c: w for c, w in self.widgets.items()
+                            if w[1].id in vistos}
+        self.medidas.append({"interacao": interacao, "latencia_s": duracao,
+                             "fragmento": bool(fragmento), "erro": erro})
+
+    async def mudar(self, interacao, chave, valor):
+        tipo, widget, fragmento = self.widgets[chave]
+        estado = WidgetState(id=widget.id)
+        campo = CAMPOS_VALOR[tipo]
+        if campo.endswith("_array_value"):
+            getattr(estado, campo).data.extend(valor)
+        else:
+            setattr(estado, campo, valor)
+        self.valores[widget.id] = estado
+        await self.reexecutar(interacao, fragmento)
+
+    def _sortear(self, opcoes, maximo):
+        k = self.rng.randint(0, min(maximo, len(opcoes)))
+        return self.rng.sample(list(opcoes), k)
+
+    async def abrir(self):
+        await self.reexecutar("abrir")
+        if self.sob_demanda:
+            await self.mudar("modo", "abas_sob_demanda", True)
+            self.aba = self.widgets["aba_ativa"][1].options[0]
+
+    async def trocar_aba(self, nome=None):
+        opcoes = list(self.widgets["aba_ativa"][1].options)
+        if nome is None:
+            nome = self.rng.choice([o for o in opcoes if o != self.aba])
+        self.aba = nome
+        await self.mudar("aba", "aba_ativa", opcoes.index(nome))
+
+    async def passo(self):
+        interacoes = [i for i in PESOS if i != "aba" or self.sob_demanda]
+        interacao = self.rng.choices(
+            interacoes, [PESOS[i] for i in interacoes])[0]
+        if interacao in ("campus", "grau", "turno", "curso"):
+            chave = {"campus": "campi", "grau": "graus", "turno": "turnos",
+                     "curso": "cursos"}[interacao]
+            opcoes = self.widgets[chave][1].options
+            await self.mudar(interacao, chave, self._sortear(
+                opcoes, 1 if interacao in ("grau", "turno") else 2))
+        elif interacao == "anos":
+            # O slider só manda o valor ao soltar: um arrasto é uma
+            # reexecução
+            slider = self.widgets["anos"][1]
+            anos = sorted(self.rng.randint(int(slider.min), int(slider.max))
+                          for _ in range(2))
+            await self.mudar("anos", "anos", [float(a) for a in anos])
+        elif interacao == "aba":
+            await self.trocar_aba()
+        else:
+            if self.sob_demanda and self.aba != ABA_TURMA:
+                await self.trocar_aba(ABA_TURMA)
+            chave = self.rng.choice(["turma_curso", "turma_ano"])
+            if chave not in self.widgets:
+                chave = "turma_curso"
+            opcoes = self.widgets[chave][1].options
+            await self.mudar(f"turma:{chave.split('_')[1]}", chave,
+                             self.rng.choice(opcoes))
+
+    async def percorrer(self, passos, pausa_media):
+        await self.conectar()
+        try:
+            await asyncio.sleep(self.rng.uniform(0, pausa_media))
+            await self.abrir()
+            for _ in range(passos):
+                await asyncio.sleep(self.rng.expovariate(1 / pausa_media)
+                                    if pausa_media else 0)
+                await self.passo()
+        finally:
+            self.fechar()
+
+
+# ---------------------------------------
+# Medição
+# ---------------------------------------
+
+async def _rodar_sessoes(url, n, passos, pausa_media, semente):
+    # As sessões "sob demanda" ficam espalhadas entre as outras
+    sessoes = [Sessao(url, random.Random(semente * 1000 + i),
+                      int((i + 1) * FRACAO_SOB_DEMANDA)
+                      > int(i * FRACAO_SOB_DEMANDA))
+               for i in range(n)]
+    inicio = time.perf_counter()
+    resultados = await asyncio.gather(
+        *(s.percorrer(passos, pausa_media) for s in sessoes),
+        return_exceptions=True)
+    duracao = time.perf_counter() - inicio
+    falhas = [r for r in resultados if isinstance(r, BaseException)]
+    medidas = [{**m, "sessao": i, "sob_demanda": s.sob_demanda}
+               for i, s in enumerate(sessoes) for m in s.medidas]
+    return medidas, duracao, falhas
+
+
+def medir_sessoes(n, passos=PASSOS, pausa_media=PAUSA_MEDIA, semente=0,
+                  progresso=None):
+    porta = _porta_livre()
+    url = f"ws://localhost:{porta}/_stcore/stream"
+    os.makedirs(PASTA_RESULTADOS, exist_ok=True)
+    with open(os.path.join(PASTA_RESULTADOS, "carga-servidor.log"), "a",
+              encoding="utf-8") as log:
+        servidor = iniciar_servidor(porta, log)
+        try:
+            if progresso is not None:
+                progresso(f"{n} sessões: aquecendo")
+            inicio = time.perf_counter()
+            asyncio.run(_rodar_sessoes(url, 1, 0, 0, semente))
+            aquecimento_s = time.perf_counter() - inicio
+            rss_inicial, _ = memoria_processo(servidor.pid)
+            if progresso is not None:
+                progresso(f"{n} sessões: medindo")
+            medidas, duracao, falhas = asyncio.run(
+                _rodar_sessoes(url, n, passos, pausa_media, semente + 1))
+            rss_final, rss_pico = memoria_processo(servidor.pid)
+        finally:
+            servidor.terminate()
+            servidor.wait()
+    return {"sessoes": n, "duracao_s": duracao, "aquecimento_s": aquecimento_s,
+            "rss_inicial_bytes": rss_inicial, "rss_final_bytes": rss_final,
+            "rss_pico_bytes": rss_pico,
+            "falhas": [repr(f) for f in falhas], "medidas": medidas}
+
+
+def executar(sessoes=SESSOES, passos=PASSOS, pausa_media=PAUSA_MEDIA,
+             progresso=None):
+    niveis = [medir_sessoes(n, passos, pausa_media, progresso=progresso)
+              for n in sessoes]
+    return {
+        "meta": {
+            "commit": commit_atual(),
+            "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "streamlit": streamlit.__version__,
+            "maquina": platform.machine(),
+            "cpus": os.cpu_count(),
+            "passos": passos,
+            "pausa_media_s": pausa_media,
+            "fracao_sob_demanda": FRACAO_SOB_DEMANDA,
+        },
+        "niveis": niveis,
+    }
+
+
+def gravar(relatorio, pasta=PASTA_RESULTADOS):
+    os.makedirs(pasta, exist_ok=True)
+    meta = relatorio["meta"]
+    caminho = os.path.join(
+        pasta, f"carga-{meta['data'].replace(':', '')}-{meta['commit']}.json")
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, indent=1, ensure_ascii=False)
+    return caminho
+
+
+def _percentis(latencias):
+    ms = np.asarray(latencias) * 1000
+    return {"p50_ms": np.percentile(ms, 50), "p95_ms": np.percentile(ms, 95),
+            "p99_ms": np.percentile(ms, 99)}
+
+
+def tabela(relatorio):
+    linhas = []
+    for nivel in relatorio["niveis"]:
+        # A abertura de cada sessão (script inteiro, sessão nova) conta na
+        # vazão, mas fica fora dos percentis das interações
+        medidas = [m for m in nivel["medidas"]
+                   if m["interacao"] not in ("abrir", "modo")]
+        linhas.append({
+            "sessoes": nivel["sessoes"],
+            "reexecucoes": len(nivel["medidas"]),
+            "erros": sum(m["erro"] for m in nivel["medidas"])
+                     + len(nivel["falhas"]),
+            **_percentis([m["latencia_s"] for m in medidas]),
+            "vazao_por_s": len(nivel["medidas"]) / nivel["duracao_s"],
+            **{campo.replace("_bytes", "_mb"): (
+                None if nivel[campo] is None else nivel[campo] / 2**20)
+               for campo in ("rss_inicial_bytes", "rss_final_bytes",
+                             "rss_pico_bytes")},
+        })
+    return pd.DataFrame(linhas)
+
+
+def tabela_interacoes(relatorio):
+    df = pd.DataFrame([{**m, "sessoes": nivel["sessoes"]}
+                       for nivel in relatorio["niveis"]
+                       for m in nivel["medidas"]])
+    return (df.groupby(["sessoes", "interacao"])["latencia_s"]
+            .apply(lambda s: pd.Series({"n": len(s), **_percentis(s)}))
+            .unstack())
+
+
+def comparar(antes, depois, limiar=LIMIAR_REGRESSAO):
+    juntos = tabela(antes).merge(tabela(depois), on="sessoes",
+                                 suffixes=("_antes", "_depois"))
+    juntos["razao_p95"] = juntos["p95_ms_depois"] / juntos["p95_ms_antes"]
+    juntos["razao_vazao"] = (juntos["vazao_por_s_depois"]
+                             / juntos["vazao_por_s_antes"])
+    juntos["razao_rss"] = (juntos["rss_pico_mb_depois"]
+                           / juntos["rss_pico_mb_antes"])
+    juntos["regressao"] = ((juntos["razao_p95"] > limiar)
+                           | (juntos["razao_vazao"] < 1 / limiar)
+                           | (juntos["razao_rss"] > limiar)
+                           | (juntos["erros_depois"] > 0))
+    return juntos[["sessoes", "p95_ms_antes", "p95_ms_depois", "razao_p95",
+                   "vazao_por_s_antes", "vazao_por_s_depois", "razao_vazao",
+                   "rss_pico_mb_antes", "rss_pico_mb_depois", "razao_rss",
+                   "erros_depois", "regressao"]]
+
+
+if __name__ == "__main__":
+    pd.set_option("display.width", 200)
+    if sys.argv[1:2] == ["comparar"]:
+        with open(sys.argv[2], encoding="utf-8") as f:
+            antes = json.load(f)
+        with open(sys.argv[3], encoding="utf-8") as f:
+            depois = json.load(f)
+        resultado = comparar(antes, depois)
+        print(f"{antes['meta']['commit']} -> {depois['meta']['commit']}")
+        print(resultado.round(2).to_string(index=False))
+        sys.exit(1 if resultado["regressao"].any() else 0)
+
+    sessoes = [int(n) for n in sys.argv[1:]] or SESSOES
+    relatorio = executar(sessoes, progresso=lambda texto:
+                         print(f"  {texto}", flush=True))
+    print(tabela(relatorio).round(1).to_string(index=False))
+    print()
+    print(tabela_interacoes(relatorio).round(1).to_string())
+    print(f"Resultados em {gravar(relatorio)}")
@@ -0,0 +1,250 @@
+import numpy as np
+import pandas as pd
+
+import metricas
+from dados import SERIES_COLS
+
+# ---------------------------------------
+# Cubo de agregação pré-calculado
+# ---------------------------------------
+# Uma linha por (ano, campus, grau, turno, curso_nome) com as medidas
+# aditivas já somadas. A média de Permanência (só valores > 0) é guardada
+# como soma + contagem, para poder ser reagregada em qualquer nível. Os
+# gráficos das abas reagregam o cubo filtrado em vez de varrer as linhas.
+
+DIMENSOES = ["ano", "campus", "grau", "turno", "curso_nome"]
+
+MEDIDAS = [
+    "incritos_vest", "incritos_sisu", "incritos_provare",
+    "ingressantes_vest", "ingressantes_provare", "ingressantes_sisu",
+    "ingressantes_geral", "formados_geral", "formados_min", "vagas",
+] + SERIES_COLS
+
+
+def construir_cubo(df):
+    base = df[DIMENSOES + MEDIDAS].copy()
+    valido = df["Permanencia"] > 0
+    base["perm_soma"] = df["Permanencia"].where(valido, 0.0)
+    base["perm_n"] = valido.astype(np.int64)
+    base["linhas"] = 1
+    cubo = base.groupby(DIMENSOES, dropna=False, sort=True,
+                        as_index=False, observed=True).sum()
+    cubo["vagas_vest"] = vagas_vestibular(cubo)
+    return cubo
+
+
+def combinar_cubos(*cubos):
+    # Junta cubos de partes disjuntas das linhas (blocos da ingestão): as
+    # medidas e perm_soma/perm_n/linhas são aditivas
+    base = pd.concat([c.drop(columns="vagas_vest") for c in cubos],
+                     ignore_index=True)
+    cubo = base.groupby(DIMENSOES, dropna=False, sort=True,
+                        as_index=False, observed=True).sum()
+    cubo["vagas_vest"] = vagas_vestibular(cubo)
+    return cubo
+
+
+def somar(cubo, medidas, por=None):
+    if por is None:
+        return cubo[medidas].sum()
+    return cubo.groupby(por, as_index=False, observed=True)[medidas].sum()
+
+
+def media_permanencia(cubo, por=None):
+    validos = cubo[cubo["perm_n"] > 0]
+    if por is None:
+        n = validos["perm_n"].sum()
+        return validos["perm_soma"].sum() / n if n else np.nan
+    media = validos.groupby(por, as_index=False, observed=True)[
+        ["perm_soma", "perm_n"]].sum()
+    media["Permanencia"] = media["perm_soma"] / media["perm_n"]
+    return media.drop(columns=["perm_soma", "perm_n"])
+
+
+def agregar(cubo, por, agregacoes):
+    # agregacoes: {coluna: função} (sum, min, max, ...)
+    return cubo.groupby(por, as_index=False, observed=True).agg(agregacoes)
+
+
+def filtrar_valores(cubo, coluna, valores):
+    return cubo[cubo[coluna].isin(valores)]
+
+
+# Vagas do vestibular pela regra de 2014 (o cubo tem o ano na granularidade,
+# então a regra vale célula a célula)
+def vagas_vestibular(cubo):
+    return pd.Series(metricas.vagas_vestibular(cubo["vagas"], cubo["ano"]),
+                     index=cubo.index)
+
+
+# ---------------------------------------
+# Somas acumuladas por ano
+# ---------------------------------------
+# Para cada grupo (por exemplo, um curso em um campus) guarda a soma
+# acumulada das medidas ano a ano. O total de um intervalo [inicio, fim] é a
+# diferença de duas linhas do acumulado, independente de quantos anos há no
+# histórico. A coluna de contagem (linhas) indica se o grupo tem dados no
+# intervalo, para reproduzir o groupby sobre as linhas filtradas.
+
+class SomasPorAno:
+    def __init__(self, df, chaves, medidas, coluna_ano="ano",
+                 contagem="linhas"):
+        dados = df[df[coluna_ano].notna()]
+        self.chaves = list(chaves)
+        self.medidas = list(medidas) + [contagem]
+        self.contagem = contagem
+        self.anos = np.sort(dados[coluna_ano].unique().astype(np.int64))
+
+        por_grupo = dados.groupby(self.chaves, dropna=False, sort=True,
+                                  observed=True)
+        self.grupos = por_grupo.size().reset_index()[self.chaves]
+        ids = por_grupo.ngroup().to_numpy()
+        i_ano = np.searchsorted(self.anos,
+                                dados[coluna_ano].to_numpy(dtype=np.int64))
+
+        # Medidas inteiras sem nulos acumulam em int64; o resto em float
+        medidas = dados[self.medidas]
+        if (all(pd.api.types.is_integer_dtype(t) for t in medidas.dtypes)
+                and not medidas.isna().to_numpy().any()):
+            valores = medidas.to_numpy(dtype=np.int64)
+        else:
+            valores = np.nan_to_num(
+                medidas.to_numpy(dtype=float, na_value=np.nan))
+        # Linha 0 zerada: acumulado[:, k] é a soma dos anos anteriores a k
+        tabela = np.zeros(
+            (len(self.grupos), len(self.anos) + 1, len(self.medidas)),
+            dtype=valores.dtype)
+        np.add.at(tabela, (ids, i_ano + 1), valores)
+        self.acumulado = tabela.cumsum(axis=1)
+
+    def totais(self, inicio, fim, grupos=None):
+        # Totais de cada grupo no intervalo; grupos são posições em
+        # self.grupos (None = todos). Grupos sem linhas no intervalo saem.
+        ini = np.searchsorted(self.anos, inicio, side="left")
+        fim = np.searchsorted(self.anos, fim, side="right")
+        if grupos is None:
+            grupos = np.arange(len(self.grupos))
+        acumulado = self.acumulado[grupos]
+        soma = acumulado[:, fim] - acumulado[:, ini]
+        out = self.grupos.iloc[grupos].reset_index(drop=True)
+        out[self.medidas] = soma
+        return out[out[self.contagem] > 0].reset_index(drop=True)
+
+
+# ---------------------------------------
+# Conferência de paridade: python cubo.py
+# ---------------------------------------
+# Compara, para seleções aleatórias dos filtros, os dados de entrada de cada
+# gráfico calculados pelo cubo e pelas somas acumuladas com o cálculo direto
+# do pandas sobre as linhas.
+
+def _conferir(nome, esperado, obtido):
+    # Medidas inteiras comparam exatamente; só as médias de Permanência e as
+    # somas de colunas float ficam com a tolerância padrão
+    if isinstance(esperado, pd.DataFrame):
+        esperado = esperado.reset_index(drop=True)
+        obtido = obtido.reset_index(drop=True)
+        pd.testing.assert_index_equal(esperado.columns, obtido.columns,
+                                      obj=nome)
+        for col in esperado.columns:
+            _conferir(f"{nome}[{col}]", esperado[col], obtido[col])
+    elif isinstance(esperado, pd.Series):
+        pd.testing.assert_series_equal(
+            esperado, obtido, check_dtype=False,
+            check_exact=pd.api.types.is_integer_dtype(esperado.dtype),
+            obj=nome)
+    elif pd.api.types.is_integer(esperado):
+        if esperado != obtido:
+            raise AssertionError(f"{nome}: {esperado} != {obtido}")
+    elif not np.isclose(esperado, obtido, equal_nan=True):
+        raise AssertionError(f"{nome}: {esperado} != {obtido}")
+
+
+def conferir_paridade(df, rodadas=200, semente=0):
+    from filtros import IndiceFiltros
+
+    rng = np.random.default_rng(semente)
+    cubo = construir_cubo(df)
+    indice_df, indice_cubo = IndiceFiltros(df), IndiceFiltros(cubo)
+    somas = SomasPorAno(cubo, ["campus", "grau", "turno", "curso_nome"],
+                        MEDIDAS + ["vagas_vest"])
+    indice_grupos = IndiceFiltros(somas.grupos, colunas=somas.chaves)
+    anos_validos = indice_df.opcoes("ano")
+    insc = ["incritos_vest", "incritos_sisu", "incritos_provare"]
+    tipos = ["ingressantes_vest", "ingressantes_sisu", "ingressantes_provare"]
+
+    for _ in range(rodadas):
+        filtros = {}
+        for col in ["campus", "grau", "turno", "curso_nome"]:
+            opcoes = indice_df.opcoes(col)
+            k = int(rng.integers(0, min(3, len(opcoes)) + 1))
+            filtros[col] = list(rng.choice(opcoes, k, replace=False))
+        anos = tuple(sorted(rng.choice(anos_validos, 2)))
+        df_f = df.take(indice_df.selecionar(filtros, {"ano": anos}))
+        c_f = cubo.take(indice_cubo.selecionar(filtros, {"ano": anos}))
+        t_f = somas.totais(anos[0], anos[1], indice_grupos.selecionar(filtros))
+        cursos = filtros["curso_nome"]
+
+        _conferir("ingressantes", df_f["ingressantes_geral"].sum(),
+                  somar(t_f, ["ingressantes_geral"])["ingressantes_geral"])
+        _conferir("formados", df_f["formados_geral"].sum(),
+                  somar(t_f, ["formados_geral"])["formados_geral"])
+        _conferir("permanencia_media",
+                  df_f.loc[df_f["Permanencia"] > 0, "Permanencia"].mean(),
+                  media_permanencia(c_f))
+        cols = ["ingressantes_geral", "formados_geral"]
+        _conferir("fig",
+                  df_f.groupby("ano", as_index=False, observed=True)[
+                      cols].sum(),
+                  somar(c_f, cols, "ano"))
+        _conferir("fig_vagas",
+                  df_f.groupby("ano", as_index=False, observed=True)[
+                      "vagas"].sum(),
+                  somar(c_f, ["vagas"], "ano"))
+        for por in ["ano", "curso_nome"]:
+            _conferir(f"permanencia_{por}",
+                      df_f[df_f["Permanencia"] > 0]
+                      .groupby(por, as_index=False, observed=True)[
+                          "Permanencia"].mean(),
+                      media_permanencia(c_f, por))
+        _conferir("fig3", df_f[tipos].sum(), somar(c_f, tipos))
+        _conferir("fig4",
+                  df_f.groupby("ano", as_index=False, observed=True)[
+                      insc].sum(),
+                  somar(c_f, insc, "ano"))
+        _conferir("fig5", df_f[insc].sum(), somar(c_f, insc))
+        _conferir("fig7",
+                  df_f.groupby("curso_nome", as_index=False, observed=True)[
+                      "incritos_vest"].sum(),
+                  somar(t_f, ["incritos_vest"], "curso_nome"))
+        _conferir("fig8",
+                  df_f.groupby("curso_nome", as_index=False,
+                               observed=True).agg(
+                      {"incritos_vest": "sum", "vagas": "sum", "ano": "min"}),
+                  c_f.groupby("curso_nome", as_index=False, observed=True).agg(
+                      {"incritos_vest": "sum", "vagas": "sum", "ano": "min"}))
+        vagas_vest = df_f.apply(
+            lambda row: row["vagas"] if row["ano"] < 2014
+            else row["vagas"] * 0.5, axis=1) if len(df_f) else 0.0
+        _conferir("fig_vest",
+                  df_f.assign(vagas_vest=vagas_vest).groupby(
+                      "curso_nome", as_index=False, observed=True)[
+                      ["incritos_vest", "vagas_vest"]].sum(),
+                  somar(t_f, ["incritos_vest", "vagas_vest"], "curso_nome"))
+        aux, c_aux = (df_f[df_f["curso_nome"].isin(cursos)],
+                      c_f[c_f["curso_nome"].isin(cursos)])
+        for nome, cols in [("fig_series_all", SERIES_COLS),
+                           ("fig_formados", ["formados_geral",
+                                             "formados_min"])]:
+            _conferir(nome,
+                      aux.groupby(["ano", "curso_nome"], as_index=False,
+                                  observed=True)[
+                          cols].sum(),
+                      somar(c_aux, cols, ["ano", "curso_nome"]))
+
+
+if __name__ == "__main__":
+    from dados import preparar_saida
+
+    conferir_paridade(preparar_saida())
+    print("Cubo confere com o cálculo direto em todos os gráficos.")
@@ -0,0 +1,261 @@
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# ---------------------------------------
+# Backend Arrow das agregações do cubo
+# ---------------------------------------
+# Mesmas operações de cubo.py (somar, media_permanencia, agregar,
+# filtrar_valores), mas o cubo filtrado é uma pa.Table: os filtros laterais
+# viram máscaras de pyarrow.compute e os agrupamentos usam Table.group_by.
+# O resultado volta em pandas com as mesmas linhas, colunas e ordem do
+# caminho pandas, que continua sendo a referência (conferência abaixo).
+
+
+class CuboArrow:
+    def __init__(self, cubo):
+        # Categorias viram strings: o Arrow não ordena colunas dictionary
+        tabela = pa.Table.from_pandas(cubo, preserve_index=False)
+        self.tabela = pa.table({
+            nome: (col.cast(col.type.value_type)
+                   if pa.types.is_dictionary(col.type) else col)
+            for nome, col in zip(tabela.column_names, tabela.columns)
+        })
+
+    def recortar(self, filtros=None, intervalos=None):
+        # Mesma semântica de IndiceFiltros.selecionar: seleção vazia não
+        # filtra; intervalos são fechados nas duas pontas
+        mascara = None
+        condicoes = [
+            _contido(self.tabela[col], sel)
+            for col, sel in (filtros or {}).items() if sel
+        ]
+        condicoes += [
+            pc.and_(pc.greater_equal(self.tabela[col], ini),
+                    pc.less_equal(self.tabela[col], fim))
+            for col, (ini, fim) in (intervalos or {}).items()
+        ]
+        for condicao in condicoes:
+            mascara = (condicao if mascara is None
+                       else pc.and_(mascara, condicao))
+        if mascara is None:
+            return self.tabela
+        return self.tabela.filter(mascara)
+
+
+def _contido(coluna, valores):
+    return pc.is_in(coluna,
+                    value_set=pa.array(list(valores), type=coluna.type))
+
+
+def _agrupar(tabela, por, agregacoes):
+    # Como o groupby do pandas (dropna=True, sort=True): grupos com chave
+    # nula saem e as linhas vêm ordenadas pelas chaves. Somas de float não
+    # usam o hash_sum do Arrow (sem compensação, difere do pandas nos
+    # últimos bits e, arredondada, em rótulos dos gráficos): vão para o
+    # group_sum do pandas, na mesma ordem das linhas.
+    por = [por] if isinstance(por, str) else list(por)
+    for col in por:
+        if tabela[col].null_count:
+            tabela = tabela.filter(pc.is_valid(tabela[col]))
+    floats = [col for col, func in agregacoes.items()
+              if func == "sum" and pa.types.is_floating(tabela[col].type)]
+    resultado = tabela.group_by(por, use_threads=False).aggregate(
+        [(col, func) for col, func in agregacoes.items()
+         if col not in floats])
+    resultado = resultado.sort_by([(col, "ascending") for col in por])
+    somas = _somas_float(tabela, por, floats) if floats else None
+    out = resultado.select(por).to_pandas()
+    for col, func in agregacoes.items():
+        out[col] = (somas[col].to_numpy() if col in floats
+                    else resultado[f"{col}_{func}"].to_pandas())
+    return out
+
+
+def _somas_float(tabela, por, colunas):
+    # Código de cada linha na ordem das chaves (posto denso de cada chave
+    # combinado), então os grupos saem na mesma ordem do sort_by acima
+    codigo = np.zeros(tabela.num_rows, dtype=np.int64)
+    for col in por:
+        posto = pc.rank(tabela[col], sort_keys="ascending",
+                        tiebreaker="dense").to_numpy().astype(np.int64)
+        codigo = codigo * (int(posto.max()) if len(posto) else 1) + posto - 1
+    valores = pd.DataFrame({col: tabela[col].to_numpy() for col in colunas})
+    return valores.groupby(codigo, sort=True).sum()
+
+
+def _total(coluna):
+    # Total sem agrupar; nulos (e a coluna vazia) somam 0, como no pandas.
+    # Float soma como o Series.sum do pandas (soma do numpy sobre o array
+    # com os nulos zerados)
+    if pa.types.is_floating(coluna.type):
+        valores = coluna.to_numpy()
+        return np.where(np.isnan(valores), 0.0, valores).sum()
+    return pc.sum(coluna, min_count=0).as_py()
+
+
+def somar(tabela, medidas, por=None):
+    if por is None:
+        return pd.Series({col: _total(tabela[col]) for col in medidas})
+    return _agrupar(tabela, por, {col: "sum" for col in medidas})
+
+
+def media_permanencia(tabela, por=None):
+    validos = tabela.filter(pc.greater(tabela["perm_n"], 0))
+    if por is None:
+        n = _total(validos["perm_n"])
+        return _total(validos["perm_soma"]) / n if n else np.nan
+    media = _agrupar(validos, por, {"perm_soma": "sum", "perm_n": "sum"})
+    media["Permanencia"] = media["perm_soma"] / media["perm_n"]
+    return media.drop(columns=["perm_soma", "perm_n"])
+
+
+def agregar(tabela, por, agregacoes):
+    return _agrupar(tabela, por, agregacoes)
+
+
+def filtrar_valores(tabela, coluna, valores):
+    return tabela.filter(_contido(tabela[coluna], valores))
+
+
+# ---------------------------------------
+# Conferência e comparação: python cubo_arrow.py
+# ---------------------------------------
+# Confere, para seleções aleatórias dos filtros, que cada agregação do
+# backend Arrow devolve exatamente os mesmos valores do caminho pandas;
+# depois mede os
+# dois backends com o cubo replicado (cada cópia com campi renomeados, como
+# se fossem outras universidades do sistema estadual).
+
+FATORES = [1, 10, 100]
+
+
+def _operacoes(motor, recorte, cursos):
+    insc = ["incritos_vest", "incritos_sisu", "incritos_provare"]
+    return {
+        "somar_ano": motor.somar(recorte, ["ingressantes_geral",
+                                           "formados_geral"], por="ano"),
+        "somar_total": motor.somar(recorte, insc),
+        "permanencia": motor.media_permanencia(recorte),
+        "permanencia_ano": motor.media_permanencia(recorte, por="ano"),
+        "permanencia_curso": motor.media_permanencia(recorte,
+                                                     por="curso_nome"),
+        "insc_ano": motor.somar(recorte, insc, por="ano"),
+        "rel_vest_vagas": motor.agregar(
+            recorte, "curso_nome",
+            {"incritos_vest": "sum", "vagas": "sum", "ano": "min"}),
+        "series": motor.somar(
+            motor.filtrar_valores(recorte, "curso_nome", cursos),
+            ["primeiro_ano", "segundo_ano"], por=["ano", "curso_nome"]),
+    }
+
+
+def _selecoes(indice, rodadas, semente):
+    rng = np.random.default_rng(semente)
+    anos_validos = indice.opcoes("ano")
+    for _ in range(rodadas):
+        filtros = {}
+        for col in ["campus", "grau", "turno", "curso_nome"]:
+            opcoes = indice.opcoes(col)
+            k = int(rng.integers(0, min(3, len(opcoes)) + 1))
+            filtros[col] = list(rng.choice(opcoes, k, replace=False))
+        anos = sorted(rng.choice(anos_validos, 2))
+        yield filtros, (int(anos[0]), int(anos[1]))
+
+
+def conferir_paridade(cubo, rodadas=200, semente=0):
+    import cubo as cb
+    from filtros import IndiceFiltros
+
+    indice = IndiceFiltros(cubo)
+    cubo_arrow = CuboArrow(cubo)
+    for filtros, anos in _selecoes(indice, rodadas, semente):
+        esperado = _operacoes(
+            cb, cubo.take(indice.selecionar(filtros, {"ano": anos})),
+            filtros["curso_nome"])
+        obtido = _operacoes(
+            sys.modules[__name__], cubo_arrow.recortar(filtros, {"ano": anos}),
+            filtros["curso_nome"])
+        for nome in esperado:
+            _conferir_exato(nome, esperado[nome], obtido[nome])
+
+
+def _conferir_exato(nome, esperado, obtido):
+    # Mesmos valores, bit a bit; categorias do pandas e strings do Arrow
+    # comparam pelo texto
+    if isinstance(esperado, pd.DataFrame):
+        esperado = esperado.reset_index(drop=True)
+        for col in esperado.columns:
+            if isinstance(esperado[col].dtype, pd.CategoricalDtype):
+                esperado[col] = esperado[col].astype(str)
+        pd.testing.assert_frame_equal(esperado, obtido, check_dtype=False,
+                                      check_exact=True, obj=nome)
+    elif isinstance(esperado, pd.Series):
+        pd.testing.assert_series_equal(esperado, obtido, check_dtype=False,
+                                       check_exact=True, obj=nome)
+    elif not (esperado == obtido or np.isnan(esperado) and np.isnan(obtido)):
+        raise AssertionError(f"{nome}: {esperado} != {obtido}")
+
+
+def replicar(cubo, fator):
+    copias = []
+    for i in range(fator):
+        copia = cubo.copy()
+        copia["campus"] = copia["campus"].astype(str) + f" #{i}"
+        copia["curso_nome"] = copia["curso_nome"].astype(str) + f" #{i}"
+        copias.append(copia)
+    grande = pd.concat(copias, ignore_index=True)
+    for col in ["campus", "curso_nome"]:
+        grande[col] = grande[col].astype("category")
+    return grande
+
+
+def comparar_backends(cubo, fatores=FATORES, rodadas=20, semente=0):
+    import cubo as cb
+    from filtros import IndiceFiltros
+
+    linhas = []
+    for fator in fatores:
+        grande = replicar(cubo, fator)
+        indice = IndiceFiltros(grande)
+        cubo_arrow = CuboArrow(grande)
+        selecoes = list(_selecoes(indice, rodadas, semente))
+        tempos = {}
+        for nome, recortar, motor in [
+            ("pandas", lambda f, a: grande.take(
+                indice.selecionar(f, {"ano": a})), cb),
+            ("arrow", lambda f, a: cubo_arrow.recortar(f, {"ano": a}),
+             sys.modules[__name__]),
+        ]:
+            inicio = time.perf_counter()
+            recortes = [recortar(f, a) for f, a in selecoes]
+            meio = time.perf_counter()
+            for (f, _), recorte in zip(selecoes, recortes):
+                _operacoes(motor, recorte, f["curso_nome"])
+            fim = time.perf_counter()
+            tempos[nome] = ((meio - inicio) / rodadas * 1000,
+                            (fim - meio) / rodadas * 1000)
+        linhas.append({
+            "fator": fator, "linhas_cubo": len(grande),
+            "filtro_pandas_ms": tempos["pandas"][0],
+            "filtro_arrow_ms": tempos["arrow"][0],
+            "agregacoes_pandas_ms": tempos["pandas"][1],
+            "agregacoes_arrow_ms": tempos["arrow"][1],
+        })
+    return pd.DataFrame(linhas)
+
+
+if __name__ == "__main__":
+    from cubo import construir_cubo
+    from dados import preparar_saida
+
+    cubo = construir_cubo(preparar_saida())
+    conferir_paridade(cubo)
+    print("Backend Arrow confere com o caminho pandas em todas as "
+          "agregações.")
+    pd.set_option("display.width", 200)
+    print(comparar_backends(cubo).round(2).to_string(index=False))
@@ -0,0 +1,902 @@
+import contextlib
+import copy
+import fcntl
+import functools
+import hashlib
+import inspect
+import json
+import os
+import re
+import threading
+import unicodedata
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import metricas
+
+# ---------------------------------------
+# Versão do código de preparação dos dados.
+# Incrementar sempre que preparar_saida/preparar_evasao mudarem o resultado,
+# assim os snapshots gravados por versões anteriores são descartados.
+# ---------------------------------------
+VERSAO_PREPARO = 5
+
+_CHAVE_META = b"dados_daa"
+
+SERIES_COLS = ["primeiro_ano", "segundo_ano",
+               "terceiro_ano", "quarto_ano", "quinto_ano", "sexto_ano"]
+
+
+# ---------------------------------------
+# 1) Preparação dos dados a partir dos CSVs
+# ---------------------------------------
+
+# Extrai só o nome do curso
+def extrair_nome_curso(texto):
+    if pd.isna(texto):
+        return ""
+    if "Letras" in texto:
+        m = re.search(r"(Letras\s*-\s*[^=\-]+)", texto)
+        if m:
+            return m.group(1).strip()
+        return "Letras"
+    m = re.search(r"Curso: ([^=\-]+)", texto)
+    if m:
+        return m.group(1).strip()
+    texto = re.sub(r"Curso: ", "", texto)
+    texto = texto.split('=')[0].split('-')[0].strip()
+    return texto
+
+
+# Extrai grau e turno, que entram no nome do curso
+def extrair_grau(texto):
+    if pd.isna(texto):
+        return ""
+    m = re.search(r"(Bacharelado|Licenciatura|Tecnológico)",
+                  texto, re.IGNORECASE)
+    if m:
+        return m.group(1).capitalize()
+    return ""
+
+
+def extrair_turno(texto):
+    if pd.isna(texto):
+        return ""
+    m = re.search(r"(Matutino|Noturno|Vespertino|Integral)",
+                  texto, re.IGNORECASE)
+    if m:
+        return m.group(1).capitalize()
+    return ""
+
+
+# Sempre inclui grau e turno no nome do curso (o campus entra depois)
+def nome_curso_sem_campus(nome, grau, turno):
+    partes = [nome]
+    if grau:
+        partes.append(grau)
+    if turno:
+        partes.append(turno)
+    return " - ".join(partes)
+
+
+# A coluna "curso" tem poucas dezenas de descritores distintos repetidos ano
+# a ano; as regex rodam uma vez por descritor e o resultado é espalhado para
+# as linhas pelos códigos do factorize.
+def tabela_descritores(cursos):
+    descritores = []
+    for texto in cursos:
+        nome = extrair_nome_curso(texto)
+        grau = extrair_grau(texto)
+        turno = extrair_turno(texto)
+        descritores.append(
+            (nome, grau, turno, nome_curso_sem_campus(nome, grau, turno)))
+    return pd.DataFrame(
+        descritores,
+        columns=["curso_nome_base", "grau", "turno", "nome_sem_campus"])
+
+
+def descrever_cursos(df):
+    codigos, unicos = pd.factorize(df["curso"])
+    # O código -1 (curso vazio) aponta para a última linha, a de NaN
+    tabela = tabela_descritores(list(unicos) + [None])
+    linhas = tabela.take(codigos)
+    linhas.index = df.index
+    out = linhas[["curso_nome_base", "grau", "turno"]].copy()
+    out["curso_nome"] = (linhas["nome_sem_campus"] + " ("
+                         + df["campus"].astype(str) + ")")
+    return out
+
+
+# Permanencia = soma das séries / (séries válidas * vagas), como na planilha.
+# Séries válidas são as não nulas e diferentes de zero; -1 marca as linhas
+# sem séries válidas ou sem vagas.
+def derivar_permanencia(df):
+    series = df[SERIES_COLS].to_numpy(dtype=float)
+    df["soma_series"] = df[SERIES_COLS].sum(axis=1, skipna=True)
+    df["qtd_validos"] = ((series != 0) & ~np.isnan(series)).sum(axis=1)
+    df["Permanencia"] = metricas.ocupacao(
+        df["soma_series"], df["qtd_validos"], df["vagas"])
+    return df
+
+
+# Esquema declarado dos CSVs. Só as colunas do esquema são lidas (as
+# "Unnamed: *" da planilha ficam de fora), todas como texto; cada coluna é
+# convertida pelo seu tipo, uma vez por valor distinto:
+#   texto       como está
+#   numero      decimal com ponto ou vírgula
+#   percentual  numero com "%" opcional no fim (o valor fica em %)
+#   inteiro     numero sem parte fracionária ("2009.0" vale)
+# Os marcadores de vazio da planilha viram nulo. Qualquer outro valor que
+# não converta rejeita a linha inteira: ela vai para a quarentena
+# (<base>.quarentena.csv, com a linha do arquivo e o motivo) em vez de
+# entrar nos dados com um nulo silencioso. O relatório da validação
+# (<base>.validacao.json) tem, por coluna, os vazios e os rejeitados.
+
+VAZIOS = ["-", "#VALUE!", "#DIV/0!", "#N/A"]
+
+ESQUEMA_SAIDA = {
+    "campus": "texto", "curso": "texto", "ano": "inteiro",
+    "incritos_vest": "numero", "incritos_sisu": "numero",
+    "incritos_provare": "numero", "ingressantes_vest": "numero",
+    "ingressantes_provare": "numero", "ingressantes_sisu": "numero",
+    "ingressantes_geral": "numero",
+    **{c: "numero" for c in SERIES_COLS},
+    # ano_minino traz proporções em algumas linhas (Zootecnia/CMCR)
+    "ano_minino": "numero", "vagas": "numero", "ocupação": "percentual",
+    "formados_geral": "numero", "formados_min": "numero",
+    "Permanencia": "percentual",
+}
+
+ESQUEMA_EVASAO = {
+    "ano": "inteiro", "campus": "texto", "curso": "texto",
+    "entradas_vest": "inteiro", "entradas_sisu": "inteiro",
+    "entradas_provare": "inteiro", "evasao_vest": "inteiro",
+    "evasao_sisu": "inteiro", "evasao_provare": "inteiro",
+    "evasao_total": "inteiro", "perc_vest": "percentual",
+    "perc_sisu": "percentual", "perc_provare": "percentual",
+    "perc_total": "percentual",
+}
+
+
+def opcoes_leitura(esquema):
+    return {"usecols": list(esquema), "dtype": str}
+
+
+def _numero(texto, tipo):
+    limpo = texto.str.strip().str.replace(",", ".", regex=False)
+    if tipo == "percentual":
+        limpo = limpo.str.removesuffix("%")
+    valores = pd.to_numeric(limpo, errors="coerce")
+    rejeitado = valores.isna() & ~texto.str.strip().isin(VAZIOS)
+    if tipo == "inteiro":
+        rejeitado |= valores.notna() & (valores % 1 != 0)
+    return valores.where(~rejeitado), rejeitado
+
+
+# df lido como texto pelo esquema; devolve (df tipado só com as linhas
+# aceitas, linhas rejeitadas em texto, relatório por coluna).
+# primeira_linha é a linha do arquivo da primeira linha de df.
+def validar(df, esquema, primeira_linha=2):
+    colunas, relatorio = {}, []
+    rejeitada = np.zeros(len(df), dtype=bool)
+    motivos = [[] for _ in range(len(df))]
+    for col, tipo in esquema.items():
+        texto = df[col]
+        if tipo == "texto":
+            colunas[col] = texto
+            relatorio.append((col, tipo, texto.isna().sum(), 0))
+            continue
+        codigos, unicos = pd.factorize(texto)
+        valores, rej = _numero(pd.Series(unicos, dtype=object), tipo)
+        # O código -1 (vazio) aponta para a última posição, a de NaN
+        valores = np.append(valores.to_numpy(dtype=float), np.nan)[codigos]
+        rej = np.append(rej.to_numpy(dtype=bool), False)[codigos]
+        serie = pd.Series(valores, index=df.index)
+        colunas[col] = serie.astype("Int64") if tipo == "inteiro" else serie
+        for i in np.flatnonzero(rej):
+            motivos[i].append(f"{col}={texto.iloc[i]!r}")
+        rejeitada |= rej
+        relatorio.append((col, tipo, serie.isna().sum() - rej.sum(),
+                          rej.sum()))
+
+    tipado = pd.DataFrame(colunas)[~rejeitada]
+    rejeitadas = df[rejeitada].copy()
+    rejeitadas.insert(0, "linha", primeira_linha + np.flatnonzero(rejeitada))
+    rejeitadas["motivo"] = ["; ".join(m) for m in motivos if m]
+    relatorio = pd.DataFrame(
+        relatorio, columns=["coluna", "tipo", "vazios", "rejeitados"]
+    ).set_index("coluna")
+    return tipado, rejeitadas, relatorio
+
+
+def caminho_quarentena(caminho_csv):
+    base, _ = os.path.splitext(caminho_csv)
+    return f"{base}.quarentena.csv"
+
+
+def caminho_validacao(caminho_csv):
+    base, _ = os.path.splitext(caminho_csv)
+    return f"{base}.validacao.json"
+
+
+# Temporário de quem grava (processo e thread) na pasta do destino: vários
+# processos do dashboard podem publicar o mesmo arquivo ao mesmo tempo, e o
+# os.replace só é atômico dentro do mesmo sistema de arquivos
+def caminho_temporario(caminho):
+    return f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def trocar_arquivo(caminho, gravar):
+    # gravar(tmp) escreve o conteúdo novo; o arquivo publicado é trocado de
+    # uma vez, então quem lê nunca vê um arquivo pela metade
+    tmp = caminho_temporario(caminho)
+    try:
+        gravar(tmp)
+        os.replace(tmp, caminho)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def gravar_validacao(caminho_csv, linhas, rejeitadas, relatorio):
+    def gravar(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "linhas": int(linhas),
+                "rejeitadas": int(rejeitadas),
+                "colunas": {
+                    col: {"tipo": r.tipo, "vazios": int(r.vazios),
+                          "rejeitados": int(r.rejeitados)}
+                    for col, r in relatorio.iterrows()
+                },
+            }, f, ensure_ascii=False, indent=1)
+
+    trocar_arquivo(caminho_validacao(caminho_csv), gravar)
+
+
+def ler_validacao(caminho_csv):
+    try:
+        with open(caminho_validacao(caminho_csv), encoding="utf-8") as f:
+            validacao = json.load(f)
+    except (OSError, ValueError):
+        return None
+    validacao["colunas"] = pd.DataFrame.from_dict(
+        validacao["colunas"], orient="index").rename_axis("coluna")
+    return validacao
+
+
+# Sem linhas rejeitadas o arquivo é removido
+def gravar_quarentena(caminho_csv, rejeitadas):
+    caminho = caminho_quarentena(caminho_csv)
+    if len(rejeitadas):
+        trocar_arquivo(caminho,
+                       lambda tmp: rejeitadas.to_csv(tmp, index=False))
+        return
+    try:
+        os.remove(caminho)
+    except FileNotFoundError:
+        pass
+
+
+def ler_validado(caminho, esquema):
+    df = pd.read_csv(caminho, **opcoes_leitura(esquema))
+    tipado, rejeitadas, relatorio = validar(df, esquema)
+    gravar_quarentena(caminho, rejeitadas)
+    gravar_validacao(caminho, len(df), len(rejeitadas), relatorio)
+    return tipado.reset_index(drop=True)
+
+
+# Colunas derivadas de saida.csv já tipado. Cada linha depende só dela
+# mesma, então vale tanto para o arquivo inteiro quanto para um bloco dele
+# (ingestao.py).
+def tipar_saida(df):
+    descritores = descrever_cursos(df)
+    for c in descritores.columns:
+        df[c] = descritores[c]
+    return derivar_permanencia(df)
+
+
+def _preparar(caminho, esquema, tipar, compacto):
+    df = ler_validado(caminho, esquema)
+    if tipar is not None:
+        df = tipar(df)
+    return compactar(df) if compacto else df
+
+
+def preparar_saida(caminho="saida.csv", compacto=True):
+    return _preparar(caminho, ESQUEMA_SAIDA, tipar_saida, compacto)
+
+
+def preparar_evasao(caminho="evasao_processos.csv", compacto=True):
+    return _preparar(caminho, ESQUEMA_EVASAO, None, compacto)
+
+
+# ---------------------------------------
+# 1.1) Correspondência de cursos entre evasao_processos.csv e saida.csv
+# ---------------------------------------
+# O evasao_processos.csv traz só o nome do curso, sem grau/turno e com grafias
+# diferentes das do saida.csv. Os dois lados são reduzidos a uma chave
+# canônica (sem acentos, caixa baixa, sem "N vagas ..." e, para Letras, o
+# conjunto de idiomas) e casados por (campus, chave). Um curso de evasão pode
+# corresponder a mais de um curso_nome (graus/turnos diferentes).
+
+IDIOMAS_LETRAS = [
+    (r"portugu", "portugues"), (r"espanhol", "espanhol"),
+    (r"ingl", "ingles"), (r"italian", "italiano"),
+    (r"alem", "alemao"), (r"libras", "libras"),
+]
+
+
+def chave_curso(nome):
+    if pd.isna(nome):
+        return ""
+    texto = unicodedata.normalize("NFKD", nome)
+    texto = texto.encode("ascii", "ignore").decode().lower()
+    texto = re.sub(r"\s+\d+\s+vagas.*$", "", texto).replace("*", "")
+    texto = " ".join(texto.split())
+    if texto.startswith("letras"):
+        idiomas = sorted({idioma for padrao, idioma in IDIOMAS_LETRAS
+                          if re.search(padrao, texto)})
+        return "letras:" + "/".join(idiomas)
+    return texto
+
+
+def mapa_cursos_evasao(df, df_e):
+    # Uma linha por (campus, curso) da evasão e curso_nome correspondente;
+    # curso_nome fica nulo quando não há correspondência
+    saida = df[["campus", "curso_nome_base", "curso_nome"]].drop_duplicates()
+    saida["chave"] = saida["curso_nome_base"].map(chave_curso)
+    evasao = df_e[["campus", "curso"]].drop_duplicates()
+    evasao["chave"] = evasao["curso"].map(chave_curso)
+    mapa = evasao.merge(saida[["campus", "chave", "curso_nome"]].drop_duplicates(),
+                        on=["campus", "chave"], how="left")
+    return mapa[["campus", "curso", "curso_nome"]].sort_values(
+        ["campus", "curso", "curso_nome"]).reset_index(drop=True)
+
+
+def cursos_sem_correspondencia(mapa):
+    return mapa.loc[mapa["curso_nome"].isna(), ["campus", "curso"]]
+
+
+def pares_evasao(mapa, cursos):
+    # (campus, curso) da evasão que correspondem aos curso_nome selecionados
+    pares = mapa.loc[mapa["curso_nome"].isin(cursos), ["campus", "curso"]]
+    return pd.MultiIndex.from_frame(pares.drop_duplicates())
+
+
+# ---------------------------------------
+# 1.2) Representação compacta em memória
+# ---------------------------------------
+# Texto vira categoria; colunas numéricas só com valores inteiros viram o
+# menor inteiro anulável que comporta o intervalo (Int16/Int32); as
+# demais continuam float64. As colunas "Unnamed: *" do saida.csv são lixo
+# da planilha e são descartadas.
+
+def menor_inteiro(serie):
+    validos = serie.dropna()
+    if len(validos) and not (validos % 1 == 0).all():
+        return None
+    minimo = validos.min() if len(validos) else 0
+    maximo = validos.max() if len(validos) else 0
+    for tipo, limite in (("Int16", 2**15), ("Int32", 2**31)):
+        if -limite <= minimo and maximo < limite:
+            return tipo
+    return "Int64"
+
+
+def sem_colunas_vazias(df):
+    return df.drop(columns=[c for c in df.columns if c.startswith("Unnamed:")])
+
+
+def compactar(df):
+    df = sem_colunas_vazias(df)
+    for c in df.columns:
+        serie = df[c]
+        if serie.dtype == object:
+            df[c] = serie.astype("category")
+        elif pd.api.types.is_numeric_dtype(serie):
+            tipo = menor_inteiro(serie)
+            if tipo is not None:
+                df[c] = serie.astype(tipo)
+    return df
+
+
+def relatorio_memoria(antes, depois):
+    # Bytes por coluna antes e depois da compactação (NaN = coluna removida)
+    bytes_antes = antes.memory_usage(deep=True, index=False)
+    bytes_depois = depois.memory_usage(deep=True, index=False)
+    relatorio = pd.DataFrame({
+        "tipo_antes": antes.dtypes.astype(str),
+        "bytes_antes": bytes_antes,
+        "tipo_depois": depois.dtypes.astype(str).reindex(antes.columns),
+        "bytes_depois": bytes_depois.reindex(antes.columns),
+    })
+    relatorio.loc["TOTAL"] = ["", bytes_antes.sum(), "", bytes_depois.sum()]
+    return relatorio
+
+
+# ---------------------------------------
+# 2) Snapshot colunar (Arrow IPC) ao lado do CSV
+# ---------------------------------------
+# O snapshot guarda o DataFrame já preparado. Ele só é reaproveitado se o
+# CSV de origem tiver o mesmo tamanho e conteúdo (sha256) e se a versão do
+# preparo for a mesma; o mtime serve apenas para evitar recalcular o hash
+# quando o arquivo claramente não mudou. Sem o CSV ao lado, o snapshot
+# publicado vale por si (servidores que só recebem os dados prontos).
+#
+# Vários processos do dashboard leem o mesmo arquivo por memory-map, sem
+# reprocessar o CSV; as páginas do arquivo ficam no cache do sistema,
+# compartilhadas entre eles. Colunas float sem nulos viram arrays que
+# apontam direto para o mapeamento; inteiros anuláveis e categorias com
+# nulos são convertidos pelo pandas para a representação dele (cópia).
+#
+# "python dados.py publicar" prepara e grava os snapshots. A gravação é
+# num arquivo temporário trocado por os.replace, então um processo nunca vê
+# um arquivo pela metade; os processos percebem a troca pela identidade do
+# arquivo (identidade_dados) na próxima execução do script. Quando o CSV
+# muda, só um processo publica (trava_publicacao, um flock ao lado do
+# snapshot); os outros esperam e abrem o snapshot novo. CSVs maiores que
+# LIMITE_LEITURA_INTEIRA são publicados em blocos, e linhas acrescentadas ao
+# fim de um CSV já publicado são preparadas sozinhas (ingestao.py).
+
+LIMITE_LEITURA_INTEIRA = 64 * 2**20
+
+
+def caminho_snapshot(caminho_csv):
+    base, _ = os.path.splitext(caminho_csv)
+    return f"{base}.snapshot.arrow"
+
+
+def hash_arquivo(caminho, bloco=1 << 20, limite=None):
+    # limite: só os primeiros bytes do arquivo
+    h = hashlib.sha256()
+    restante = float("inf") if limite is None else limite
+    with open(caminho, "rb") as f:
+        while restante > 0:
+            pedaco = f.read(int(min(bloco, restante)))
+            if not pedaco:
+                break
+            h.update(pedaco)
+            restante -= len(pedaco)
+    return h.hexdigest()
+
+
+def ler_meta_snapshot(caminho):
+    try:
+        with pa.memory_map(caminho, "r") as fonte:
+            meta = pa.ipc.open_file(fonte).schema.metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return None
+    if _CHAVE_META not in meta:
+        return None
+    return json.loads(meta[_CHAVE_META])
+
+
+def abrir_snapshot(caminho, meta):
+    # Os buffers lidos continuam apontando para o mapeamento depois do close;
+    # ele só é desfeito quando o último array que o usa é liberado
+    with pa.memory_map(caminho, "r") as fonte:
+        tabela = pa.ipc.open_file(fonte).read_all()
+    df = tabela.to_pandas(split_blocks=True)
+    df.attrs["versao"] = f"{VERSAO_PREPARO}:{meta['sha256']}"
+    return df
+
+
+def identidade_dados(caminho_csv):
+    # Muda quando o CSV ou o snapshot publicado são trocados; serve de chave
+    # barata (só stat) para o dashboard recarregar na próxima execução
+    identidade = []
+    for caminho in (caminho_csv, caminho_snapshot(caminho_csv)):
+        try:
+            st = os.stat(caminho)
+        except FileNotFoundError:
+            identidade.append(None)
+        else:
+            identidade.append((st.st_ino, st.st_size, st.st_mtime_ns))
+    return tuple(identidade)
+
+
+def _snapshot_valido(meta, caminho_csv, stat):
+    if meta is None or meta.get("versao") != VERSAO_PREPARO:
+        return False
+    if meta.get("tamanho") != stat.st_size:
+        return False
+    if meta.get("mtime_ns") == stat.st_mtime_ns:
+        return True
+    return meta.get("sha256") == hash_arquivo(caminho_csv)
+
+
+def meta_csv(caminho_csv):
+    stat = os.stat(caminho_csv)
+    return {
+        "versao": VERSAO_PREPARO,
+        "tamanho": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": hash_arquivo(caminho_csv),
+    }
+
+
+def gravar_tabelas(caminho, tabelas, meta):
+    # Grava as pa.Table (todas com o esquema da primeira) num temporário e
+    # troca o arquivo publicado de uma vez
+    def gravar(tmp):
+        writer = None
+        with pa.OSFile(tmp, "wb") as destino:
+            for tabela in tabelas:
+                if writer is None:
+                    esquema = tabela.schema.with_metadata({
+                        **(tabela.schema.metadata or {}),
+                        _CHAVE_META: json.dumps(meta).encode(),
+                    })
+                    writer = pa.ipc.new_file(destino, esquema)
+                writer.write_table(tabela.replace_schema_metadata(
+                    esquema.metadata))
+            writer.close()
+
+    trocar_arquivo(caminho, gravar)
+
+
+def _gravar_snapshot(df, caminho, meta):
+    try:
+        gravar_tabelas(
+            caminho, [pa.Table.from_pandas(df, preserve_index=False)], meta)
+    except OSError:
+        # Sem permissão de escrita: segue sem snapshot
+        pass
+
+
+# Um processo publica o snapshot de cada CSV por vez: os outros esperam na
+# trava e, ao entrar, encontram o snapshot que ele publicou
+@contextlib.contextmanager
+def trava_publicacao(caminho_csv):
+    try:
+        arquivo = open(f"{caminho_snapshot(caminho_csv)}.trava", "a")
+    except OSError:
+        # Sem permissão de escrita também não há snapshot a disputar
+        arquivo = None
+    if arquivo is None:
+        yield
+        return
+    with arquivo:
+        fcntl.flock(arquivo, fcntl.LOCK_EX)
+        yield
+
+
+def publicar(caminho_csv, preparar, progresso=None):
+    with trava_publicacao(caminho_csv):
+        return _publicar(caminho_csv, preparar, progresso)
+
+
+def _publicar(caminho_csv, preparar, progresso=None):
+    # Prepara o CSV e troca o snapshot publicado atomicamente
+    if os.path.getsize(caminho_csv) > LIMITE_LEITURA_INTEIRA:
+        from ingestao import publicar_em_blocos
+        return publicar_em_blocos(caminho_csv, preparar, progresso)
+    meta = meta_csv(caminho_csv)
+    df = preparar(caminho_csv)
+    _gravar_snapshot(df, caminho_snapshot(caminho_csv), meta)
+    df.attrs["versao"] = f"{VERSAO_PREPARO}:{meta['sha256']}"
+    return df
+
+
+def carregar_com_snapshot(caminho_csv, preparar, progresso=None):
+    # df.attrs["versao"] identifica a versão dos dados (preparo + conteúdo do
+    # CSV) para quem precisa construir estruturas derivadas uma única vez
+    snap = caminho_snapshot(caminho_csv)
+    meta = ler_meta_snapshot(snap)
+    if not os.path.exists(caminho_csv):
+        if meta is not None and meta.get("versao") == VERSAO_PREPARO:
+            return abrir_snapshot(snap, meta)
+        return publicar(caminho_csv, preparar, progresso)
+    stat = os.stat(caminho_csv)
+    if _snapshot_valido(meta, caminho_csv, stat):
+        return abrir_snapshot(snap, meta)
+    with trava_publicacao(caminho_csv):
+        # Outro processo pode ter publicado enquanto este esperava
+        meta = ler_meta_snapshot(snap)
+        if _snapshot_valido(meta, caminho_csv, stat):
+            return abrir_snapshot(snap, meta)
+        # Linhas novas no fim do CSV (ano acrescentado): prepara só elas
+        from ingestao import anexo_pendente, publicar_anexo
+        if anexo_pendente(meta, caminho_csv, stat):
+            return publicar_anexo(caminho_csv, preparar, meta, progresso)
+        return _publicar(caminho_csv, preparar, progresso)
+
+
+# ---------------------------------------
+# 3) Tabela compartilhada somente leitura
+# ---------------------------------------
+# O dashboard guarda uma única cópia de cada tabela por processo e todas as
+# sessões leem dela. A proteção usa só mecanismos públicos:
+# - copy-on-write (ligado pelo dashboard): seleções, visões e séries
+#   tiradas da tabela são objetos próprios, e escrever nelas copia só o que
+#   for escrito;
+# - os arrays numpy das colunas ficam marcados como não graváveis;
+# - a tabela recusa os métodos públicos que alteram o próprio objeto:
+#   criar, trocar ou remover colunas, atribuir atributos (eixos, attrs,
+#   tabela.coluna = ...), operadores como +=, atribuição pelos indexadores e
+#   qualquer método chamado com inplace=True.
+# O pandas está fixado em requirements.txt; tests/test_dados.py confere as
+# escritas recusadas e as leituras iguais às de um DataFrame comum.
+
+def _somente_leitura(*args, **kwargs):
+    raise TypeError(
+        "Tabela compartilhada entre sessões é somente leitura; "
+        "altere uma seleção ou uma cópia")
+
+
+class _AtributosLeitura(dict):
+    # attrs da tabela; as cópias (nas tabelas derivadas) são dict comuns
+    __setitem__ = __delitem__ = clear = pop = popitem = _somente_leitura
+    setdefault = update = __ior__ = _somente_leitura
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(dict(self), memo)
+
+
+class TabelaCompartilhada(pd.DataFrame):
+    _metadata = ["_atributos"]
+
+    @property
+    def _constructor(self):
+        return pd.DataFrame
+
+    __setitem__ = __delitem__ = insert = pop = isetitem = _somente_leitura
+    update = _somente_leitura
+    __iadd__ = __isub__ = __imul__ = __itruediv__ = _somente_leitura
+    __ifloordiv__ = __imod__ = __ipow__ = _somente_leitura
+    __iand__ = __ior__ = __ixor__ = _somente_leitura
+
+    def __setattr__(self, nome, valor):
+        # O pandas transforma a recusa de tabela.coluna = valor num atributo
+        # comum, que esconderia a coluna de todas as sessões
+        if not nome.startswith("_"):
+            _somente_leitura()
+        super().__setattr__(nome, valor)
+
+    @property
+    def attrs(self):
+        return self._atributos
+
+    @attrs.setter
+    def attrs(self, valor):
+        _somente_leitura()
+
+    @property
+    def loc(self):
+        return _IndexadorLeitura(super().loc)
+
+    @property
+    def iloc(self):
+        return _IndexadorLeitura(super().iloc)
+
+    @property
+    def at(self):
+        return _IndexadorLeitura(super().at)
+
+    @property
+    def iat(self):
+        return _IndexadorLeitura(super().iat)
+
+
+def _sem_inplace(metodo):
+    @functools.wraps(metodo)
+    def recusar_inplace(self, *args, **kwargs):
+        if kwargs.get("inplace"):
+            _somente_leitura()
+        return metodo(self, *args, **kwargs)
+    return recusar_inplace
+
+
+# Todo método público com o parâmetro inplace (sempre nomeado no pandas 2)
+for _nome, _metodo in inspect.getmembers(pd.DataFrame, inspect.isfunction):
+    if (not _nome.startswith("_")
+            and "inplace" in inspect.signature(_metodo).parameters):
+        setattr(TabelaCompartilhada, _nome, _sem_inplace(_metodo))
+
+
+class _IndexadorLeitura:
+    def __init__(self, indexador):
+        self._indexador = indexador
+
+    def __call__(self, axis=None):
+        return _IndexadorLeitura(self._indexador(axis))
+
+    def __getitem__(self, chave):
+        return self._indexador[chave]
+
+    def __getattr__(self, nome):
+        return getattr(self._indexador, nome)
+
+    __setitem__ = _somente_leitura
+
+
+def _congelar_arrays(df):
+    # Colunas numpy: to_numpy devolve uma visão do array guardado, que é
+    # a base dela. Categorias (códigos) já são só leitura; colunas que vêm
+    # do Arrow apontam para buffers só leitura; as anuláveis não expõem o
+    # array, to_numpy devolve uma cópia.
+    for _, serie in df.items():
+        if not isinstance(serie.dtype, np.dtype):
+            continue
+        arr = serie.to_numpy()
+        while isinstance(arr.base, np.ndarray):
+            arr = arr.base
+        arr.flags.writeable = False
+
+
+def compartilhar(df):
+    tabela = TabelaCompartilhada(df)
+    tabela._atributos = _AtributosLeitura(df.attrs)
+    _congelar_arrays(tabela)
+    return tabela
+
+
+def _escrever_selecao(tabela, coluna):
+    # Com copy-on-write, escrever numa seleção copia e não atinge a tabela
+    selecao = tabela[tabela[coluna] > 0]
+    selecao.loc[selecao.index[0], coluna] = -1
+    return selecao
+
+
+def _escrever_serie(tabela, coluna):
+    serie = tabela[coluna]
+    serie.iloc[0] = -1
+    return serie
+
+
+# Escritas que a tabela recusa e leituras que precisam continuar iguais às
+# de um DataFrame comum
+_ESCRITAS = {
+    "setitem": lambda t, c: t.__setitem__(c, 0),
+    "delitem": lambda t, c: t.__delitem__(c),
+    "atributo": lambda t, c: setattr(t, c, 0),
+    "loc": lambda t, c: t.loc.__setitem__((t.index[0], c), 0),
+    "loc_axis": lambda t, c: t.loc(axis=1).__setitem__(c, 0),
+    "iloc": lambda t, c: t.iloc.__setitem__((0, 0), 0),
+    "at": lambda t, c: t.at.__setitem__((t.index[0], c), 0),
+    "iat": lambda t, c: t.iat.__setitem__((0, 0), 0),
+    "insert": lambda t, c: t.insert(0, "nova", 0),
+    "pop": lambda t, c: t.pop(c),
+    "isetitem": lambda t, c: t.isetitem(0, 0),
+    "update": lambda t, c: t.update(t.head(1).fillna(0)),
+    "index": lambda t, c: setattr(t, "index", t.index[::-1]),
+    "columns": lambda t, c: setattr(t, "columns", t.columns[::-1]),
+    "attrs": lambda t, c: t.attrs.__setitem__("versao", "outra"),
+    "attrs_troca": lambda t, c: setattr(t, "attrs", {}),
+    "values": lambda t, c: t[c].to_numpy().__setitem__(0, -1),
+    "replace_dict": lambda t, c: t.replace({c: {t[c].iloc[0]: -1}},
+                                        inplace=True),
+    "replace": lambda t, c: t.replace(t[c].iloc[0], -1, inplace=True),
+    "fillna": lambda t, c: t.fillna({c: -1}, inplace=True),
+    "where": lambda t, c: t.where(t.isna(), inplace=True),
+    "mask": lambda t, c: t.mask(t.notna(), inplace=True),
+    "clip": lambda t, c: t.clip(lower=0, upper=0, inplace=True),
+    "dropna": lambda t, c: t.dropna(inplace=True),
+    "drop": lambda t, c: t.drop(columns=c, inplace=True),
+    "drop_duplicates": lambda t, c: t.drop_duplicates(inplace=True),
+    "sort_values": lambda t, c: t.sort_values(c, inplace=True),
+    "sort_index": lambda t, c: t.sort_index(ascending=False, inplace=True),
+    "rename": lambda t, c: t.rename(columns={c: "v"}, inplace=True),
+    "rename_axis": lambda t, c: t.rename_axis("linha", inplace=True),
+    "set_index": lambda t, c: t.set_index(c, inplace=True),
+    "reset_index": lambda t, c: t.reset_index(inplace=True),
+    "query": lambda t, c: t.query(f"`{c}` > 0", inplace=True),
+    "eval": lambda t, c: t.eval(f"nova = `{c}` * 2", inplace=True),
+    "ffill": lambda t, c: t.ffill(inplace=True),
+    # Colunas categóricas recusam += por si só: só a coluna float
+    "iadd": lambda t, c: compartilhar(t[[c]]).__iadd__(1),
+}
+
+_LEITURAS = {
+    "dropna": lambda t, c: t.dropna(),
+    "filter": lambda t, c: t.filter([c]),
+    "loc_axis": lambda t, c: t.loc(axis=1)[[c]],
+    "loc": lambda t, c: t.loc[t[c] > 0, [c]],
+    "iloc": lambda t, c: t.iloc[:5, :3],
+    "at": lambda t, c: t.at[t.index[0], c],
+    "iat": lambda t, c: t.iat[0, 0],
+    "melt": lambda t, c: t[[c]].head(20).melt(),
+    "melt_ids": lambda t, c: t.head(20).melt(id_vars=list(t.columns[:1]),
+                                          value_vars=[c]),
+    "query": lambda t, c: t.query(f"`{c}` > 0"),
+    "sort_values": lambda t, c: t.sort_values(c),
+    "fillna": lambda t, c: t.fillna({c: 0}),
+    "replace": lambda t, c: t.replace({c: {0: -1}}),
+    "assign": lambda t, c: t.assign(dobro=t[c] * 2),
+    "groupby": lambda t, c: t.groupby(t.columns[0], observed=True)[c].sum(),
+    "merge": lambda t, c: t.head(50).merge(t.head(50), on=list(t.columns)),
+    "concat": lambda t, c: pd.concat([t.head(3), t.tail(3)]),
+    "copia_escrita": lambda t, c: t.copy().assign(**{c: 0}),
+    "selecao_escrita": _escrever_selecao,
+    "serie_escrita": _escrever_serie,
+    "attrs": lambda t, c: dict(t.head().attrs),
+}
+
+
+def conferir_somente_leitura(df):
+    # Com copy-on-write, como no dashboard
+    with pd.option_context("mode.copy_on_write", True):
+        _conferir_somente_leitura(df)
+
+
+def _conferir_somente_leitura(df):
+    # As escritas e leituras usam a primeira coluna float64 da tabela
+    coluna = df.select_dtypes("float64").columns[0]
+    original = df.copy()
+    original.attrs = dict(df.attrs)
+    tabela = compartilhar(df)
+    for nome, escrever in _ESCRITAS.items():
+        try:
+            escrever(tabela, coluna)
+        except (TypeError, ValueError):
+            pass
+        else:
+            raise AssertionError(f"{nome}: a escrita foi aceita")
+        if not (tabela.equals(original)
+                and tabela.columns.equals(original.columns)
+                and tabela.attrs == original.attrs):
+            raise AssertionError(f"{nome}: a tabela compartilhada mudou")
+    for nome, ler in _LEITURAS.items():
+        esperado = ler(original.copy(), coluna)
+        obtido = ler(tabela, coluna)
+        if isinstance(esperado, (pd.DataFrame, pd.Series)):
+            if type(obtido) is not type(esperado):
+                raise AssertionError(f"{nome}: devolveu {type(obtido)}")
+            if isinstance(esperado, pd.DataFrame):
+                pd.testing.assert_frame_equal(obtido, esperado)
+            else:
+                pd.testing.assert_series_equal(obtido, esperado)
+        elif not (obtido == esperado or (pd.isna(obtido) and pd.isna(esperado))):
+            raise AssertionError(f"{nome}: {obtido!r} != {esperado!r}")
+        if not tabela.equals(original):
+            raise AssertionError(f"{nome}: a tabela compartilhada mudou")
+
+
+if __name__ == "__main__":
+    import sys
+
+    fontes = (("saida.csv", preparar_saida),
+              ("evasao_processos.csv", preparar_evasao))
+    if sys.argv[1:] == ["publicar"]:
+        # python dados.py publicar: grava os snapshots lidos pelo dashboard
+        for nome, preparar in fontes:
+            df = publicar(nome, preparar, progresso=lambda fracao, texto:
+                          print(f"  {fracao:6.1%} {texto}", flush=True))
+            print(f"{caminho_snapshot(nome)}: {len(df)} linhas, "
+                  f"versão {df.attrs['versao']}")
+        sys.exit(0)
+
+    if sys.argv[1:] == ["conferir"]:
+        # python dados.py conferir: a tabela compartilhada recusa escritas e
+        # lê como um DataFrame comum
+        for nome, preparar in fontes:
+            conferir_somente_leitura(carregar_com_snapshot(nome, preparar))
+            print(f"{nome}: {len(_ESCRITAS)} escritas recusadas, "
+                  f"{len(_LEITURAS)} leituras iguais")
+        sys.exit(0)
+
+    if sys.argv[1:] == ["validar"]:
+        # python dados.py validar: relatório da validação dos dois CSVs
+        for nome, esquema in (("saida.csv", ESQUEMA_SAIDA),
+                              ("evasao_processos.csv", ESQUEMA_EVASAO)):
+            ler_validado(nome, esquema)
+            validacao = ler_validacao(nome)
+            print(f"\n{nome}: {validacao['linhas']} linhas, "
+                  f"{validacao['rejeitadas']} rejeitadas")
+            print(validacao["colunas"].to_string())
+            if validacao["rejeitadas"]:
+                print(f"Linhas rejeitadas em {caminho_quarentena(nome)}")
+        sys.exit(0)
+
+    # python dados.py: bytes por coluna antes e depois da compactação
+    pd.set_option("display.width", 200)
+    for nome, preparar in fontes:
+        print(f"\n{nome}")
+        print(relatorio_memoria(preparar(nome, compacto=False),
+                                preparar(nome)).to_string())
@@ -2,8 +2,43 @@ import pandas as pd
 import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
-import numpy as np
-import re
+import contextlib
+import functools
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from streamlit.runtime.scriptrunner_utils.script_run_context import (
+    SCRIPT_RUN_CONTEXT_ATTR_NAME)
+
+from dados import (caminho_quarentena, carregar_com_snapshot, compartilhar,
+                   cursos_sem_correspondencia, identidade_dados,
+                   ler_validacao, mapa_cursos_evasao, preparar_evasao,
+                   preparar_saida)
+from filtros import IndiceFiltros
+from ingestao import carregar_cubo_publicado
+import analise
+import cubo as cb
+import cubo_arrow
+import figuras
+import perfil
+import tabelas
+import turmas as tm
+
+# Recortes e visões das tabelas compartilhadas copiam só o que for escrito
+pd.set_option("mode.copy_on_write", True)
+
+# Painel de desempenho (barra lateral): ligado, cada etapa da execução vira
+# um trecho do perfil da sessão (perfil.py); desligado, os trechos não medem
+# nada
+if st.session_state.get("painel_perfil"):
+    perfil_execucao = st.session_state.setdefault("perfil", perfil.Perfil())
+    perfil_execucao.nova_execucao()
+else:
+    perfil_execucao = perfil.DESLIGADO
+trecho_script = perfil_execucao.abrir("script", "execucao")
 
 # ---------------------------------------
 # 1) Função utilitária: adicionar hachura anos pandemia
@@ -26,146 +61,159 @@ def adicionar_fundo_pandemia(fig, anos=[2020, 2021, 2022], cor="LightSalmon", op
 # ---------------------------------------
 
 
-@st.cache_data
-def load_data():
-    df = pd.read_csv("saida.csv", dtype=str)
-    cols_num = [
-        "ano", "incritos_vest", "incritos_sisu", "incritos_provare",
-        "ingressantes_vest", "ingressantes_provare", "ingressantes_sisu",
-        "ingressantes_geral", "formados_geral", "formados_min",
-        "vagas", "ocupação"
-    ]
-    for c in cols_num:
-        if c in df.columns:
-            df[c] = pd.to_numeric(df[c].astype(str).str.replace(
-                ",", ".").str.replace("%", ""), errors="coerce")
-
-    if "Permanencia" in df.columns:
-        df["Permanencia"] = df["Permanencia"].astype(
-            str).str.replace(",", ".").str.replace("%", "")
-        df["Permanencia"] = pd.to_numeric(df["Permanencia"], errors="coerce")
-
-    # Extrai só o nome do curso
-    def extrair_nome_curso(texto):
-        if pd.isna(texto):
-            return ""
-        if "Letras" in texto:
-            m = re.search(r"(Letras\s*-\s*[^=\-]+)", texto)
-            if m:
-                return m.group(1).strip()
-            return "Letras"
-        m = re.search(r"Curso: ([^=\-]+)", texto)
-        if m:
-            return m.group(1).strip()
-        texto = re.sub(r"Curso: ", "", texto)
-        texto = texto.split('=')[0].split('-')[0].strip()
-        return texto
-
-    df["curso_nome_base"] = df["curso"].apply(extrair_nome_curso)
-
-    # NOVO: Extrai grau e turno, e inclui no nome do curso
-    def extrair_grau(texto):
-        if pd.isna(texto):
-            return ""
-        m = re.search(r"(Bacharelado|Licenciatura|Tecnológico)",
-                      texto, re.IGNORECASE)
-        if m:
-            return m.group(1).capitalize()
-        return ""
-
-    def extrair_turno(texto):
-        if pd.isna(texto):
-            return ""
-        m = re.search(r"(Matutino|Noturno|Vespertino|Integral)",
-                      texto, re.IGNORECASE)
-        if m:
-            return m.group(1).capitalize()
-        return ""
-
-    df["grau"] = df["curso"].apply(extrair_grau)
-    df["turno"] = df["curso"].apply(extrair_turno)
-
-    # Sempre inclui o campus, grau e turno no nome do curso
-    def curso_nome_final(row):
-        nome = row["curso_nome_base"]
-        campus = row["campus"]
-        grau = row["grau"]
-        turno = row["turno"]
-        partes = [nome]
-        if grau:
-            partes.append(grau)
-        if turno:
-            partes.append(turno)
-        nome_final = " - ".join(partes)
-        return f"{nome_final} ({campus})"
-    df["curso_nome"] = df.apply(curso_nome_final, axis=1)
-
-    return df
-
-
-df = load_data()
-
-
-series_cols = ["primeiro_ano", "segundo_ano",
-               "terceiro_ano", "quarto_ano", "quinto_ano", "sexto_ano"]
-
-# Converte as colunas para numérico, substituindo valores inválidos por NaN
-for c in series_cols:
-    df[c] = pd.to_numeric(df[c], errors='coerce')
-
-# Função para contar valores válidos (não NaN e > 0)
-
-
-def contar_validos(row):
-    return sum((row[series_cols] != 0) & (~row[series_cols].isna()))
-
-
-# Soma de primeiro a sexto ano
-df['soma_series'] = df[series_cols].sum(axis=1, skipna=True)
-
-# Quantidade de valores válidos
-df['qtd_validos'] = df.apply(contar_validos, axis=1)
-
-# Agora você pode calcular a "Permanencia" similar ao Excel, por exemplo:
-# Permanencia = soma_series / qtd_validos
-# Evita divisão por zero
-df['Permanencia'] = df.apply(lambda x: x['soma_series'] / (x['qtd_validos']
-                             * x['vagas']) if (x['qtd_validos'] > 0 and x['vagas'] > 0) else -1, axis=1)
+# Uma tabela por processo, compartilhada (somente leitura) entre as sessões.
+# A identidade dos arquivos é conferida a cada execução: um snapshot novo
+# publicado (python dados.py publicar) entra na próxima interação. As
+# estruturas derivadas guardam a versão atual e a anterior (sessões que
+# ainda terminam uma execução com os dados antigos). CSVs grandes são lidos
+# em blocos (ingestao.py), com o andamento numa barra de progresso.
+carregando = st.empty()
+
+
+def progresso_carga(fracao, texto):
+    carregando.progress(fracao, text=f"Preparando os dados: {texto}")
+
+
+@st.cache_resource(max_entries=1)
+def load_data(identidade, _progresso=None):
+    # Lê o snapshot colunar por memory-map se saida.csv não mudou
+    return compartilhar(carregar_com_snapshot("saida.csv", preparar_saida,
+                                              _progresso))
+
+
+with perfil_execucao.trecho("load_data", "dados") as trecho:
+    df = load_data(identidade_dados("saida.csv"), progresso_carga)
+    trecho.linhas = len(df)
 
 
 # ---------------------------------------
 # 2.1) Carregar dados de evasão
 # ---------------------------------------
-@st.cache_data
-def load_evasao():
-    df_e = pd.read_csv("evasao_processos.csv")
-    df_e["ano"] = df_e["ano"].astype(int)
-    return df_e
+@st.cache_resource(max_entries=1)
+def load_evasao(identidade, _progresso=None):
+    return compartilhar(carregar_com_snapshot(
+        "evasao_processos.csv", preparar_evasao, _progresso))
+
+
+with perfil_execucao.trecho("load_evasao", "dados") as trecho:
+    df_evasao = load_evasao(identidade_dados("evasao_processos.csv"),
+                            progresso_carga)
+    trecho.linhas = len(df_evasao)
+carregando.empty()
 
 
-df_evasao = load_evasao()
+@st.cache_resource(max_entries=2)
+def load_acumulados_evasao(versao, _df_e):
+    return analise.acumulados_evasao(_df_e)
+
+
+with perfil_execucao.trecho("load_acumulados_evasao", "estruturas"):
+    somas_evasao = load_acumulados_evasao(
+        df_evasao.attrs.get("versao"), df_evasao)
+
+
+# Correspondência (campus, curso) da evasão -> curso_nome do saida.csv
+@st.cache_resource(max_entries=2)
+def load_mapa_evasao(versao, versao_evasao, _df, _df_e):
+    return mapa_cursos_evasao(_df, _df_e)
+
+
+with perfil_execucao.trecho("load_mapa_evasao", "estruturas"):
+    mapa_evasao = load_mapa_evasao(
+        df.attrs.get("versao"), df_evasao.attrs.get("versao"), df, df_evasao)
 
 # ---------------------------------------
 # 3) Filtros laterais REATIVOS
 # ---------------------------------------
 st.sidebar.title("Filtros")
 
+# Linhas que não passaram na validação dos CSVs ficam fora dos gráficos. O
+# resumo é gravado junto com o snapshot, então só é relido quando a
+# identidade dos dados muda.
+@st.cache_data(max_entries=4, show_spinner=False)
+def load_rejeitadas(nome_csv, identidade):
+    validacao = ler_validacao(nome_csv)
+    return validacao["rejeitadas"] if validacao else 0
+
+
+for nome_csv in ("saida.csv", "evasao_processos.csv"):
+    rejeitadas = load_rejeitadas(nome_csv, identidade_dados(nome_csv))
+    if rejeitadas:
+        st.sidebar.warning(
+            f"{nome_csv}: {rejeitadas} linha(s) rejeitada(s) na "
+            f"validação, listadas em {caminho_quarentena(nome_csv)}.")
+
+
+# Índice dos filtros, construído uma vez por versão dos dados
+@st.cache_resource(max_entries=2)
+def load_indice(versao, _df):
+    return IndiceFiltros(_df)
+
+
+with perfil_execucao.trecho("load_indice", "estruturas"):
+    indice = load_indice(df.attrs.get("versao"), df)
+
+
+# Cubo de agregação (ano, campus, grau, turno, curso) usado pelos gráficos
+@st.cache_resource(max_entries=2)
+def load_cubo(versao, _df):
+    # A ingestão em blocos já publica o cubo agregado ao lado do snapshot
+    cubo_dados = carregar_cubo_publicado("saida.csv", versao)
+    if cubo_dados is None:
+        cubo_dados = cb.construir_cubo(_df)
+    cubo_dados = compartilhar(cubo_dados)
+    return cubo_dados, IndiceFiltros(cubo_dados)
+
+
+with perfil_execucao.trecho("load_cubo", "estruturas") as trecho:
+    cubo, indice_cubo = load_cubo(df.attrs.get("versao"), df)
+    trecho.linhas = len(cubo)
+
+# Backend das agregações sobre o cubo, escolhido por processo:
+# DADOS_DAA_BACKEND=arrow streamlit run dashboard.py. O pandas é a
+# referência; o Arrow (cubo_arrow) filtra e agrupa com pyarrow.compute.
+BACKEND = os.environ.get("DADOS_DAA_BACKEND", "pandas")
+
+
+@st.cache_resource(max_entries=2)
+def load_cubo_arrow(versao, _cubo):
+    return cubo_arrow.CuboArrow(_cubo)
+
+
+with perfil_execucao.trecho("load_cubo_arrow", "estruturas"):
+    cubo_tabela = (load_cubo_arrow(df.attrs.get("versao"), cubo)
+                   if BACKEND == "arrow" else None)
+
+
+# Somas acumuladas por ano de cada curso: totais do intervalo do slider.
+# Só medidas de contagem, cujas diferenças de somas são exatas (a média de
+# Permanência continua vindo do cubo filtrado).
+@st.cache_resource(max_entries=2)
+def load_acumulados(versao, _cubo):
+    return analise.acumulados_cursos(_cubo)
+
+
+with perfil_execucao.trecho("load_acumulados", "estruturas"):
+    somas_ano, indice_grupos = load_acumulados(df.attrs.get("versao"), cubo)
+
+trecho_filtros = perfil_execucao.abrir("filtros", "filtros")
+
 # Campus
 campi = st.sidebar.multiselect(
     "Campus",
-    sorted(df["campus"].dropna().unique()),
+    indice.opcoes("campus"),
     key="campi"
 )
 
 # NOVO: Filtros de Grau e Turno
-graus_opcoes = sorted(df["grau"].dropna().unique())
+graus_opcoes = indice.opcoes("grau")
 graus = st.sidebar.multiselect(
     "Grau",
     graus_opcoes,
     key="graus"
 )
 
-turnos_opcoes = sorted(df["turno"].dropna().unique())
+turnos_opcoes = indice.opcoes("turno")
 turnos = st.sidebar.multiselect(
     "Turno",
     turnos_opcoes,
@@ -173,15 +221,10 @@ turnos = st.sidebar.multiselect(
 )
 
 # Cursos dependentes do campus/grau/turno selecionado
-df_filtro_curso = df.copy()
-if campi:
-    df_filtro_curso = df_filtro_curso[df_filtro_curso["campus"].isin(campi)]
-if graus:
-    df_filtro_curso = df_filtro_curso[df_filtro_curso["grau"].isin(graus)]
-if turnos:
-    df_filtro_curso = df_filtro_curso[df_filtro_curso["turno"].isin(turnos)]
+filtros_base = {"campus": campi, "grau": graus, "turno": turnos}
+pos_filtro_curso = indice.selecionar(filtros_base)
 
-cursos_opcoes = sorted(df_filtro_curso["curso_nome"].dropna().unique())
+cursos_opcoes = indice.opcoes("curso_nome", pos_filtro_curso)
 
 cursos = st.sidebar.multiselect(
     "Curso",
@@ -190,14 +233,8 @@ cursos = st.sidebar.multiselect(
 )
 
 # Anos dependentes dos filtros acima
-df_filtro_ano = df_filtro_curso.copy()
-if cursos:
-    df_filtro_ano = df_filtro_ano[df_filtro_ano["curso_nome"].isin(cursos)]
-
-anos_min = int(df_filtro_ano["ano"].min(
-)) if not df_filtro_ano.empty else int(df["ano"].min())
-anos_max = int(df_filtro_ano["ano"].max(
-)) if not df_filtro_ano.empty else int(df["ano"].max())
+filtros_curso = {**filtros_base, "curso_nome": cursos}
+anos_min, anos_max = analise.limites_anos(indice, filtros_curso)
 
 anos = st.sidebar.slider(
     "Intervalo de Anos",
@@ -206,143 +243,321 @@ anos = st.sidebar.slider(
     key="anos"
 )
 
-# Aplica os filtros reativos
-df_f = df.copy()
-if campi:
-    df_f = df_f[df_f["campus"].isin(campi)]
-if graus:
-    df_f = df_f[df_f["grau"].isin(graus)]
-if turnos:
-    df_f = df_f[df_f["turno"].isin(turnos)]
-if cursos:
-    df_f = df_f[df_f["curso_nome"].isin(cursos)]
-df_f = df_f[(df_f["ano"] >= anos[0]) & (df_f["ano"] <= anos[1])]
+perfil_execucao.fechar(trecho_filtros)
+
+st.sidebar.divider()
+abas_sob_demanda = st.sidebar.toggle(
+    "Calcular só a aba aberta", key="abas_sob_demanda")
+pre_carga = st.sidebar.toggle(
+    "Pré-carregar a próxima aba", key="pre_carga",
+    disabled=not abas_sob_demanda)
+figuras_paralelas = st.sidebar.toggle(
+    "Construir gráficos em paralelo", key="figuras_paralelas")
+st.sidebar.toggle("Painel de desempenho", key="painel_perfil")
+
+
+versao = df.attrs.get("versao")
+versao_evasao = df_evasao.attrs.get("versao")
+anos = tuple(anos)
+
+
+# Figuras já construídas, do processo todo (figuras.py). A chave é o estado
+# dos filtros de que a figura depende.
+@st.cache_resource
+def load_cache_figuras():
+    return figuras.CacheFiguras()
+
+
+cache_figuras = load_cache_figuras()
+
+
+# Construção das figuras em paralelo (barra lateral): as agregações e o
+# Plotly de cada figura rodam num pool de threads do processo, limitado a
+# TRABALHADORES_FIGURAS para todas as sessões; o script só reserva o lugar
+# de cada figura (st.empty) e as emite na ordem da página no fim das abas.
+# DADOS_DAA_TRABALHADORES_FIGURAS=8 streamlit run dashboard.py
+TRABALHADORES_FIGURAS = int(os.environ.get(
+    "DADOS_DAA_TRABALHADORES_FIGURAS", min(4, os.cpu_count() or 1)))
+
+
+@st.cache_resource
+def load_trabalhadores_figuras():
+    return ThreadPoolExecutor(TRABALHADORES_FIGURAS,
+                              thread_name_prefix="figuras")
+
+
+def submeter(funcao):
+    # As threads do pool são de todas as sessões: cada tarefa roda com o
+    # contexto da execução que a pediu, e a thread volta ao contexto
+    # anterior (nenhum) no fim, para não prender a sessão nem vazar para a
+    # próxima tarefa
+    ctx = get_script_run_ctx()
+
+    def tarefa():
+        thread = threading.current_thread()
+        anterior = getattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME, None)
+        add_script_run_ctx(thread, ctx)
+        try:
+            return funcao()
+        finally:
+            setattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME, anterior)
+
+    return load_trabalhadores_figuras().submit(tarefa)
+
+
+logger = logging.getLogger("dashboard")
+
+
+# Tarefas cujo resultado ninguém espera (pré-carga): o erro vai para o log
+def registrar_falha(nome):
+    def registrar(futuro):
+        erro = futuro.exception()
+        if erro is not None:
+            logger.error("Falha na tarefa em segundo plano %s", nome,
+                         exc_info=erro)
+    return registrar
+
+
+# Figuras pedidas em paralelo e ainda não emitidas, por grupo: a base é a
+# página (emitida no fim); um fragmento abre o próprio grupo e emite só as
+# figuras que ele pediu
+grupos_figuras = [[]]
+
+
+@contextlib.contextmanager
+def grupo_figuras():
+    grupo = []
+    grupos_figuras.append(grupo)
+    try:
+        yield
+    finally:
+        grupos_figuras.remove(grupo)
+    emitir_figuras(grupo)
+
+estado_filtros = {"versao": versao, "campi": campi, "graus": graus,
+                  "turnos": turnos, "cursos": cursos, "anos": anos}
+estado_evasao = {"versao": versao, "versao_evasao": versao_evasao,
+                 "campi": campi, "cursos": cursos, "anos": anos}
+
+
+def mostrar_figura(nome, estado, construir):
+    # construir só roda quando a figura não está no cache
+    def construir_medido():
+        with perfil_execucao.trecho("construir", "plotly"):
+            return construir()
+
+    chave = figuras.chave_figura(nome, **estado)
+    if figuras_paralelas:
+        grupos_figuras[-1].append((nome, chave, st.empty(), submeter(
+            lambda: cache_figuras.figura(chave, construir_medido))))
+        return
+    with perfil_execucao.trecho(f"figura:{nome}", "figura") as trecho:
+        fig = cache_figuras.figura(chave, construir_medido)
+        with perfil_execucao.trecho("plotly_chart", "serializacao"):
+            st.plotly_chart(fig, use_container_width=True)
+    if perfil_execucao.ativo:
+        trecho.bytes = cache_figuras.tamanho(chave)
+
+
+def emitir_figuras(pendentes):
+    # Figuras pedidas em paralelo, na ordem em que foram pedidas
+    for nome, chave, espaco, futuro in pendentes:
+        with perfil_execucao.trecho(f"figura:{nome}", "figura") as trecho:
+            fig = futuro.result()
+            with perfil_execucao.trecho("plotly_chart", "serializacao"):
+                espaco.plotly_chart(fig, use_container_width=True)
+        if perfil_execucao.ativo:
+            trecho.bytes = cache_figuras.tamanho(chave)
+    pendentes.clear()
+
+
+def mostrar_tabela(nome, tabela, **opcoes):
+    with perfil_execucao.trecho(f"tabela:{nome}", "tabela",
+                                linhas=len(tabela)) as trecho:
+        st.dataframe(tabela, **opcoes)
+    if perfil_execucao.ativo:
+        trecho.bytes = perfil.bytes_arrow(tabela)
+
+
+def inicio_fragmento(nome):
+    # Reexecução só do fragmento: os trechos dela são uma execução à parte
+    ctx = get_script_run_ctx()
+    if ctx is not None and ctx.fragment_ids_this_run:
+        perfil_execucao.nova_execucao(f"fragmento:{nome}")
+
+
+def dados_aba(nome, calcular):
+    # Agregações de uma aba (do cache ou calculadas agora)
+    with perfil_execucao.trecho(f"dados:{nome}", "agregacao") as trecho:
+        d = calcular()
+    if perfil_execucao.ativo:
+        trecho.linhas = perfil.linhas_tabelas(d)
+    return d
+
+# ---------------------------------------
+# 4) Dados de cada aba
+# ---------------------------------------
+# Agregações de cada aba (analise.py) a partir do estado dos filtros. Ficam
+# em cache, assim trocar de aba (ou pré-carregar a próxima em segundo plano)
+# não recalcula. Estados já calculados pelo lote (python lote.py) são lidos
+# dos artefatos, quando são da mesma versão dos dados.
+base = analise.Base(df, df_evasao, indice, cubo, indice_cubo, somas_ano,
+                    indice_grupos, somas_evasao, mapa_evasao, cubo_tabela)
+
+
+@st.cache_resource(max_entries=2)
+def load_artefatos(versao, versao_evasao, identidade):
+    return analise.abrir_artefatos(versao, versao_evasao)
+
+
+def identidade_manifesto():
+    try:
+        st_manifesto = os.stat(analise.caminho_manifesto())
+    except FileNotFoundError:
+        return None
+    return st_manifesto.st_ino, st_manifesto.st_mtime_ns
+
+
+artefatos = load_artefatos(versao, versao_evasao, identidade_manifesto())
+
+
+def analisar(nome, filtros, anos):
+    d = None if artefatos is None else artefatos.ler(nome, filtros, anos)
+    return analise.ANALISES[nome](base, filtros, anos) if d is None else d
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def dados_visao_geral(versao, filtros, anos):
+    return analisar("visao_geral", filtros, anos)
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def dados_inscricoes(versao, filtros, anos):
+    return analisar("inscricoes", filtros, anos)
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def dados_matriculados(versao, filtros, anos):
+    return analisar("matriculados", filtros, anos)
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def dados_evasao(versao, versao_evasao, campi, cursos, anos):
+    return analisar("evasao", {"campus": campi, "curso_nome": cursos}, anos)
+
 
 # ---------------------------------------
-# 4) Tabs
+# 5) Abas
 # ---------------------------------------
-# Adiciona nova aba para evasão
-aba1, aba2, aba3, aba4, aba5, aba6= st.tabs([
-    "📊 Visão Geral",
-    "📝 Inscrições",
-    "📂 Dados Brutos",
-    "📈 Matriculados por curso",
-    "🎯 Turma", 
-		"🚨 Evasão"
-])
 # ---------------------- ABA 1 ----------------------
-with aba1:
+def aba_visao_geral():
+    d = dados_aba("visao_geral",
+                  lambda: dados_visao_geral(versao, filtros_curso, anos))
     st.subheader("Indicadores Gerais")
     col1, col2, col3 = st.columns(3)
-    col1.metric("Total de Ingressantes", int(
-        df_f["ingressantes_geral"].sum(skipna=True)))
-    col2.metric("Total de Formados", int(
-        df_f["formados_geral"].sum(skipna=True)))
-    permanencias_validas = df_f.loc[df_f['Permanencia'] > 0, 'Permanencia']
+    totais = d["totais"]
+    col1.metric("Total de Ingressantes", int(totais["ingressantes_geral"]))
+    col2.metric("Total de Formados", int(totais["formados_geral"]))
     col3.metric("Permanência Média (%)",
-                f"{permanencias_validas.mean(skipna=True)*100:.2f}%")
+                f"{d['permanencia_media']*100:.2f}%")
     # NOVO: Total de vagas ofertadas
     # col4.metric("Total de Vagas Ofertadas", int(df_f["vagas"].sum(skipna=True)))
 
     st.subheader("Evolução de Ingressantes e Formados")
-    df_plot = df_f.groupby("ano", as_index=False)[
-        ["ingressantes_geral", "formados_geral"]].sum()
-    fig = px.line(df_plot, x="ano", y=["ingressantes_geral", "formados_geral"],
-                  labels={"value": "Quantidade", "variable": "Indicador"}, markers=True)
-    fig = adicionar_fundo_pandemia(fig)
-    st.plotly_chart(fig, use_container_width=True)
+
+    def construir_fig():
+        df_plot = d["df_plot"]
+        fig = px.line(df_plot, x="ano", y=["ingressantes_geral", "formados_geral"],
+                      labels={"value": "Quantidade", "variable": "Indicador"}, markers=True)
+        return adicionar_fundo_pandemia(fig)
+    mostrar_figura("fig", estado_filtros, construir_fig)
 
     # NOVO: Gráfico de evolução das vagas ofertadas
     st.subheader("Evolução das Vagas Ofertadas")
-    df_vagas_ano = df_f.groupby("ano", as_index=False)["vagas"].sum()
-    fig_vagas = px.line(df_vagas_ano, x="ano", y="vagas", markers=True,
-                        labels={"vagas": "Vagas Ofertadas", "ano": "Ano"})
-    fig_vagas = adicionar_fundo_pandemia(fig_vagas)
-    st.plotly_chart(fig_vagas, use_container_width=True)
+
+    def construir_fig_vagas():
+        df_vagas_ano = d["df_vagas_ano"]
+        fig_vagas = px.line(df_vagas_ano, x="ano", y="vagas", markers=True,
+                            labels={"vagas": "Vagas Ofertadas", "ano": "Ano"})
+        return adicionar_fundo_pandemia(fig_vagas)
+    mostrar_figura("fig_vagas", estado_filtros, construir_fig_vagas)
 
 
 ##############################################################
 
     st.subheader("Taxa de Ocupação ao longo dos anos (%)")
 
-    # Calcula a média da permanência por ano, ignorando valores <= 0
-    df_permanencia = (
-        df_f[df_f["Permanencia"] > 0]
-        .groupby("ano", as_index=False)["Permanencia"]
-        .mean()
-    )
-    # st.dataframe(df_f)
-    # st.dataframe(df_permanencia)
-
-    # Multiplica somente a coluna Permanencia por 100
-    df_permanencia["Permanencia"] = df_permanencia["Permanencia"] * 100
-    df_permanencia["Permanencia"] = df_permanencia["Permanencia"].round(2)
-
-    # Gráfico de linha
-    fig2 = px.line(
-        df_permanencia,
-        x="ano",
-        y="Permanencia",
-        markers=True,
-        labels={"Permanencia": "Ocupação (%)", "ano": "Ano"}
-    )
-
-    # Adiciona hachura anos pandemia
-    fig2 = adicionar_fundo_pandemia(fig2)
+    def construir_fig2():
+        # Média da permanência por ano (%), ignorando valores <= 0
+        df_permanencia = d["df_permanencia"]
+        # st.dataframe(df_f)
+        # st.dataframe(df_permanencia)
+
+        # Gráfico de linha
+        fig2 = px.line(
+            df_permanencia,
+            x="ano",
+            y="Permanencia",
+            markers=True,
+            labels={"Permanencia": "Ocupação (%)", "ano": "Ano"}
+        )
 
-    # Eixo y começando em 0, topo automático, formatação inteira
-    fig2.update_yaxes(range=[0, 120], tickformat=".0f")
+        # Adiciona hachura anos pandemia
+        fig2 = adicionar_fundo_pandemia(fig2)
 
-    st.plotly_chart(fig2, use_container_width=True)
+        # Eixo y começando em 0, topo automático, formatação inteira
+        fig2.update_yaxes(range=[0, 120], tickformat=".0f")
+        return fig2
+    mostrar_figura("fig2", estado_filtros, construir_fig2)
 
     st.subheader("Distribuição de Ingressantes por Tipo de Ingresso")
-    tipos = ["ingressantes_vest", "ingressantes_sisu", "ingressantes_provare"]
-    df_tipo = df_f[tipos].sum().reset_index()
-    df_tipo.columns = ["Tipo", "Quantidade"]
-    fig3 = px.pie(df_tipo, values="Quantidade", names="Tipo", hole=0.3)
-    st.plotly_chart(fig3, use_container_width=True)
+
+    def construir_fig3():
+        df_tipo = d["df_tipo"]
+        return px.pie(df_tipo, values="Quantidade", names="Tipo", hole=0.3)
+    mostrar_figura("fig3", estado_filtros, construir_fig3)
 
     # NOVO: Gráfico de ocupação por curso se nenhum ou mais de um curso estiver selecionado
     if not cursos or len(cursos) > 1:
         st.subheader("Ocupação por Curso (período filtrado)")
-        df_ocup_curso = (
-            df_f[df_f["Permanencia"] > 0]
-            .groupby("curso_nome", as_index=False)["Permanencia"]
-            .mean()
-        )
-        df_ocup_curso["Permanencia"] = df_ocup_curso["Permanencia"] * 100
-        df_ocup_curso["Permanencia"] = df_ocup_curso["Permanencia"].round(2)
-        df_ocup_curso = df_ocup_curso.sort_values(
-            "Permanencia", ascending=True)
-        fig_ocup_curso = px.bar(
-            df_ocup_curso,
-            x="Permanencia",
-            y="curso_nome",
-            orientation="h",
-            labels={"Permanencia": "Ocupação (%)", "curso_nome": "Curso"},
-            text="Permanencia"
-        )
-        fig_ocup_curso.update_layout(
-            yaxis={'categoryorder': 'total ascending'})
-        st.plotly_chart(fig_ocup_curso, use_container_width=True)
+
+        def construir_fig_ocup_curso():
+            df_ocup_curso = d["df_ocup_curso"]
+            fig_ocup_curso = px.bar(
+                df_ocup_curso,
+                x="Permanencia",
+                y="curso_nome",
+                orientation="h",
+                labels={"Permanencia": "Ocupação (%)", "curso_nome": "Curso"},
+                text="Permanencia"
+            )
+            fig_ocup_curso.update_layout(
+                yaxis={'categoryorder': 'total ascending'})
+            return fig_ocup_curso
+        mostrar_figura("fig_ocup_curso", estado_filtros,
+                       construir_fig_ocup_curso)
 
 # ---------------------- ABA 2 ----------------------
-with aba2:
+def aba_inscricoes():
+    # Só as figuras usam os dados: com todas no cache, nada é agregado
+    dados = functools.cache(lambda: dados_aba(
+        "inscricoes", lambda: dados_inscricoes(versao, filtros_curso, anos)))
     st.subheader("Inscrições dos Processos Seletivos")
-    df_insc = df_f.groupby("ano", as_index=False)[
-        ["incritos_vest", "incritos_sisu", "incritos_provare"]].sum()
-    fig4 = px.line(df_insc, x="ano", y=["incritos_vest", "incritos_sisu", "incritos_provare"],
-                   labels={"value": "Inscritos", "variable": "Processo Seletivo"}, markers=True)
-    fig4 = adicionar_fundo_pandemia(fig4)
-    st.plotly_chart(fig4, use_container_width=True)
+
+    def construir_fig4():
+        df_insc = dados()["df_insc"]
+        fig4 = px.line(df_insc, x="ano", y=["incritos_vest", "incritos_sisu", "incritos_provare"],
+                       labels={"value": "Inscritos", "variable": "Processo Seletivo"}, markers=True)
+        return adicionar_fundo_pandemia(fig4)
+    mostrar_figura("fig4", estado_filtros, construir_fig4)
 
     st.subheader("Total de Inscritos por Processo (período filtrado)")
-    df_total_insc = df_f[["incritos_vest", "incritos_sisu",
-                          "incritos_provare"]].sum().reset_index()
-    df_total_insc.columns = ["Processo", "Total de Inscritos"]
-    fig5 = px.bar(df_total_insc, x="Processo",
-                  y="Total de Inscritos", text="Total de Inscritos")
-    st.plotly_chart(fig5, use_container_width=True)
+
+    def construir_fig5():
+        df_total_insc = dados()["df_total_insc"]
+        return px.bar(df_total_insc, x="Processo",
+                      y="Total de Inscritos", text="Total de Inscritos")
+    mostrar_figura("fig5", estado_filtros, construir_fig5)
 
     # st.subheader("Relação Ingressantes x Inscritos (%)")
     # df_rel = df_f.groupby("ano", as_index=False).agg({
@@ -359,166 +574,161 @@ with aba2:
     # st.plotly_chart(fig6, use_container_width=True)
 
     st.subheader("Inscritos no Vestibular por Curso")
-    df_vest_curso = df_f.groupby("curso_nome", as_index=False)[
-        "incritos_vest"].sum()
-    df_vest_curso = df_vest_curso.sort_values("incritos_vest", ascending=True)
-    fig7 = px.bar(df_vest_curso, x="incritos_vest", y="curso_nome", orientation="h",
-                  labels={"incritos_vest": "Inscritos no Vestibular",
-                          "curso_nome": "Curso"},
-                  text="incritos_vest")
-    fig7.update_layout(yaxis={'categoryorder': 'total ascending'})
-    st.plotly_chart(fig7, use_container_width=True)
+
+    def construir_fig7():
+        df_vest_curso = dados()["df_vest_curso"]
+        fig7 = px.bar(df_vest_curso, x="incritos_vest", y="curso_nome", orientation="h",
+                      labels={"incritos_vest": "Inscritos no Vestibular",
+                              "curso_nome": "Curso"},
+                      text="incritos_vest")
+        fig7.update_layout(yaxis={'categoryorder': 'total ascending'})
+        return fig7
+    mostrar_figura("fig7", estado_filtros, construir_fig7)
 
     # st.subheader("Relação Inscritos por Vaga")
-    df_rel_vest_vagas = df_f.groupby("curso_nome", as_index=False)[["incritos_vest", "vagas", "ano"]].agg({
-        "incritos_vest": "sum",
-        "vagas": "sum",
-        "ano": "min"  # pega o menor ano do filtro para cada curso
-    })
-    # Aplica a regra: dobra inscritos_por_vaga para anos >= 2014
-
-    def concorrencia_corrigida(row):
-        if row["ano"] >= 2014:
-            return 2 * (row["incritos_vest"] / row["vagas"]) if row["vagas"] > 0 else 0
-        else:
-            return (row["incritos_vest"] / row["vagas"]) if row["vagas"] > 0 else 0
-    df_rel_vest_vagas["inscritos_por_vaga"] = df_rel_vest_vagas.apply(
-        concorrencia_corrigida, axis=1)
-    df_rel_vest_vagas = df_rel_vest_vagas.sort_values(
-        "inscritos_por_vaga", ascending=True)
-    fig8 = px.bar(df_rel_vest_vagas, x="inscritos_por_vaga", y="curso_nome", orientation="h",
-                  labels={"inscritos_por_vaga": "Inscritos por Vaga",
-                          "curso_nome": "Curso"},
-                  text="inscritos_por_vaga")
-    fig8.update_layout(yaxis={'categoryorder': 'total ascending'})
-    fig8 = adicionar_fundo_pandemia(fig8)
+    # df_rel_vest_vagas = dados()["df_rel_vest_vagas"]
+    # fig8 = px.bar(df_rel_vest_vagas, x="inscritos_por_vaga", y="curso_nome", orientation="h",
+    #               labels={"inscritos_por_vaga": "Inscritos por Vaga",
+    #                       "curso_nome": "Curso"},
+    #               text="inscritos_por_vaga")
+    # fig8.update_layout(yaxis={'categoryorder': 'total ascending'})
+    # fig8 = adicionar_fundo_pandemia(fig8)
     # st.plotly_chart(fig8, use_container_width=True)
 
     # NOVO: Vagas ofertadas no vestibular e concorrência (inscritos por vaga)
     st.subheader("Vagas Ofertadas no Vestibular e Concorrência por Curso")
 
-    # Calcula vagas do vestibular conforme regra: até 2013 = vagas, a partir de 2014 = vagas * 0.5
-    df_f["vagas_vest"] = df_f.apply(
-        lambda row: row["vagas"] if row["ano"] < 2014 else row["vagas"] * 0.5, axis=1)
-
-    # Agrupa por curso
-    df_vest = df_f.groupby("curso_nome", as_index=False).agg({
-        "incritos_vest": "sum",
-        "vagas_vest": "sum"
-    })
-    df_vest["concorrencia_vest"] = df_vest.apply(
-        lambda row: row["incritos_vest"] / row["vagas_vest"] if row["vagas_vest"] > 0 else 0, axis=1
-    )
-
-    # Ordena por concorrência
-    df_vest = df_vest.sort_values("concorrencia_vest", ascending=True)
-
-    # Gráfico de barras duplo: vagas ofertadas (barra), concorrência (linha)
-    import plotly.graph_objects as go
-    fig_vest = go.Figure()
-    fig_vest.add_trace(go.Bar(
-        x=df_vest["concorrencia_vest"],
-        y=df_vest["curso_nome"],
-        orientation="h",
-        name="Concorrência (Inscritos por Vaga)",
-        marker_color="orange",
-        text=df_vest["concorrencia_vest"].round(2),
-        textposition="outside"
-    ))
-    fig_vest.add_trace(go.Bar(
-        x=df_vest["vagas_vest"],
-        y=df_vest["curso_nome"],
-        orientation="h",
-        name="Vagas Vestibular",
-        marker_color="blue",
-        text=df_vest["vagas_vest"].astype(int),
-        textposition="inside"
-    ))
-    fig_vest.update_layout(
-        barmode="group",
-        xaxis_title="Quantidade",
-        yaxis_title="Curso",
-        legend_title="Legenda"
-    )
-    st.plotly_chart(fig_vest, use_container_width=True)
+    def construir_fig_vest():
+        # Vagas do vestibular e concorrência por curso
+        df_vest = dados()["df_vest"]
+
+        # Gráfico de barras duplo: vagas ofertadas (barra), concorrência (linha)
+        fig_vest = go.Figure()
+        fig_vest.add_trace(go.Bar(
+            x=df_vest["concorrencia_vest"],
+            y=df_vest["curso_nome"],
+            orientation="h",
+            name="Concorrência (Inscritos por Vaga)",
+            marker_color="orange",
+            text=df_vest["concorrencia_vest"].round(2),
+            textposition="outside"
+        ))
+        fig_vest.add_trace(go.Bar(
+            x=df_vest["vagas_vest"],
+            y=df_vest["curso_nome"],
+            orientation="h",
+            name="Vagas Vestibular",
+            marker_color="blue",
+            text=df_vest["vagas_vest"].astype(int),
+            textposition="inside"
+        ))
+        fig_vest.update_layout(
+            barmode="group",
+            xaxis_title="Quantidade",
+            yaxis_title="Curso",
+            legend_title="Legenda"
+        )
+        return fig_vest
+    mostrar_figura("fig_vest", estado_filtros, construir_fig_vest)
 
 # ---------------------- ABA 3 ----------------------
-with aba3:
+def aba_dados_brutos():
     st.subheader("Dados Filtrados")
-    st.dataframe(df_f, use_container_width=True)
+    # Só as posições filtradas; a tabela envia uma página por vez
+    tabelas.tabela_paginada(
+        df, "dados_brutos", indice.selecionar(filtros_curso, {"ano": anos}),
+        nome_arquivo="dados_filtrados.csv", perfil_execucao=perfil_execucao)
 
 # ---------------------- ABA 4 ----------------------
-with aba4:
+def aba_matriculados():
     # ...existing code...
-    series_cols = ["primeiro_ano", "segundo_ano",
-                   "terceiro_ano", "quarto_ano", "quinto_ano", "sexto_ano"]
-    aux = df_f[df_f["curso_nome"].isin(cursos)]
-    df_series = aux.groupby(["ano", "curso_nome"])[
-        series_cols].sum().reset_index()
+    dados = functools.cache(lambda: dados_aba(
+        "matriculados",
+        lambda: dados_matriculados(versao, filtros_curso, anos)))
 
     st.subheader("Evolução das Séries ao Longo dos Anos (Todas as Séries)")
-    df_series_melt = df_series.melt(
-        id_vars=["ano", "curso_nome"],
-        value_vars=series_cols,
-        var_name="Série",
-        value_name="Alunos"
-    )
-    fig_series_all = px.bar(
-        df_series_melt,
-        x="ano",
-        y="Alunos",
-        color="Série",
-        barmode="group",  # barras agrupadas
-        labels={
-            "Alunos": "Quantidade de Alunos",
-            "ano": "Ano de Ingresso",
-            "Série": "Série"
-        }
-    )
-    fig_series_all = adicionar_fundo_pandemia(fig_series_all)
-    st.plotly_chart(fig_series_all, use_container_width=True)
+
+    def construir_fig_series_all():
+        df_series_melt = dados()["df_series_melt"]
+        fig_series_all = px.bar(
+            df_series_melt,
+            x="ano",
+            y="Alunos",
+            color="Série",
+            barmode="group",  # barras agrupadas
+            labels={
+                "Alunos": "Quantidade de Alunos",
+                "ano": "Ano de Ingresso",
+                "Série": "Série"
+            }
+        )
+        return adicionar_fundo_pandemia(fig_series_all)
+    mostrar_figura("fig_series_all", estado_filtros, construir_fig_series_all)
     # ...existing code...
 
     # NOVO: Gráfico de barras de formados_geral e formados_min
     st.subheader("Quantidade de Formados Geral e em Tempo Mínimo")
-    df_formados = aux.groupby(["ano", "curso_nome"], as_index=False)[
-        ["formados_geral", "formados_min"]].sum()
-
-    # Gráfico: barra de formados_geral (fundo), barra de formados_min (sobreposta)
-    fig_formados = go.Figure()
-    fig_formados.add_trace(go.Bar(
-        x=df_formados["ano"],
-        y=df_formados["formados_geral"],
-        name="Formados Geral",
-        marker_color="lightblue",
-        text=df_formados["formados_geral"],
-        textposition="outside",
-    ))
-    fig_formados.add_trace(go.Bar(
-        x=df_formados["ano"],
-        y=df_formados["formados_min"],
-        name="Formados em Tempo Mínimo",
-        marker_color="blue",
-        text=df_formados["formados_min"],
-        textposition="inside",
-    ))
-    fig_formados.update_layout(
-        barmode="overlay",
-        xaxis_title="Ano",
-        yaxis_title="Quantidade",
-        legend_title="Tipo de Formado"
-    )
-
-    fig_formados = adicionar_fundo_pandemia(fig_formados)
-    st.plotly_chart(fig_formados, use_container_width=True)
+
+    def construir_fig_formados():
+        df_formados = dados()["df_formados"]
+
+        # Gráfico: barra de formados_geral (fundo), barra de formados_min (sobreposta)
+        fig_formados = go.Figure()
+        fig_formados.add_trace(go.Bar(
+            x=df_formados["ano"],
+            y=df_formados["formados_geral"],
+            name="Formados Geral",
+            marker_color="lightblue",
+            text=df_formados["formados_geral"],
+            textposition="outside",
+        ))
+        fig_formados.add_trace(go.Bar(
+            x=df_formados["ano"],
+            y=df_formados["formados_min"],
+            name="Formados em Tempo Mínimo",
+            marker_color="blue",
+            text=df_formados["formados_min"],
+            textposition="inside",
+        ))
+        fig_formados.update_layout(
+            barmode="overlay",
+            xaxis_title="Ano",
+            yaxis_title="Quantidade",
+            legend_title="Tipo de Formado"
+        )
+
+        return adicionar_fundo_pandemia(fig_formados)
+    mostrar_figura("fig_formados", estado_filtros, construir_fig_formados)
 
 # ---------------------- ABA 5 ----------------------
-with aba5:
+# Tabela de todas as turmas (curso x ano de ingresso), calculada uma vez
+@st.cache_resource(max_entries=2)
+def load_turmas(versao, _df):
+    turmas = None if artefatos is None else artefatos.turmas()
+    return tm.construir_turmas(_df) if turmas is None else turmas
+
+
+# Anos de ingresso disponíveis (decrescentes) de cada curso, para os seletores
+@st.cache_data(show_spinner=False)
+def anos_turma_por_curso(versao):
+    validos = df[df["ano"].notna()]
+    return {
+        curso: sorted({int(a) for a in anos_curso}, reverse=True)
+        for curso, anos_curso in validos.groupby("curso_nome", observed=True)["ano"]
+    }
+
+
+# Fragmento: mudar o curso ou o ano da turma reexecuta só esta seção, sem
+# recarregar/filtrar os dados nem refazer os gráficos das outras abas
+@st.fragment
+@grupo_figuras()
+def aba_turma():
+    inicio_fragmento("aba_turma")
     st.subheader("Acompanhamento de uma Turma")
     st.text("Selecione o curso e o ano de ingresso para ver a evolução da turma ao longo dos anos.")
 
     # Seleção do curso
-    cursos_disponiveis = sorted(df["curso_nome"].dropna().unique())
+    cursos_disponiveis = indice.opcoes("curso_nome")
     if cursos_disponiveis:
         curso_turma = st.selectbox(
             "Curso", cursos_disponiveis, key="turma_curso")
@@ -526,66 +736,29 @@ with aba5:
         st.warning("Não há cursos disponíveis.")
         curso_turma = None
 
-    turma_df = pd.DataFrame()  # Inicializa vazio
+    tem_turma = False  # Há linhas do curso a partir do ano de ingresso
 
     if curso_turma:
         # Seleção do ano de ingresso
-        anos_disponiveis = df[df["curso_nome"] ==
-                              curso_turma]["ano"].dropna().unique()
-        anos_disponiveis = sorted([int(a)
-                                  for a in anos_disponiveis], reverse=True)
+        anos_disponiveis = anos_turma_por_curso(versao).get(curso_turma, [])
         if anos_disponiveis:
             ano_ingresso = st.selectbox(
                 "Ano de ingresso", anos_disponiveis, key="turma_ano")
-            turma_df = df[(df["curso_nome"] == curso_turma)
-                          & (df["ano"] >= ano_ingresso)]
+            tem_turma = True
         else:
             st.warning(f"Não há anos disponíveis para o curso {curso_turma}")
             ano_ingresso = None
 
-    if turma_df.empty:
+    if not tem_turma:
         st.warning("Não há dados para essa combinação de curso e ano.")
     else:
         anos_curso = 6  # padrão
         st.write(f"Duração mínima estimada do curso: **{anos_curso} anos**")
 
-        series_map = {
-            "primeiro_ano": 1,
-            "segundo_ano": 2,
-            "terceiro_ano": 3,
-            "quarto_ano": 4,
-            "quinto_ano": 5,
-            "sexto_ano": 6,
-        }
-
-        evolucao = []
-        ano_formatura = ano_ingresso - 1
-        for i in range(anos_curso):
-            col_nome = list(series_map.keys())[i]
-            ano_corrente = ano_ingresso + i
-            valor = df[(df["curso_nome"] == curso_turma) & (
-                df["ano"] == ano_corrente)][col_nome].sum()
-            if valor == 0:
-                continue
-            ano_formatura += 1
-            evolucao.append({
-                "Ano civil": ano_corrente,
-                "Ano da turma": i + 1,
-                "Matriculados": valor,
-                "Formados tempo mínimo": 0
-            })
-
-        # Formados ao final do curso
-        formados_total = df[(df["curso_nome"] == curso_turma) & (
-            df["ano"] == ano_formatura)]["formados_geral"].sum()
-        formados_minimo = df[(df["curso_nome"] == curso_turma) & (
-            df["ano"] == ano_formatura)]["formados_min"].sum()
-        evolucao.append({
-            "Ano civil": ano_formatura,
-            "Ano da turma": "Formados",
-            "Matriculados": formados_total,
-            "Formados tempo mínimo": formados_minimo
-        })
+        with perfil_execucao.trecho("turmas:evolucao", "agregacao"):
+            evolucao = tm.evolucao_turma(
+                load_turmas(versao, df), curso_turma, ano_ingresso)
+        formados_total = evolucao[-1]["Matriculados"]
 
         if formados_total == 0:
             st.warning(
@@ -596,61 +769,86 @@ with aba5:
             df_evolucao["Matriculados"], errors="coerce").fillna(0)
         df_evolucao["Formados tempo mínimo"] = pd.to_numeric(
             df_evolucao["Formados tempo mínimo"], errors="coerce").fillna(0)
-        st.dataframe(df_evolucao, use_container_width=True)
-
-        # Gráfico misto linha + barras
-        df_linha = df_evolucao[df_evolucao["Ano da turma"] != "Formados"]
-        df_barra = df_evolucao[df_evolucao["Ano da turma"] == "Formados"]
-
-        fig_turma = go.Figure()
-        if not df_linha.empty:
-            fig_turma.add_trace(go.Scatter(
-                x=df_linha["Ano civil"],
-                y=df_linha["Matriculados"],
-                mode="lines+markers+text",
-                text=df_linha["Matriculados"],
-                textposition="top center",
-                name="Matriculados"
-            ))
-        if not df_barra.empty:
-            fig_turma.add_trace(go.Bar(
-                x=df_barra["Ano civil"],
-                y=df_barra["Matriculados"],
-                text=df_barra["Matriculados"],
-                textposition="outside",
-                name="Formados total",
-                marker_color="lightblue"
-            ))
-            fig_turma.add_trace(go.Bar(
-                x=df_barra["Ano civil"],
-                y=df_barra["Formados tempo mínimo"],
-                text=df_barra["Formados tempo mínimo"],
-                textposition="inside",
-                name="Formados em tempo mínimo",
-                marker_color="blue"
-            ))
-
-        y_max = max(
-            df_evolucao["Matriculados"].max(
-            ) if not df_evolucao["Matriculados"].empty else 0,
-            df_evolucao["Formados tempo mínimo"].max(
-            ) if not df_evolucao["Formados tempo mínimo"].empty else 0
-        ) * 1.1
-
-        fig_turma.update_layout(
-            barmode="overlay",
-            yaxis=dict(range=[0, y_max]),
-            xaxis_title="Ano",
-            yaxis_title="Alunos",
-            legend_title="Legenda"
-        )
-
-        # Adiciona hachura anos pandemia
-        fig_turma = adicionar_fundo_pandemia(fig_turma)
-        st.plotly_chart(fig_turma, use_container_width=True)
+        mostrar_tabela("evolucao_turma", df_evolucao,
+                       use_container_width=True)
+
+        estado_turma = {"versao": versao, "curso": curso_turma,
+                        "ano_ingresso": ano_ingresso}
+
+        def construir_fig_turma():
+            # Gráfico misto linha + barras
+            df_linha = df_evolucao[df_evolucao["Ano da turma"] != "Formados"]
+            df_barra = df_evolucao[df_evolucao["Ano da turma"] == "Formados"]
+
+            fig_turma = go.Figure()
+            if not df_linha.empty:
+                fig_turma.add_trace(go.Scatter(
+                    x=df_linha["Ano civil"],
+                    y=df_linha["Matriculados"],
+                    mode="lines+markers+text",
+                    text=df_linha["Matriculados"],
+                    textposition="top center",
+                    name="Matriculados"
+                ))
+            if not df_barra.empty:
+                fig_turma.add_trace(go.Bar(
+                    x=df_barra["Ano civil"],
+                    y=df_barra["Matriculados"],
+                    text=df_barra["Matriculados"],
+                    textposition="outside",
+                    name="Formados total",
+                    marker_color="lightblue"
+                ))
+                fig_turma.add_trace(go.Bar(
+                    x=df_barra["Ano civil"],
+                    y=df_barra["Formados tempo mínimo"],
+                    text=df_barra["Formados tempo mínimo"],
+                    textposition="inside",
+                    name="Formados em tempo mínimo",
+                    marker_color="blue"
+                ))
+
+            y_max = max(
+                df_evolucao["Matriculados"].max(
+                ) if not df_evolucao["Matriculados"].empty else 0,
+                df_evolucao["Formados tempo mínimo"].max(
+                ) if not df_evolucao["Formados tempo mínimo"].empty else 0
+            ) * 1.1
+
+            fig_turma.update_layout(
+                barmode="overlay",
+                yaxis=dict(range=[0, y_max]),
+                xaxis_title="Ano",
+                yaxis_title="Alunos",
+                legend_title="Legenda"
+            )
+
+            # Adiciona hachura anos pandemia
+            return adicionar_fundo_pandemia(fig_turma)
+        mostrar_figura("fig_turma", estado_turma, construir_fig_turma)
+
+        # NOVO: Curvas de retenção de todas as turmas do curso
+        def construir_fig_curvas():
+            df_curvas = tm.curvas_retencao(
+                load_turmas(versao, df), curso_turma)
+            return px.line(
+                df_curvas,
+                x="Ano da turma",
+                y="Matriculados",
+                color="ano_ingresso",
+                markers=True,
+                labels={"ano_ingresso": "Ano de ingresso",
+                        "Matriculados": "Alunos"}
+            )
+        with st.expander(f"Retenção de todas as turmas de {curso_turma}"):
+            mostrar_figura("fig_curvas", {"versao": versao, "curso": curso_turma},
+                           construir_fig_curvas)
 
 # ---------------------- ABA 6 - EVASÃO ----------------------
-with aba6:
+def aba_evasao():
+    d = dados_aba("evasao", lambda: dados_evasao(
+        versao, versao_evasao, campi, cursos, anos))
+    filtro_evasao = d["filtro_evasao"]
     st.subheader("🚨 Dashboard de Evasão e Entradas por Curso")
     st.warning("""
     **Aviso Importante**
@@ -658,144 +856,208 @@ with aba6:
     DADOS SOMENTE APÓS 2020
 """)
 
-    # Aplica os mesmos filtros do dashboard principal
-    filtro_evasao = df_evasao.copy()
-    if campi:
-        filtro_evasao = filtro_evasao[filtro_evasao["campus"].isin(campi)]
-    if cursos:
-        # O nome do curso em evasao_processos.csv pode não ter grau/turno/campus, então faz um match parcial
-        filtro_evasao = filtro_evasao[
-            filtro_evasao["curso"].apply(lambda x: any(
-                c.split(" (")[0] in x for c in cursos))
-        ]
-    filtro_evasao = filtro_evasao[(filtro_evasao["ano"] >= anos[0]) & (
-        filtro_evasao["ano"] <= anos[1])]
-
     # Gráfico 1: Evasão total por curso
     st.subheader("📊 Evasão total por curso")
-    evasao_total = filtro_evasao.groupby(
-        "curso")["evasao_total"].sum().reset_index()
-    fig1 = px.bar(
-        evasao_total,
-        x="evasao_total",
-        y="curso",
-        orientation="h",
-        title="Evasão total por curso",
-        text="evasao_total"
-    )
-    fig1.update_layout(yaxis={'categoryorder': 'total ascending'})
-    st.plotly_chart(fig1, use_container_width=True)
+
+    def construir_fig1():
+        evasao_total = d["evasao_total"]
+        fig1 = px.bar(
+            evasao_total,
+            x="evasao_total",
+            y="curso",
+            orientation="h",
+            title="Evasão total por curso",
+            text="evasao_total"
+        )
+        fig1.update_layout(yaxis={'categoryorder': 'total ascending'})
+        return fig1
+    mostrar_figura("evasao_fig1", estado_evasao, construir_fig1)
 
     # Gráfico 2: Percentual médio de evasão por curso
     st.subheader("📈 Percentual médio de evasão por curso")
-    perc_total = filtro_evasao.groupby("curso")[
-        ["perc_vest", "perc_sisu", "perc_provare", "perc_total"]].mean().reset_index()
-    # Fixar 2 casas decimais nas colunas de percentual
-    for col in ["perc_vest", "perc_sisu", "perc_provare", "perc_total"]:
-        perc_total[col] = perc_total[col].round(2)
-    fig2 = px.bar(
-        perc_total,
-        x="perc_total",
-        y="curso",
-        orientation="h",
-        title="Percentual médio de evasão total por curso",
-        text=perc_total["perc_total"].map(lambda x: f"{x:.2f}%")
-    )
-    fig2.update_layout(yaxis={'categoryorder': 'total ascending'})
-    st.plotly_chart(fig2, use_container_width=True)
+
+    def construir_fig2():
+        perc_total = d["perc_total"]
+        fig2 = px.bar(
+            perc_total,
+            x="perc_total",
+            y="curso",
+            orientation="h",
+            title="Percentual médio de evasão total por curso",
+            text=perc_total["perc_total"].map(lambda x: f"{x:.2f}%")
+        )
+        fig2.update_layout(yaxis={'categoryorder': 'total ascending'})
+        return fig2
+    mostrar_figura("evasao_fig2", estado_evasao, construir_fig2)
 
     # Gráfico 3: Distribuição percentual de evasão por tipo em um curso específico
     if not filtro_evasao.empty:
-        curso_sel = filtro_evasao["curso"].iloc[0]
+        curso_sel = d["curso_sel"]
         st.subheader(
             f"🥧 Distribuição percentual de evasão por tipo no curso {curso_sel}")
-        df_curso = filtro_evasao[filtro_evasao["curso"] == curso_sel]
-        df_curso_long = df_curso.melt(
-            id_vars=["ano", "campus", "curso"],
-            value_vars=["perc_vest", "perc_sisu", "perc_provare"],
-            var_name="tipo_ingresso",
-            value_name="percentual"
-        )
-        dist_tipo = df_curso_long.groupby("tipo_ingresso")[
-            "percentual"].mean().reset_index()
-        dist_tipo["percentual"] = dist_tipo["percentual"].round(2)
-        fig3 = px.pie(
-            dist_tipo,
-            names="tipo_ingresso",
-            values="percentual",
-            title=f"Distribuição percentual de evasão no curso {curso_sel}",
-            hole=0.3
-        )
-        fig3.update_traces(textinfo='percent+label', texttemplate='%{label}: %{percent:.2%}')
-        st.plotly_chart(fig3, use_container_width=True)
+
+        def construir_fig3():
+            dist_tipo = d["dist_tipo"]
+            fig3 = px.pie(
+                dist_tipo,
+                names="tipo_ingresso",
+                values="percentual",
+                title=f"Distribuição percentual de evasão no curso {curso_sel}",
+                hole=0.3
+            )
+            fig3.update_traces(textinfo='percent+label', texttemplate='%{label}: %{percent:.2%}')
+            return fig3
+        mostrar_figura("evasao_fig3", estado_evasao, construir_fig3)
 
     # Gráfico 4: Evolução de entradas vs evadidos por modalidade ao longo do tempo
     st.subheader("📊 Evolução de entradas vs evadidos por modalidade")
-    evasao_ano = filtro_evasao.groupby("ano")[["entradas_vest", "entradas_sisu", "entradas_provare",
-                                               "evasao_vest", "evasao_sisu", "evasao_provare"]].sum().reset_index()
-    evasao_ano["vest_nao_evadidos"] = evasao_ano["entradas_vest"] - \
-        evasao_ano["evasao_vest"]
-    evasao_ano["sisu_nao_evadidos"] = evasao_ano["entradas_sisu"] - \
-        evasao_ano["evasao_sisu"]
-    evasao_ano["provare_nao_evadidos"] = evasao_ano["entradas_provare"] - \
-        evasao_ano["evasao_provare"]
-    df_long = pd.melt(
-        evasao_ano,
-        id_vars=["ano"],
-        value_vars=["vest_nao_evadidos", "evasao_vest",
-                    "sisu_nao_evadidos", "evasao_sisu",
-                    "provare_nao_evadidos", "evasao_provare"],
-        var_name="tipo",
-        value_name="quantidade"
-    )
-    df_long["modalidade"] = df_long["tipo"].apply(
-        lambda x: "Vestibular" if "vest" in x else ("SISU" if "sisu" in x else "Provare"))
-    df_long["status"] = df_long["tipo"].apply(
-        lambda x: "Não Evadidos" if "nao_evadidos" in x else "Evadidos")
-    fig4 = px.bar(
-        df_long,
-        x="ano",
-        y="quantidade",
-        color="status",
-        facet_col="modalidade",
-        category_orders={"status": ["Não Evadidos", "Evadidos"]},
-        title="Evolução das entradas vs evadidos por modalidade",
-        labels={"quantidade": "Número de alunos", "ano": "Ano"}
-    )
-    st.plotly_chart(fig4, use_container_width=True)
+
+    def construir_fig4():
+        df_long = d["df_long"]
+        return px.bar(
+            df_long,
+            x="ano",
+            y="quantidade",
+            color="status",
+            facet_col="modalidade",
+            category_orders={"status": ["Não Evadidos", "Evadidos"]},
+            title="Evolução das entradas vs evadidos por modalidade",
+            labels={"quantidade": "Número de alunos", "ano": "Ano"}
+        )
+    mostrar_figura("evasao_fig4", estado_evasao, construir_fig4)
 
     # NOVO: Tabela de totais de evasão por tipo de ingresso e total geral, e totais de entradas
     st.subheader(
         "📋 Total de Entradas e Evasão por Tipo de Ingresso e Total Geral")
-    totais = {
-        "Vestibular": {
-            "Entradas": filtro_evasao["entradas_vest"].sum(),
-            "Evasão": filtro_evasao["evasao_vest"].sum()
-        },
-        "SISU": {
-            "Entradas": filtro_evasao["entradas_sisu"].sum(),
-            "Evasão": filtro_evasao["evasao_sisu"].sum()
-        },
-        "Provare": {
-            "Entradas": filtro_evasao["entradas_provare"].sum(),
-            "Evasão": filtro_evasao["evasao_provare"].sum()
-        },
-        "Total Geral": {
-            "Entradas": filtro_evasao[["entradas_vest", "entradas_sisu", "entradas_provare"]].sum().sum(),
-            "Evasão": filtro_evasao["evasao_total"].sum()
-        }
-    }
-    df_totais = pd.DataFrame([
-        {"Tipo de Ingresso": k,
-            "Total de Entradas": v["Entradas"], "Total de Evasão": v["Evasão"]}
-        for k, v in totais.items()
-    ])
-    # Se quiser mostrar percentual de evasão sobre entradas:
-    df_totais["% Evasão/Entradas"] = df_totais.apply(
-        lambda row: f"{(row['Total de Evasão']/row['Total de Entradas']*100):.2f}%" if row['Total de Entradas'] > 0 else "-", axis=1
-    )
-    st.dataframe(df_totais, use_container_width=True)
+    mostrar_tabela("totais_evasao", d["df_totais"], use_container_width=True)
 
     # Tabela final
     st.subheader("📑 Dados de evasão filtrados")
-    st.dataframe(filtro_evasao, use_container_width=True)
+    tabelas.tabela_paginada(filtro_evasao, "evasao_filtrada",
+                            nome_arquivo="evasao_filtrada.csv",
+                            perfil_execucao=perfil_execucao)
+
+    sem_par = cursos_sem_correspondencia(mapa_evasao)
+    if not sem_par.empty:
+        with st.expander(f"Cursos de evasão sem correspondência no saida.csv ({len(sem_par)})"):
+            st.caption("Estes cursos não entram no filtro por Curso.")
+            mostrar_tabela("sem_correspondencia", sem_par,
+                           use_container_width=True, hide_index=True)
+
+
+# ---------------------------------------
+# 6) Renderização das abas
+# ---------------------------------------
+ABAS = {
+    "📊 Visão Geral": aba_visao_geral,
+    "📝 Inscrições": aba_inscricoes,
+    "📂 Dados Brutos": aba_dados_brutos,
+    "📈 Matriculados por curso": aba_matriculados,
+    "🎯 Turma": aba_turma,
+    "🚨 Evasão": aba_evasao,
+}
+
+# Dados que podem ser calculados antes de a aba ser aberta: o estado dos
+# filtros de que dependem e o cálculo
+PRE_CARGA_ABAS = {
+    "📊 Visão Geral": (estado_filtros, lambda: dados_visao_geral(
+        versao, filtros_curso, anos)),
+    "📝 Inscrições": (estado_filtros, lambda: dados_inscricoes(
+        versao, filtros_curso, anos)),
+    "📈 Matriculados por curso": (estado_filtros, lambda: dados_matriculados(
+        versao, filtros_curso, anos)),
+    "🚨 Evasão": (estado_evasao, lambda: dados_evasao(
+        versao, versao_evasao, campi, cursos, anos)),
+}
+
+LIMITE_PRE_CARGAS = 256
+
+
+# Pré-cargas pedidas pelas sessões do processo, por aba e estado dos
+# filtros (LRU). Uma que ainda está no pool ou que terminou sem erro (cache
+# da aba quente) não é pedida de novo; se a agregação já saiu do cache,
+# a aba só a recalcula quando for aberta.
+@st.cache_resource
+def load_pre_cargas():
+    return OrderedDict(), threading.Lock()
+
+
+def pre_carregar(nome):
+    # Aquece o cache da aba no pool das figuras; a renderização continua
+    # sendo feita só quando a aba é aberta
+    if nome not in PRE_CARGA_ABAS:
+        return None
+    estado, calcular = PRE_CARGA_ABAS[nome]
+    chave = figuras.chave_figura(f"pre_carga:{nome}", **estado)
+
+    def calcular_medido():
+        with perfil_execucao.trecho(f"pre_carga:{nome}", "agregacao"):
+            calcular()
+
+    pedidas, trava = load_pre_cargas()
+    with trava:
+        futuro = pedidas.get(chave)
+        if futuro is not None and not (futuro.done() and futuro.exception()):
+            pedidas.move_to_end(chave)
+            return futuro
+        futuro = pedidas[chave] = submeter(calcular_medido)
+        futuro.add_done_callback(registrar_falha(f"pre_carga:{nome}"))
+        while len(pedidas) > LIMITE_PRE_CARGAS:
+            pedidas.popitem(last=False)
+    return futuro
+
+
+nomes_abas = list(ABAS)
+
+
+# Fragmento: trocar de aba reexecuta só a aba escolhida, não o script todo
+@st.fragment
+def abas_sob_demanda_fragmento():
+    inicio_fragmento("abas")
+    aba_ativa = st.radio("Aba", nomes_abas, horizontal=True,
+                         key="aba_ativa", label_visibility="collapsed")
+    with perfil_execucao.trecho(f"aba:{aba_ativa}", "aba"), grupo_figuras():
+        ABAS[aba_ativa]()
+    if pre_carga:
+        proxima = nomes_abas[(nomes_abas.index(aba_ativa) + 1) % len(nomes_abas)]
+        pre_carregar(proxima)
+
+
+if abas_sob_demanda:
+    # Só a aba escolhida é calculada e renderizada
+    abas_sob_demanda_fragmento()
+else:
+    if figuras_paralelas:
+        # Abas que agregam antes das figuras: as agregações também vão para
+        # o pool, e a aba espera só a sua (as outras abas agregam dentro das
+        # próprias figuras)
+        for nome in ["📊 Visão Geral", "🚨 Evasão"]:
+            pre_carregar(nome)
+    for aba, (nome, renderizar) in zip(st.tabs(nomes_abas), ABAS.items()):
+        with aba, perfil_execucao.trecho(f"aba:{nome}", "aba"):
+            renderizar()
+    emitir_figuras(grupos_figuras[0])
+
+perfil_execucao.fechar(trecho_script)
+
+# ---------------------------------------
+# 7) Painel de desempenho
+# ---------------------------------------
+# Trechos desta execução; a exportação leva todos os guardados na sessão,
+# inclusive os das reexecuções só de fragmento (troca de aba, turma) e da
+# pré-carga em segundo plano.
+if perfil_execucao.ativo:
+    with st.sidebar.expander("Desempenho da execução", expanded=True):
+        st.caption(f"Execução {perfil_execucao.execucao}: "
+                   f"{trecho_script.duracao_ns / 1e6:.1f} ms")
+        st.dataframe(perfil_execucao.tabela(perfil_execucao.execucao),
+                     hide_index=True, use_container_width=True,
+                     column_config={
+                         "ms": st.column_config.NumberColumn(format="%.1f")})
+        st.download_button("Exportar JSON lines", perfil_execucao.para_jsonl(),
+                           file_name="perfil.jsonl",
+                           mime="application/x-ndjson", on_click="ignore")
+        st.download_button("Exportar trace do Chrome",
+                           perfil_execucao.para_chrome(),
+                           file_name="perfil.trace.json",
+                           mime="application/json", on_click="ignore")
@@ -0,0 +1,270 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import analise
+import cubo as cb
+import turmas as tm
+from dados import (VERSAO_PREPARO, caminho_snapshot, carregar_com_snapshot,
+                   preparar_evasao, preparar_saida)
+
+# ---------------------------------------
+# Medição das etapas do dashboard com dados sintéticos
+# ---------------------------------------
+# python desempenho.py [fator ...]             (padrão: 10 100 1000)
+# python desempenho.py comparar antes.json depois.json
+#
+# Gera saida.csv e evasao_processos.csv sintéticos FATOR vezes maiores que
+# os reais (cada cópia com os campi renomeados e os descritores de curso
+# com um polo a mais, como se fossem outras universidades do sistema
+# estadual: as regex de descritor rodam sobre FATOR vezes mais textos
+# distintos) e mede cada etapa separadamente: a preparação do CSV, a
+# abertura do snapshot, o cubo e as estruturas derivadas, os filtros
+# laterais, as agregações de cada aba e as turmas.
+#
+# Cada etapa é medida duas vezes: o tempo (mediana das repetições, sem
+# tracemalloc) e o pico de memória alocada pelo Python e pelo NumPy
+# (tracemalloc; os buffers do Arrow e os arquivos mapeados ficam de fora).
+# O resultado vai para PASTA_RESULTADOS/<data>-<commit>.json; comparar
+# aponta as etapas que ficaram mais lentas ou maiores que LIMIAR_REGRESSAO.
+
+FATORES = [10, 100, 1000]
+RODADAS = 20
+REPETICOES = 3
+PASTA_RESULTADOS = "desempenho"
+LIMIAR_REGRESSAO = 1.2
+
+
+# ---------------------------------------
+# Dados sintéticos
+# ---------------------------------------
+
+def _ler_texto(caminho):
+    # Tudo como texto, vazios como estão: a cópia sai igual ao original
+    df = pd.read_csv(caminho, dtype=str, keep_default_na=False)
+    df.columns = ["" if col.startswith("Unnamed: ") else col
+                  for col in df.columns]
+    return df
+
+
+def _copia(df, i, descritor=None):
+    if i == 0:
+        return df
+    copia = df.copy()
+    preenchido = copia["campus"] != ""
+    copia.loc[preenchido, "campus"] = copia.loc[preenchido, "campus"] + f"-{i}"
+    if descritor is not None:
+        preenchido = copia[descritor] != ""
+        copia.loc[preenchido, descritor] = (
+            copia.loc[preenchido, descritor] + f" - polo {i}")
+    return copia
+
+
+def gerar_csvs(pasta, fator, saida="saida.csv",
+               evasao="evasao_processos.csv"):
+    # Grava as cópias uma a uma, sem montar o arquivo inteiro na memória
+    caminhos = []
+    for origem, descritor in ((saida, "curso"), (evasao, None)):
+        df = _ler_texto(origem)
+        destino = os.path.join(pasta, os.path.basename(origem))
+        with open(destino, "w", encoding="utf-8", newline="") as f:
+            for i in range(fator):
+                _copia(df, i, descritor).to_csv(f, index=False, header=i == 0)
+        caminhos.append(destino)
+    return caminhos
+
+
+# ---------------------------------------
+# Medição
+# ---------------------------------------
+
+def medir(funcao, repeticoes=REPETICOES, antes=None):
+    # (mediana do tempo em s, pico de memória em bytes); antes() roda antes
+    # de cada chamada, fora da medição
+    tempos = []
+    for _ in range(repeticoes):
+        if antes is not None:
+            antes()
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    if antes is not None:
+        antes()
+    tracemalloc.start()
+    try:
+        funcao()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return statistics.median(tempos), pico
+
+
+def selecoes(indice, rodadas=RODADAS, semente=0):
+    # Estados aleatórios dos filtros laterais, como em cubo.conferir_paridade
+    rng = np.random.default_rng(semente)
+    anos_validos = indice.opcoes("ano")
+    for _ in range(rodadas):
+        filtros = {}
+        for col in ["campus", "grau", "turno", "curso_nome"]:
+            opcoes = indice.opcoes(col)
+            k = int(rng.integers(0, min(3, len(opcoes)) + 1))
+            filtros[col] = list(rng.choice(opcoes, k, replace=False))
+        anos = tuple(int(a) for a in sorted(rng.choice(anos_validos, 2)))
+        yield filtros, anos
+
+
+def _filtros_laterais(indice, filtros):
+    # O que a barra lateral calcula a cada execução do script
+    base = {col: filtros[col] for col in ["campus", "grau", "turno"]}
+    indice.opcoes("curso_nome", indice.selecionar(base))
+    analise.limites_anos(indice, filtros)
+
+
+def medir_fator(pasta, fator, rodadas=RODADAS, progresso=None):
+    caminho_saida, caminho_evasao = gerar_csvs(pasta, fator)
+    snap = caminho_snapshot(caminho_saida)
+    linhas = []
+
+    def registrar(etapa, funcao, repeticoes=REPETICOES, antes=None,
+                  chamadas=1):
+        if progresso is not None:
+            progresso(f"{fator}x {etapa}")
+        tempo, pico = medir(funcao, repeticoes, antes)
+        linhas.append({"fator": fator, "etapa": etapa,
+                       "tempo_s": tempo / chamadas, "pico_bytes": pico,
+                       "chamadas": chamadas})
+
+    def sem_snapshot():
+        if os.path.exists(snap):
+            os.remove(snap)
+
+    registrar("preparar_saida",
+              lambda: carregar_com_snapshot(caminho_saida, preparar_saida),
+              repeticoes=1, antes=sem_snapshot)
+    registrar("abrir_snapshot",
+              lambda: carregar_com_snapshot(caminho_saida, preparar_saida))
+    df = carregar_com_snapshot(caminho_saida, preparar_saida)
+    df_evasao = carregar_com_snapshot(caminho_evasao, preparar_evasao)
+
+    registrar("cubo", lambda: cb.construir_cubo(df))
+    cubo = cb.construir_cubo(df)
+    registrar("estruturas", lambda: analise.montar_base(df, df_evasao, cubo))
+    base = analise.montar_base(df, df_evasao, cubo)
+
+    estados = list(selecoes(base.indice, rodadas))
+    registrar("filtros_laterais",
+              lambda: [_filtros_laterais(base.indice, f) for f, _ in estados],
+              chamadas=len(estados))
+    for nome, analisar in analise.ANALISES.items():
+        registrar(nome, lambda analisar=analisar: [
+            analisar(base, f, a) for f, a in estados], chamadas=len(estados))
+
+    registrar("turmas", lambda: tm.construir_turmas(df))
+    turmas = tm.construir_turmas(df)
+    # A aba Turma mostra um curso por vez: mede-se uma amostra deles
+    rng = np.random.default_rng(0)
+    cursos = turmas.index.unique("curso_nome")
+    primeiras = [(curso, int(turmas.loc[curso].index[0]))
+                 for curso in rng.choice(cursos, min(rodadas, len(cursos)),
+                                         replace=False)]
+    registrar("turma_por_curso", lambda: [
+        (tm.evolucao_turma(turmas, curso, ano),
+         tm.curvas_retencao(turmas, curso)) for curso, ano in primeiras],
+        chamadas=len(primeiras))
+
+    linhas_csv = {"linhas_saida": len(df), "linhas_evasao": len(df_evasao),
+                  "linhas_cubo": len(cubo),
+                  "bytes_saida": os.path.getsize(caminho_saida)}
+    return [{**linha, **linhas_csv} for linha in linhas]
+
+
+def commit_atual():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "sem-git"
+
+
+def executar(fatores=FATORES, rodadas=RODADAS, progresso=None):
+    resultados = []
+    for fator in fatores:
+        with tempfile.TemporaryDirectory() as pasta:
+            resultados += medir_fator(pasta, fator, rodadas, progresso)
+    return {
+        "meta": {
+            "commit": commit_atual(),
+            "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "versao_preparo": VERSAO_PREPARO,
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "pyarrow": pa.__version__,
+            "maquina": platform.machine(),
+            "cpus": os.cpu_count(),
+            "rodadas": rodadas,
+            "repeticoes": REPETICOES,
+        },
+        "resultados": resultados,
+    }
+
+
+def gravar(relatorio, pasta=PASTA_RESULTADOS):
+    os.makedirs(pasta, exist_ok=True)
+    meta = relatorio["meta"]
+    caminho = os.path.join(
+        pasta, f"{meta['data'].replace(':', '')}-{meta['commit']}.json")
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, indent=1)
+    return caminho
+
+
+def tabela(relatorio):
+    df = pd.DataFrame(relatorio["resultados"])
+    df["tempo_ms"] = df["tempo_s"] * 1000
+    df["pico_mb"] = df["pico_bytes"] / 2**20
+    return df[["fator", "etapa", "tempo_ms", "pico_mb", "chamadas"]]
+
+
+def comparar(antes, depois, limiar=LIMIAR_REGRESSAO):
+    chaves = ["fator", "etapa"]
+    juntos = tabela(antes).merge(tabela(depois), on=chaves,
+                                 suffixes=("_antes", "_depois"))
+    juntos["razao_tempo"] = juntos["tempo_ms_depois"] / juntos[
+        "tempo_ms_antes"]
+    juntos["razao_pico"] = juntos["pico_mb_depois"] / juntos["pico_mb_antes"]
+    juntos["regressao"] = ((juntos["razao_tempo"] > limiar)
+                           | (juntos["razao_pico"] > limiar))
+    return juntos[chaves + ["tempo_ms_antes", "tempo_ms_depois",
+                            "razao_tempo", "pico_mb_antes", "pico_mb_depois",
+                            "razao_pico", "regressao"]]
+
+
+if __name__ == "__main__":
+    pd.set_option("display.width", 200)
+    if sys.argv[1:2] == ["comparar"]:
+        with open(sys.argv[2], encoding="utf-8") as f:
+            antes = json.load(f)
+        with open(sys.argv[3], encoding="utf-8") as f:
+            depois = json.load(f)
+        resultado = comparar(antes, depois)
+        print(f"{antes['meta']['commit']} -> {depois['meta']['commit']}")
+        print(resultado.round(2).to_string(index=False))
+        sys.exit(1 if resultado["regressao"].any() else 0)
+
+    fatores = [int(f) for f in sys.argv[1:]] or FATORES
+    relatorio = executar(fatores, progresso=lambda texto:
+                         print(f"  {texto}", flush=True))
+    print(tabela(relatorio).round(2).to_string(index=False))
+    print(f"Resultados em {gravar(relatorio)}")
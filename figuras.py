@@ -0,0 +1,82 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import plotly.graph_objects as go
+import plotly.io as pio
+
+# ---------------------------------------
+# Cache de figuras por estado dos filtros
+# ---------------------------------------
+# Guarda o JSON de cada figura já construída, pela chave canônica (figura,
+# versão dos dados, filtros). Sessões com os mesmos filtros, ou a mesma
+# sessão voltando a um estado anterior, recebem a figura sem refazer as
+# agregações nem o Plotly Express. O cache é do processo (compartilhado
+# entre as sessões), com descarte LRU e limite de bytes do JSON guardado.
+#
+# A figura é remontada do JSON sem a validação do Plotly (_validate=False):
+# o JSON saiu de uma figura já validada, e remontar validando custa quase
+# tanto quanto construir de novo. Toda figura passa pelo JSON, inclusive na
+# primeira vez, para o st.plotly_chart receber sempre a mesma especificação.
+
+LIMITE_BYTES = 32 * 2**20
+
+
+def chave_figura(figura, **estado):
+    # Seleções (listas) valem pelo conjunto, não pela ordem em que foram
+    # marcadas; intervalos (tuplas) mantêm a ordem
+    canonico = {
+        nome: sorted(map(str, valor)) if isinstance(valor, (list, set))
+        else list(valor) if isinstance(valor, tuple) else valor
+        for nome, valor in estado.items()
+    }
+    texto = json.dumps([figura, canonico], sort_keys=True, default=str)
+    return hashlib.sha256(texto.encode()).hexdigest()
+
+
+class CacheFiguras:
+    def __init__(self, limite_bytes=LIMITE_BYTES):
+        self.limite_bytes = limite_bytes
+        self.bytes = 0
+        self.acertos = 0
+        self.faltas = 0
+        self._specs = OrderedDict()
+        self._trava = threading.Lock()
+
+    def __len__(self):
+        return len(self._specs)
+
+    def figura(self, chave, construir):
+        with self._trava:
+            spec = self._specs.get(chave)
+            if spec is not None:
+                self._specs.move_to_end(chave)
+                self.acertos += 1
+        if spec is None:
+            spec = pio.to_json(construir(), validate=False)
+            self._guardar(chave, spec)
+        return go.Figure(json.loads(spec), _validate=False)
+
+    def tamanho(self, chave):
+        # Bytes do JSON guardado da figura (None fora do cache)
+        with self._trava:
+            spec = self._specs.get(chave)
+        return None if spec is None else len(spec)
+
+    def _guardar(self, chave, spec):
+        tamanho = len(spec)
+        with self._trava:
+            self.faltas += 1
+            if tamanho > self.limite_bytes or chave in self._specs:
+                return
+            self._specs[chave] = spec
+            self.bytes += tamanho
+            while self.bytes > self.limite_bytes:
+                _, antiga = self._specs.popitem(last=False)
+                self.bytes -= len(antiga)
+
+    def limpar(self):
+        with self._trava:
+            self._specs.clear()
+            self.bytes = 0
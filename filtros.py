@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+# ---------------------------------------
+# Índice dos filtros laterais
+# ---------------------------------------
+# Para cada coluna filtrável guarda os códigos categóricos (factorize
+# ordenado) e, para cada valor, a lista ordenada das posições das linhas que
+# o contêm. Uma seleção vira união das listas dentro de cada coluna e
+# interseção entre colunas; o DataFrame filtrado sai de um único take.
+
+COLUNAS_FILTRO = ["campus", "grau", "turno", "curso_nome", "ano"]
+
+
+class IndiceFiltros:
+    def __init__(self, df, colunas=COLUNAS_FILTRO):
+        self.n_linhas = len(df)
+        self.codigos = {}
+        self.valores = {}
+        self.posicoes = {}
+        for col in colunas:
+            codigos, valores = pd.factorize(df[col], sort=True)
+            ordem = np.argsort(codigos, kind="stable")
+            limites = np.searchsorted(
+                codigos[ordem], np.arange(len(valores) + 1))
+            self.codigos[col] = codigos
+            self.valores[col] = valores
+            # Linhas com valor nulo (código -1) ficam fora de todas as listas
+            self.posicoes[col] = [
+                ordem[limites[i]:limites[i + 1]] for i in range(len(valores))
+            ]
+
+    def opcoes(self, coluna, posicoes=None):
+        # Valores distintos (ordenados, sem nulos) dentro das posições dadas
+        if posicoes is None:
+            return list(self.valores[coluna])
+        codigos = np.unique(self.codigos[coluna][posicoes])
+        return list(self.valores[coluna][codigos[codigos >= 0]])
+
+    def _posicoes_valores(self, coluna, selecionados):
+        valores = self.valores[coluna]
+        idx = valores.get_indexer(pd.Index(list(selecionados)))
+        listas = [self.posicoes[coluna][i] for i in idx if i >= 0]
+        if not listas:
+            return np.empty(0, dtype=np.intp)
+        return np.sort(np.concatenate(listas))
+
+    def _posicoes_intervalo(self, coluna, inicio, fim):
+        valores = self.valores[coluna]
+        ini = valores.searchsorted(inicio, side="left")
+        fim = valores.searchsorted(fim, side="right")
+        listas = self.posicoes[coluna][ini:fim]
+        if not listas:
+            return np.empty(0, dtype=np.intp)
+        return np.sort(np.concatenate(listas))
+
+    def selecionar(self, filtros=None, intervalos=None):
+        # filtros: {coluna: valores}, seleção vazia não filtra (como no isin
+        # condicional do dashboard); intervalos: {coluna: (inicio, fim)}
+        resultado = None
+        conjuntos = [
+            self._posicoes_valores(col, sel)
+            for col, sel in (filtros or {}).items() if sel
+        ]
+        conjuntos += [
+            self._posicoes_intervalo(col, ini, fim)
+            for col, (ini, fim) in (intervalos or {}).items()
+        ]
+        for posicoes in sorted(conjuntos, key=len):
+            if resultado is None:
+                resultado = posicoes
+            else:
+                resultado = np.intersect1d(
+                    resultado, posicoes, assume_unique=True)
+        if resultado is None:
+            return np.arange(self.n_linhas)
+        return resultado
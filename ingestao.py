@@ -0,0 +1,417 @@
+import io
+import multiprocessing as mp
+import os
+import shutil
+import sys
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import cubo as cb
+from dados import (ESQUEMA_EVASAO, ESQUEMA_SAIDA, VERSAO_PREPARO,
+                   abrir_snapshot, caminho_quarentena, caminho_snapshot,
+                   caminho_temporario, compactar,
+                   gravar_quarentena, gravar_tabelas, gravar_validacao,
+                   hash_arquivo, ler_meta_snapshot, ler_validacao,
+                   menor_inteiro, meta_csv, opcoes_leitura,
+                   preparar_evasao, preparar_saida, tipar_saida, validar)
+
+# ---------------------------------------
+# Ingestão em blocos de extrações grandes
+# ---------------------------------------
+# Para CSVs maiores que dados.LIMITE_LEITURA_INTEIRA o arquivo é lido em
+# blocos de LINHAS_POR_BLOCO linhas. Cada bloco é validado pelo esquema do
+# CSV (as linhas rejeitadas vão para a quarentena), recebe as colunas
+# derivadas (tipar_saida só olha a própria linha) e é gravado num arquivo
+# Arrow temporário com tipos largos (float64/texto). A compactação
+# (categorias, inteiros menores) depende do arquivo inteiro: a primeira
+# passada acumula, por coluna, os valores distintos de texto e os extremos
+# dos números, e a segunda relê o temporário por memory-map, converte lote a
+# lote para o esquema compacto e grava o snapshot. A memória da publicação
+# fica limitada a um bloco mais os valores distintos das colunas de texto, e
+# o snapshot já sai com os mesmos tipos de compactar(): abri-lo é só a
+# leitura mapeada.
+#
+# O cubo de saida.csv é dobrado bloco a bloco (cubo.combinar_cubos) e
+# publicado ao lado do snapshot, para o dashboard não precisar agregar as
+# linhas de novo.
+#
+# Quando o CSV de um snapshot publicado só ganhou linhas no fim (um ano novo
+# acrescentado), publicar_anexo prepara apenas essas linhas: os lotes da
+# tabela publicada são relidos (alargados) como primeiros blocos e o cubo
+# antigo é combinado com o das linhas novas. Qualquer mudança nas linhas
+# anteriores leva à preparação completa.
+
+LINHAS_POR_BLOCO = 20_000
+
+# Esquema, colunas derivadas e agregado (cubo) de cada CSV
+INGESTAO = {
+    preparar_saida: (ESQUEMA_SAIDA, tipar_saida, cb.construir_cubo),
+    preparar_evasao: (ESQUEMA_EVASAO, None, None),
+}
+
+
+def caminho_cubo(caminho_csv):
+    base, _ = os.path.splitext(caminho_csv)
+    return f"{base}.cubo.arrow"
+
+
+# Tipos do snapshot fixados pelo primeiro bloco: números em float64 (um
+# bloco com nulos numa coluna inteira vira float) e o resto texto
+def _esquema(bloco):
+    return pa.schema([
+        (col, pa.float64() if pd.api.types.is_numeric_dtype(bloco[col])
+         else pa.string())
+        for col in bloco.columns
+    ])
+
+
+# Lote publicado (compacto) com os mesmos tipos largos dos blocos
+def _largo(tabela):
+    return pa.table({
+        nome: col.cast(
+            pa.float64() if pa.types.is_integer(col.type)
+            or pa.types.is_floating(col.type) else pa.string())
+        for nome, col in zip(tabela.column_names, tabela.columns)
+    })
+
+
+# Acumula em resumo, para cada coluna da tabela larga, os valores distintos
+# (texto) ou [só inteiros?, extremos] (números)
+def _resumir(resumo, tabela):
+    for nome, col in zip(tabela.column_names, tabela.columns):
+        if pa.types.is_string(col.type):
+            resumo.setdefault(nome, set()).update(
+                pc.unique(col).drop_null().to_pylist())
+            continue
+        inteiros, extremos = resumo.setdefault(nome, [True, []])
+        validos = col.drop_null()
+        if not len(validos):
+            continue
+        if inteiros and not pc.all(
+                pc.equal(validos, pc.floor(validos))).as_py():
+            resumo[nome][0] = False
+        limites = pc.min_max(validos)
+        extremos += [limites["min"].as_py(), limites["max"].as_py()]
+
+
+# Esquema compacto (com os metadados do pandas, que guardam Int16 etc.) e o
+# dicionário de cada coluna de texto, decididos como em compactar()
+def _esquema_compacto(esquema_largo, resumo):
+    modelo, dicionarios = {}, {}
+    for campo in esquema_largo:
+        if campo.name.startswith("Unnamed:"):
+            continue
+        valores = resumo.get(campo.name)
+        if pa.types.is_string(campo.type):
+            categorias = sorted(valores or ())
+            dicionarios[campo.name] = pa.array(categorias, pa.string())
+            modelo[campo.name] = pd.Categorical([], categories=categorias)
+            continue
+        inteiros, extremos = valores or (True, [])
+        tipo = (menor_inteiro(pd.Series(extremos, dtype="float64"))
+                if inteiros else None)
+        modelo[campo.name] = pd.Series([], dtype=tipo or "float64")
+    esquema = pa.Schema.from_pandas(pd.DataFrame(modelo), preserve_index=False)
+    # Sem categorias o pandas não informa o tipo dos valores do dicionário
+    esquema = pa.schema([
+        campo.with_type(pa.dictionary(campo.type.index_type, pa.string()))
+        if campo.name in dicionarios else campo
+        for campo in esquema
+    ], metadata=esquema.metadata)
+    return esquema, dicionarios
+
+
+def _compactar_lote(lote, esquema, dicionarios):
+    colunas = []
+    for campo in esquema:
+        col = lote.column(campo.name)
+        if campo.name in dicionarios:
+            dicionario = dicionarios[campo.name]
+            col = pa.DictionaryArray.from_arrays(
+                pc.index_in(col, value_set=dicionario).cast(
+                    campo.type.index_type), dicionario)
+        else:
+            col = col.cast(campo.type)
+        colunas.append(col)
+    return pa.Table.from_arrays(colunas, schema=esquema)
+
+
+# Devolve (bloco tipado, linhas rejeitadas, relatório). inicio > 0: só as linhas a
+# partir desse byte, lidas com o cabeçalho do arquivo; primeira_linha é a
+# linha do arquivo onde elas começam.
+def ler_blocos(caminho_csv, esquema, tipar, linhas_por_bloco=LINHAS_POR_BLOCO,
+               progresso=None, inicio=0, primeira_linha=2):
+    with open(caminho_csv, "rb") as arquivo:
+        fonte = arquivo
+        if inicio:
+            cabecalho = arquivo.readline()
+            arquivo.seek(inicio)
+            fonte = io.BytesIO(cabecalho + arquivo.read())
+        tamanho = fonte.seek(0, io.SEEK_END) or 1
+        fonte.seek(0)
+        linha = primeira_linha
+        for i, bloco in enumerate(pd.read_csv(
+                fonte, chunksize=linhas_por_bloco,
+                **opcoes_leitura(esquema))):
+            tipado, rejeitadas, relatorio = validar(bloco, esquema, linha)
+            linha += len(bloco)
+            yield ((tipado if tipar is None else tipar(tipado)), rejeitadas,
+                   relatorio)
+            if progresso is not None:
+                progresso(min(fonte.tell() / tamanho, 1.0),
+                          f"{os.path.basename(caminho_csv)}: "
+                          f"{i + 1} blocos lidos")
+
+
+# base: (snapshot já publicado, cubo dele, byte onde ele termina no CSV,
+# validação dele); só as linhas depois desse byte são lidas
+def publicar_em_blocos(caminho_csv, preparar, progresso=None,
+                       linhas_por_bloco=LINHAS_POR_BLOCO, base=None):
+    esquema_csv, tipar, agregar = INGESTAO[preparar]
+    meta = {**meta_csv(caminho_csv), "em_blocos": True}
+    snap_base, cubo, inicio, validacao = base or (None, None, 0, None)
+    esquema, resumo = None, {}
+    # Tudo é gravado em temporários deste processo e só trocado no fim: os
+    # outros processos que publicam o mesmo CSV não esbarram nestes
+    # arquivos
+    snap = caminho_snapshot(caminho_csv)
+    largo = caminho_temporario(f"{snap}.largo")
+    pendente = caminho_temporario(f"{snap}.blocos")
+    quarentena = caminho_temporario(caminho_quarentena(caminho_csv))
+    if validacao is None:
+        validacao = {"linhas": 0, "rejeitadas": 0, "colunas": None}
+    elif os.path.exists(caminho_quarentena(caminho_csv)):
+        shutil.copyfile(caminho_quarentena(caminho_csv), quarentena)
+
+    def largas():
+        nonlocal esquema
+        if snap_base is not None:
+            with pa.memory_map(snap_base, "r") as fonte:
+                leitor = pa.ipc.open_file(fonte)
+                for i in range(leitor.num_record_batches):
+                    tabela = _largo(pa.Table.from_batches(
+                        [leitor.get_batch(i)]))
+                    esquema = esquema or tabela.schema
+                    yield tabela
+        for bloco in blocos():
+            esquema = esquema or _esquema(bloco)
+            yield pa.Table.from_pandas(bloco, schema=esquema,
+                                       preserve_index=False)
+
+    def blocos():
+        nonlocal cubo
+        for bloco, rejeitadas, relatorio in ler_blocos(
+                caminho_csv, esquema_csv, tipar, linhas_por_bloco, progresso,
+                inicio, validacao["linhas"] + 2):
+            validacao["linhas"] += len(bloco) + len(rejeitadas)
+            validacao["rejeitadas"] += len(rejeitadas)
+            if validacao["colunas"] is not None:
+                relatorio[["vazios", "rejeitados"]] += validacao["colunas"][
+                    ["vazios", "rejeitados"]]
+            validacao["colunas"] = relatorio
+            if len(rejeitadas):
+                rejeitadas.to_csv(quarentena, mode="a", index=False,
+                                  header=not os.path.exists(quarentena))
+            if agregar is not None:
+                parcial = agregar(bloco)
+                cubo = (parcial if cubo is None
+                        else cb.combinar_cubos(cubo, parcial))
+            yield bloco
+
+    def resumidas():
+        for tabela in largas():
+            _resumir(resumo, tabela)
+            yield tabela
+
+    try:
+        # 1ª passada: blocos largos num temporário e o resumo das colunas
+        gravar_tabelas(largo, resumidas(), meta)
+        # 2ª passada: o temporário, lote a lote, já no esquema compacto
+        compacto, dicionarios = _esquema_compacto(esquema, resumo)
+        with pa.memory_map(largo, "r") as fonte:
+            leitor = pa.ipc.open_file(fonte)
+            gravar_tabelas(pendente, (
+                _compactar_lote(leitor.get_batch(i), compacto, dicionarios)
+                for i in range(leitor.num_record_batches)), meta)
+        # Quarentena, cubo e validação são publicados antes do snapshot:
+        # quem vê o snapshot novo já encontra os correspondentes
+        if os.path.exists(quarentena):
+            os.replace(quarentena, caminho_quarentena(caminho_csv))
+        else:
+            gravar_quarentena(caminho_csv, pd.DataFrame())
+        if cubo is not None:
+            gravar_tabelas(
+                caminho_cubo(caminho_csv),
+                [pa.Table.from_pandas(compactar(cubo), preserve_index=False)],
+                meta)
+        gravar_validacao(caminho_csv, validacao["linhas"],
+                         validacao["rejeitadas"], validacao["colunas"])
+        os.replace(pendente, snap)
+    finally:
+        for tmp in (largo, pendente, quarentena):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    return abrir_snapshot(snap, meta)
+
+
+# Cubo publicado pela ingestão em blocos, se for da mesma versão dos dados
+def carregar_cubo_publicado(caminho_csv, versao):
+    caminho = caminho_cubo(caminho_csv)
+    meta = ler_meta_snapshot(caminho)
+    if (meta is None or
+            f"{meta.get('versao')}:{meta.get('sha256')}" != versao):
+        return None
+    cubo = abrir_snapshot(caminho, meta)
+    del cubo.attrs["versao"]
+    return cubo
+
+
+def anexo_pendente(meta, caminho_csv, stat):
+    # O CSV é o publicado com linhas inteiras a mais no fim?
+    if meta is None or meta.get("versao") != VERSAO_PREPARO:
+        return False
+    if ler_validacao(caminho_csv) is None:
+        return False
+    tamanho = meta.get("tamanho", 0)
+    if not 0 < tamanho < stat.st_size:
+        return False
+    with open(caminho_csv, "rb") as f:
+        f.seek(tamanho - 1)
+        if f.read(1) != b"\n":
+            return False
+    return hash_arquivo(caminho_csv, limite=tamanho) == meta["sha256"]
+
+
+def publicar_anexo(caminho_csv, preparar, meta, progresso=None):
+    snap = caminho_snapshot(caminho_csv)
+    cubo = None
+    if INGESTAO[preparar][2] is not None:
+        versao = f"{meta['versao']}:{meta['sha256']}"
+        cubo = carregar_cubo_publicado(caminho_csv, versao)
+        if cubo is None:
+            cubo = cb.construir_cubo(abrir_snapshot(snap, meta))
+    return publicar_em_blocos(
+        caminho_csv, preparar, progresso,
+        base=(snap, cubo, meta["tamanho"], ler_validacao(caminho_csv)))
+
+
+def _conferir(copia, preparar, obtido):
+    inteiro = preparar(copia)
+    _conferir_tabela(obtido, inteiro)
+    versao = f"{VERSAO_PREPARO}:{meta_csv(copia)['sha256']}"
+    cubo = carregar_cubo_publicado(copia, versao)
+    if cubo is not None:
+        _conferir_tabela(cubo, compactar(cb.construir_cubo(inteiro)),
+                         check_categorical=False)
+
+
+# Colunas inteiras comparam exatamente; as float (perm_soma somada em outra
+# ordem pelos blocos) com a tolerância padrão
+def _conferir_tabela(obtido, esperado, **opcoes):
+    inteiras = [c for c in esperado.columns
+                if pd.api.types.is_integer_dtype(esperado[c].dtype)]
+    pd.testing.assert_frame_equal(obtido[inteiras], esperado[inteiras],
+                                  check_exact=True, **opcoes)
+    pd.testing.assert_frame_equal(obtido, esperado, **opcoes)
+
+
+# Roda em outro processo: carrega o CSV como um processo do dashboard e
+# devolve (se este processo publicou, linhas carregadas)
+def _carregar_concorrente(copia, preparar, largada, resultados):
+    import dados
+    import ingestao
+
+    publicou = []
+    for modulo, nome in [(dados, "_publicar"), (ingestao, "publicar_anexo")]:
+        def contar(*args, _original=getattr(modulo, nome), **kwargs):
+            publicou.append(True)
+            return _original(*args, **kwargs)
+        setattr(modulo, nome, contar)
+    largada.wait()
+    df = dados.carregar_com_snapshot(copia, preparar)
+    resultados.put((bool(publicou), len(df)))
+
+
+def conferir_concorrencia(copia, preparar, processos=4):
+    # processos abrem ao mesmo tempo um CSV cujo snapshot está vencido: só
+    # um deles publica, e todos recebem a tabela da leitura inteira
+    largada, resultados = mp.Barrier(processos), mp.Queue()
+    filhos = [mp.Process(target=_carregar_concorrente,
+                         args=(copia, preparar, largada, resultados))
+              for _ in range(processos)]
+    for filho in filhos:
+        filho.start()
+    obtidos = [resultados.get(timeout=600) for _ in filhos]
+    for filho in filhos:
+        filho.join()
+    assert all(filho.exitcode == 0 for filho in filhos)
+    assert sum(publicou for publicou, _ in obtidos) == 1, obtidos
+    inteiro = preparar(copia)
+    assert all(linhas == len(inteiro) for _, linhas in obtidos), obtidos
+    from dados import carregar_com_snapshot
+    _conferir(copia, preparar, carregar_com_snapshot(copia, preparar))
+
+
+def conferir_blocos(copia, preparar, linhas_por_bloco=LINHAS_POR_BLOCO):
+    df = publicar_em_blocos(copia, preparar,
+                            linhas_por_bloco=linhas_por_bloco)
+    _conferir(copia, preparar, df)
+    return len(df)
+
+
+# Publica os primeiros 80% das linhas da cópia e acrescenta o resto sem
+# republicar; devolve quantas linhas foram acrescentadas
+def _publicar_parcial(copia, preparar):
+    from dados import publicar
+
+    with open(copia, "rb") as f:
+        conteudo = f.read()
+    corte = conteudo.index(b"\n", len(conteudo) * 4 // 5) + 1
+    with open(copia, "wb") as f:
+        f.write(conteudo[:corte])
+    publicar(copia, preparar)
+    with open(copia, "ab") as f:
+        f.write(conteudo[corte:])
+    return conteudo[corte:].count(b"\n")
+
+
+def conferir_anexo(copia, preparar):
+    from dados import carregar_com_snapshot
+
+    novas = _publicar_parcial(copia, preparar)
+    df = carregar_com_snapshot(copia, preparar)
+    assert ler_meta_snapshot(caminho_snapshot(copia))["em_blocos"]
+    _conferir(copia, preparar, df)
+    return novas
+
+
+def conferir_republicacao(copia, preparar, processos=4):
+    # Vários processos percebem as linhas acrescentadas (e depois o snapshot
+    # apagado) ao mesmo tempo
+    _publicar_parcial(copia, preparar)
+    conferir_concorrencia(copia, preparar, processos)
+    os.remove(caminho_snapshot(copia))
+    conferir_concorrencia(copia, preparar, processos)
+
+
+if __name__ == "__main__":
+    # python ingestao.py [linhas_por_bloco]: confere, em cópias dos dois
+    # CSVs, a ingestão em blocos e a de linhas acrescentadas com a leitura
+    # inteira
+    linhas = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    with tempfile.TemporaryDirectory() as pasta:
+        for nome, preparar in [("saida.csv", preparar_saida),
+                               ("evasao_processos.csv", preparar_evasao)]:
+            copia = os.path.join(pasta, nome)
+            shutil.copy(nome, copia)
+            n = conferir_blocos(copia, preparar, linhas)
+            print(f"{nome}: {n} linhas em blocos de {linhas} "
+                  "conferem com a leitura inteira")
+            novas = conferir_anexo(copia, preparar)
+            print(f"{nome}: {novas} linhas acrescentadas conferem com a "
+                  "leitura inteira")
+            conferir_republicacao(copia, preparar)
+            print(f"{nome}: 4 processos ao mesmo tempo, uma só publicação")
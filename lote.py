@@ -0,0 +1,106 @@
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import analise
+
+# ---------------------------------------
+# Relatórios em lote: python lote.py [processos]
+# ---------------------------------------
+# Calcula as análises de todas as abas para cada estado dos filtros que os
+# relatórios usam (sem filtro, cada campus, cada curso sozinho e com o seu
+# campus; grau e turno vazios; o intervalo completo de anos da seleção,
+# como o slider abre) e a tabela de turmas, e grava em
+# analise.PASTA_RELATORIOS. Os estados são divididos entre processos; cada
+# processo abre os snapshots uma vez (herdados do processo principal quando
+# o sistema cria os processos por fork).
+#
+# Cada execução grava numa geração nova da pasta e só então troca o
+# manifesto; as gerações anteriores são apagadas depois.
+
+_base = None
+
+
+def _iniciar():
+    global _base
+    if _base is None:
+        _base = analise.carregar_base()
+
+
+def estados(base):
+    indice = base.indice
+    selecoes = [([], [])]
+    selecoes += [([campus], []) for campus in indice.opcoes("campus")]
+    for campus in indice.opcoes("campus"):
+        posicoes = indice.selecionar({"campus": [campus]})
+        for curso in indice.opcoes("curso_nome", posicoes):
+            selecoes += [([], [curso]), ([campus], [curso])]
+    vistos = set()
+    for campi, cursos in selecoes:
+        filtros = {"campus": campi, "grau": [], "turno": [],
+                   "curso_nome": cursos}
+        anos = analise.limites_anos(indice, filtros)
+        chave = analise.chave_estado(filtros, anos)
+        if chave not in vistos:
+            vistos.add(chave)
+            yield chave, filtros, anos
+
+
+def _calcular(tarefa):
+    pasta, filtros, anos = tarefa
+    os.makedirs(pasta)
+    for nome, analisar in analise.ANALISES.items():
+        analise.gravar_analise(pasta, nome, analisar(_base, filtros, anos))
+    return pasta
+
+
+def gerar(pasta=analise.PASTA_RELATORIOS, processos=None, progresso=None):
+    global _base
+    _base = analise.carregar_base()
+    geracao = f"geracao-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    destino = os.path.join(pasta, geracao)
+    os.makedirs(destino)
+    analise.turmas(_base).to_parquet(os.path.join(destino, "turmas.parquet"))
+
+    lista = list(estados(_base))
+    tarefas = [(os.path.join(destino, f"{i:04d}"), filtros, anos)
+               for i, (_, filtros, anos) in enumerate(lista)]
+    with ProcessPoolExecutor(processos, initializer=_iniciar) as executor:
+        for i, _ in enumerate(executor.map(_calcular, tarefas, chunksize=4)):
+            if progresso is not None:
+                progresso((i + 1) / len(tarefas),
+                          f"{i + 1} de {len(tarefas)} estados")
+
+    manifesto = {
+        "versao": _base.versao,
+        "versao_evasao": _base.versao_evasao,
+        "geracao": geracao,
+        "analises": list(analise.ANALISES),
+        "estados": [
+            {"chave": chave, "pasta": f"{i:04d}", "campus": filtros["campus"],
+             "curso_nome": filtros["curso_nome"], "anos": list(anos)}
+            for i, (chave, filtros, anos) in enumerate(lista)
+        ],
+    }
+    caminho = analise.caminho_manifesto(pasta)
+    with open(f"{caminho}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=1)
+    os.replace(f"{caminho}.tmp", caminho)
+    for nome in os.listdir(pasta):
+        if nome.startswith("geracao-") and nome != geracao:
+            shutil.rmtree(os.path.join(pasta, nome), ignore_errors=True)
+    return manifesto
+
+
+if __name__ == "__main__":
+    processos = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    inicio = time.perf_counter()
+    manifesto = gerar(processos=processos, progresso=lambda fracao, texto:
+                      print(f"  {fracao:6.1%} {texto}", flush=True))
+    print(f"{len(manifesto['estados'])} estados x "
+          f"{len(manifesto['analises'])} análises em "
+          f"{analise.PASTA_RELATORIOS}/{manifesto['geracao']} "
+          f"({time.perf_counter() - inicio:.1f} s)")
@@ -0,0 +1,61 @@
+import gc
+import logging
+import sys
+import tracemalloc
+
+import streamlit as st
+
+from dados import (carregar_com_snapshot, compartilhar, preparar_evasao,
+                   preparar_saida)
+
+# ---------------------------------------
+# Memória das tabelas com N sessões simultâneas
+# ---------------------------------------
+# python memoria_sessoes.py [N ...] (padrão: 1 10 50)
+#
+# Cada sessão guarda o que load_data()/load_evasao() devolvem enquanto o
+# script roda. Com st.cache_data cada chamada devolve uma cópia nova (o valor
+# é desserializado do cache); com st.cache_resource e a tabela compartilhada
+# todas recebem o mesmo objeto. Mede-se, com tracemalloc, a memória alocada
+# pelas N sessões depois do cache já aquecido.
+
+SESSOES_PADRAO = [1, 10, 50]
+
+
+def _tabelas():
+    return (carregar_com_snapshot("saida.csv", preparar_saida),
+            carregar_com_snapshot("evasao_processos.csv", preparar_evasao))
+
+
+@st.cache_data
+def _tabelas_por_sessao():
+    return _tabelas()
+
+
+@st.cache_resource
+def _tabelas_compartilhadas():
+    return tuple(compartilhar(t) for t in _tabelas())
+
+
+def medir(carregar, n):
+    carregar.clear()
+    carregar()
+    gc.collect()
+    tracemalloc.start()
+    sessoes = [carregar() for _ in range(n)]
+    alocado, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del sessoes
+    return alocado / 2**20
+
+
+if __name__ == "__main__":
+    # Fora do "streamlit run" os caches avisam a cada chamada que não há
+    # contexto de sessão
+    logging.getLogger("streamlit.runtime.scriptrunner_utils"
+                      ".script_run_context").disabled = True
+    print(f"{'sessões':>8} {'cópia por sessão (MB)':>22} "
+          f"{'compartilhada (MB)':>19}")
+    for n in [int(a) for a in sys.argv[1:]] or SESSOES_PADRAO:
+        print(f"{n:>8} {medir(_tabelas_por_sessao, n):>22.2f} "
+              f"{medir(_tabelas_compartilhadas, n):>19.2f}")
@@ -0,0 +1,52 @@
+import numpy as np
+
+# ---------------------------------------
+# Métricas de razão usadas pelas abas
+# ---------------------------------------
+# Todas recebem Series/arrays e calculam em lote com NumPy. Denominador nulo,
+# zero ou negativo não gera divisão: a posição recebe o valor de "vazio".
+
+# A partir de 2014 metade das vagas passou para o SISU
+ANO_DIVISAO_SISU = 2014
+
+
+def razao(numerador, denominador, vazio=0.0):
+    num = np.asarray(numerador, dtype=float)
+    den = np.asarray(denominador, dtype=float)
+    out = np.full(np.broadcast(num, den).shape, vazio, dtype=float)
+    return np.divide(num, den, out=out, where=den > 0)
+
+
+# Vagas do vestibular: até 2013 = vagas, a partir de 2014 = vagas * 0.5
+def vagas_vestibular(vagas, ano):
+    vagas = np.asarray(vagas, dtype=float)
+    return np.where(np.asarray(ano) < ANO_DIVISAO_SISU, vagas, vagas * 0.5)
+
+
+# Inscritos no vestibular por vaga do vestibular
+def concorrencia_vest(incritos_vest, vagas_vest):
+    return razao(incritos_vest, vagas_vest)
+
+
+# Inscritos por vaga total, dobrado a partir de 2014 (metade das vagas no SISU)
+def concorrencia_corrigida(incritos_vest, vagas, ano):
+    fator = np.where(np.asarray(ano) >= ANO_DIVISAO_SISU, 2, 1)
+    return fator * razao(incritos_vest, vagas)
+
+
+# Ocupação (coluna Permanencia): soma das séries / (séries válidas * vagas);
+# -1 marca as linhas sem séries válidas ou sem vagas
+def ocupacao(soma_series, qtd_validos, vagas):
+    denominador = np.asarray(qtd_validos, dtype=float) * np.asarray(
+        vagas, dtype=float)
+    return razao(soma_series, denominador, vazio=-1.0)
+
+
+# Percentual de evasão sobre entradas; NaN quando não há entradas
+def taxa_evasao(evasao, entradas):
+    return razao(evasao, entradas, vazio=np.nan) * 100
+
+
+# Percentual de formados sobre ingressantes; NaN quando não há ingressantes
+def taxa_formados(formados, ingressantes):
+    return razao(formados, ingressantes, vazio=np.nan) * 100
@@ -0,0 +1,204 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import pandas as pd
+import pyarrow as pa
+
+# ---------------------------------------
+# Trechos cronometrados de uma execução do dashboard
+# ---------------------------------------
+# Cada trecho (with perfil.trecho(nome, categoria)) guarda o tempo de
+# parede, as linhas processadas e os bytes serializados, quando quem mede os
+# informa. Trechos dentro de trechos ficam aninhados (nível), por thread.
+# Memória não é medida aqui: o tracemalloc é do processo todo (ligado por
+# uma sessão, deixaria todas as outras do servidor mais lentas, e o pico
+# de uma se misturaria com o das outras). A memória é medida fora do
+# servidor, por desempenho.py e memoria_sessoes.py.
+#
+# Os trechos de uma sessão ficam num Perfil (os últimos LIMITE_TRECHOS),
+# marcados com o número da execução, e saem em JSON lines ou no formato de
+# trace do Chrome (chrome://tracing, Perfetto). Com o painel desligado o
+# dashboard usa DESLIGADO, que não mede nada: cada trecho custa uma chamada.
+
+LIMITE_TRECHOS = 5000
+
+
+class Trecho:
+    __slots__ = ("nome", "categoria", "execucao", "thread", "nivel",
+                 "inicio_ns", "duracao_ns", "linhas", "bytes")
+
+    def como_dict(self):
+        return {campo: getattr(self, campo) for campo in self.__slots__
+                if not campo.startswith("_")}
+
+
+class _TrechoNulo:
+    # Aceita e descarta linhas/bytes
+    ativo = False
+
+    def __setattr__(self, nome, valor):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        return False
+
+
+TRECHO_NULO = _TrechoNulo()
+
+
+class _PerfilDesligado:
+    ativo = False
+
+    def trecho(self, nome, categoria="", linhas=None, bytes=None):
+        return TRECHO_NULO
+
+    def nova_execucao(self, tipo="script"):
+        pass
+
+    def abrir(self, nome, categoria=""):
+        return TRECHO_NULO
+
+    def fechar(self, trecho):
+        pass
+
+
+DESLIGADO = _PerfilDesligado()
+
+
+class _Contexto:
+    __slots__ = ("perfil", "trecho")
+
+    def __init__(self, perfil, trecho):
+        self.perfil = perfil
+        self.trecho = trecho
+
+    def __enter__(self):
+        self.perfil._abrir(self.trecho)
+        return self.trecho
+
+    def __exit__(self, *excecao):
+        self.perfil._fechar(self.trecho)
+        return False
+
+
+class Perfil:
+    ativo = True
+
+    def __init__(self, limite=LIMITE_TRECHOS):
+        self.trechos = deque(maxlen=limite)
+        self.execucao = 0
+        self.tipos = {}
+        self._pilhas = threading.local()
+        self._trava = threading.Lock()
+        self._origem_ns = time.perf_counter_ns()
+
+    def nova_execucao(self, tipo="script"):
+        # Trechos deixados abertos por uma execução interrompida (st.stop,
+        # exceção) não viram pais dos trechos da próxima
+        self._pilha().clear()
+        with self._trava:
+            self.execucao += 1
+            self.tipos[self.execucao] = tipo
+
+    def trecho(self, nome, categoria="", linhas=None, bytes=None):
+        trecho = Trecho()
+        trecho.nome = nome
+        trecho.categoria = categoria
+        trecho.linhas = linhas
+        trecho.bytes = bytes
+        return _Contexto(self, trecho)
+
+    # Para trechos que não cabem num with (um pedaço do script no nível do
+    # módulo)
+    def abrir(self, nome, categoria=""):
+        contexto = self.trecho(nome, categoria)
+        return contexto.__enter__()
+
+    def fechar(self, trecho):
+        self._fechar(trecho)
+
+    def _pilha(self):
+        pilha = getattr(self._pilhas, "pilha", None)
+        if pilha is None:
+            pilha = self._pilhas.pilha = []
+        return pilha
+
+    def _abrir(self, trecho):
+        pilha = self._pilha()
+        trecho.execucao = self.execucao
+        trecho.thread = threading.get_ident()
+        trecho.nivel = len(pilha)
+        pilha.append(trecho)
+        trecho.inicio_ns = time.perf_counter_ns()
+
+    def _fechar(self, trecho):
+        trecho.duracao_ns = time.perf_counter_ns() - trecho.inicio_ns
+        pilha = self._pilha()
+        pilha.pop()
+        with self._trava:
+            self.trechos.append(trecho)
+
+    def _ordenados(self, execucao=None):
+        with self._trava:
+            trechos = list(self.trechos)
+        if execucao is not None:
+            trechos = [t for t in trechos if t.execucao == execucao]
+        return sorted(trechos, key=lambda t: t.inicio_ns)
+
+    def tabela(self, execucao=None):
+        linhas = [{
+            "trecho": "  " * t.nivel + t.nome,
+            "categoria": t.categoria,
+            "ms": t.duracao_ns / 1e6,
+            "linhas": t.linhas,
+            "bytes": t.bytes,
+        } for t in self._ordenados(execucao)]
+        return pd.DataFrame(linhas, columns=["trecho", "categoria", "ms",
+                                             "linhas", "bytes"])
+
+    def para_jsonl(self):
+        return "".join(
+            json.dumps({**t.como_dict(), "tipo": self.tipos.get(t.execucao),
+                        "inicio_ns": t.inicio_ns - self._origem_ns},
+                       ensure_ascii=False) + "\n"
+            for t in self._ordenados())
+
+    def para_chrome(self):
+        # Eventos completos ("X") em microssegundos desde a criação do perfil
+        eventos = [{
+            "name": t.nome,
+            "cat": t.categoria,
+            "ph": "X",
+            "ts": (t.inicio_ns - self._origem_ns) / 1000,
+            "dur": t.duracao_ns / 1000,
+            "pid": os.getpid(),
+            "tid": t.thread,
+            "args": {campo: valor for campo, valor in (
+                ("execucao", t.execucao), ("linhas", t.linhas),
+                ("bytes", t.bytes))
+                if valor is not None},
+        } for t in self._ordenados()]
+        return json.dumps({"traceEvents": eventos,
+                           "displayTimeUnit": "ms"}, ensure_ascii=False)
+
+
+def linhas_tabelas(d):
+    # Linhas das tabelas de um dicionário de dados de aba
+    return sum(len(v) for v in d.values() if isinstance(v, pd.DataFrame))
+
+
+def bytes_arrow(df):
+    # Tamanho da tabela em Arrow, formato em que o st.dataframe a envia
+    try:
+        return pa.Table.from_pandas(df).nbytes
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Colunas de tipos misturados: o st.dataframe as envia como texto
+        texto = df.astype({col: str for col in df.columns
+                           if df[col].dtype == object})
+        return pa.Table.from_pandas(texto).nbytes
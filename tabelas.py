@@ -0,0 +1,86 @@
+import io
+import math
+
+import numpy as np
+import streamlit as st
+
+import perfil
+
+# ---------------------------------------
+# Tabelas paginadas no servidor
+# ---------------------------------------
+# O servidor guarda só as posições das linhas filtradas; ordenação e
+# escolha de colunas são feitas aqui, e o navegador recebe apenas a página
+# visível. O tamanho enviado a cada execução não cresce com os dados.
+#
+# A exportação completa é gerada só na execução em que é pedida, em blocos
+# de linhas (sem montar o recorte inteiro como DataFrame), e não fica na
+# sessão: os bytes vão direto para o st.download_button, que na versão usada
+# (1.49) só aceita o conteúdo pronto e o guarda no gerenciador de mídia
+# enquanto o botão está na página. A próxima execução não desenha o botão e
+# o arquivo é liberado.
+
+LINHAS_POR_PAGINA = [25, 50, 100, 250]
+LINHAS_POR_BLOCO_EXPORTACAO = 10_000
+SEM_ORDEM = "(ordem original)"
+
+
+def ordenar(df, posicoes, coluna, crescente=True):
+    # Ordem estável das posições pela coluna, nulos por último
+    if coluna is None:
+        return posicoes
+    valores = df[coluna].take(posicoes).reset_index(drop=True)
+    ordem = valores.sort_values(ascending=crescente, kind="stable",
+                                na_position="last").index.to_numpy()
+    return posicoes[ordem]
+
+
+def pagina(df, posicoes, colunas, numero, tamanho):
+    inicio = (numero - 1) * tamanho
+    return df.take(posicoes[inicio:inicio + tamanho])[colunas]
+
+
+def blocos_csv(df, posicoes, colunas, linhas=LINHAS_POR_BLOCO_EXPORTACAO):
+    for inicio in range(0, len(posicoes), linhas) or [0]:
+        yield df.take(posicoes[inicio:inicio + linhas])[colunas].to_csv(
+            index=False, header=inicio == 0)
+
+
+def tabela_paginada(df, chave, posicoes=None, nome_arquivo="dados.csv",
+                    perfil_execucao=perfil.DESLIGADO):
+    posicoes = (np.arange(len(df)) if posicoes is None
+                else np.asarray(posicoes))
+    todas = list(df.columns)
+    c1, c2, c3, c4 = st.columns([4, 2, 1, 1])
+    colunas = c1.multiselect("Colunas", todas, default=todas,
+                             key=f"{chave}_colunas") or todas
+    coluna_ordem = c2.selectbox("Ordenar por", [SEM_ORDEM] + colunas,
+                                key=f"{chave}_ordem")
+    crescente = c3.selectbox("Sentido", ["Crescente", "Decrescente"],
+                             key=f"{chave}_sentido") == "Crescente"
+    tamanho = c4.selectbox("Linhas", LINHAS_POR_PAGINA, index=1,
+                           key=f"{chave}_tamanho")
+
+    ordem = None if coluna_ordem == SEM_ORDEM else coluna_ordem
+    posicoes = ordenar(df, posicoes, ordem, crescente)
+    paginas = max(1, math.ceil(len(posicoes) / tamanho))
+    # Filtros mais restritos podem deixar a página guardada fora do intervalo
+    chave_pagina = f"{chave}_pagina"
+    if st.session_state.get(chave_pagina, 1) > paginas:
+        st.session_state[chave_pagina] = paginas
+    numero = st.number_input("Página", 1, paginas, step=1, key=chave_pagina)
+    st.caption(f"{len(posicoes)} linhas · página {numero} de {paginas}")
+    visivel = pagina(df, posicoes, colunas, numero, tamanho)
+    with perfil_execucao.trecho(f"tabela:{chave}", "tabela",
+                                linhas=len(visivel)) as trecho:
+        st.dataframe(visivel, use_container_width=True)
+    if perfil_execucao.ativo:
+        trecho.bytes = perfil.bytes_arrow(visivel)
+
+    if st.button("Preparar exportação (CSV)", key=f"{chave}_exportar"):
+        arquivo = io.BytesIO()
+        for bloco in blocos_csv(df, posicoes, colunas):
+            arquivo.write(bloco.encode("utf-8"))
+        st.download_button(f"Baixar {len(posicoes)} linhas", arquivo,
+                           file_name=nome_arquivo, mime="text/csv",
+                           key=f"{chave}_baixar", on_click="ignore")
@@ -0,0 +1,53 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import dados  # noqa: E402
+
+# Os testes trabalham sobre cópias dos CSVs: a validação, a quarentena e os
+# snapshots gravados ao lado deles não sujam a raiz do repositório.
+FONTES = {
+    "saida": ("saida.csv", dados.preparar_saida),
+    "evasao": ("evasao_processos.csv", dados.preparar_evasao),
+}
+
+
+@pytest.fixture(scope="session")
+def pasta_csv(tmp_path_factory):
+    pasta = tmp_path_factory.mktemp("csv")
+    for nome, _ in FONTES.values():
+        shutil.copy(os.path.join(RAIZ, nome), pasta / nome)
+    return pasta
+
+
+@pytest.fixture(scope="session", params=sorted(FONTES))
+def fonte(request, pasta_csv):
+    nome, preparar = FONTES[request.param]
+    return str(pasta_csv / nome), preparar
+
+
+@pytest.fixture(scope="session")
+def tabela(fonte):
+    caminho, preparar = fonte
+    return preparar(caminho)
+
+
+# Cópia própria do CSV para os testes que publicam e reescrevem o arquivo
+@pytest.fixture(params=sorted(FONTES))
+def copia(request, tmp_path):
+    nome, preparar = FONTES[request.param]
+    shutil.copy(os.path.join(RAIZ, nome), tmp_path / nome)
+    return str(tmp_path / nome), preparar
+
+
+@pytest.fixture(scope="session")
+def cubo_saida(pasta_csv):
+    import cubo
+
+    return cubo.construir_cubo(
+        dados.preparar_saida(str(pasta_csv / "saida.csv")))
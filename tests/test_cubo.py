@@ -0,0 +1,6 @@
+import cubo
+import dados
+
+
+def test_paridade_com_o_calculo_direto(pasta_csv):
+    cubo.conferir_paridade(dados.preparar_saida(str(pasta_csv / "saida.csv")))
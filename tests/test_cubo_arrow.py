@@ -0,0 +1,5 @@
+import cubo_arrow
+
+
+def test_paridade_exata_com_o_caminho_pandas(cubo_saida):
+    cubo_arrow.conferir_paridade(cubo_saida)
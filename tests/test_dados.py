@@ -0,0 +1,11 @@
+import dados
+
+
+def test_tabela_compartilhada_recusa_escritas(tabela):
+    dados.conferir_somente_leitura(tabela)
+
+
+def test_tabela_compartilhada_veio_do_snapshot(fonte):
+    caminho, preparar = fonte
+    dados.conferir_somente_leitura(
+        dados.carregar_com_snapshot(caminho, preparar))
@@ -0,0 +1,19 @@
+import pytest
+
+import ingestao
+
+
+@pytest.mark.parametrize("linhas_por_bloco", [100, ingestao.LINHAS_POR_BLOCO])
+def test_blocos_conferem_com_a_leitura_inteira(copia, linhas_por_bloco):
+    caminho, preparar = copia
+    ingestao.conferir_blocos(caminho, preparar, linhas_por_bloco)
+
+
+def test_linhas_acrescentadas_conferem_com_a_leitura_inteira(copia):
+    caminho, preparar = copia
+    assert ingestao.conferir_anexo(caminho, preparar) > 0
+
+
+def test_processos_concorrentes_publicam_uma_vez(copia):
+    caminho, preparar = copia
+    ingestao.conferir_republicacao(caminho, preparar)
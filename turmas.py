@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+from dados import SERIES_COLS
+
+# ---------------------------------------
+# Tabela de turmas (coortes)
+# ---------------------------------------
+# Uma turma que ingressa no ano t aparece em primeiro_ano no ano t, em
+# segundo_ano no ano t+1, e assim por diante. A tabela guarda essa diagonal
+# para todos os cursos e anos de ingresso de uma vez, indexada por
+# (curso_nome, ano_ingresso), junto com o ano de formatura e os formados.
+#
+# Como no acompanhamento original, os anos da turma com valor zero não contam:
+# a formatura é no ano de ingresso - 1 + número de séries com alunos.
+
+COLS_FORMADOS = ["formados_geral", "formados_min"]
+
+
+def construir_turmas(df):
+    base = df[df["ano"].notna()]
+    por_ano = base.groupby(["curso_nome", "ano"], observed=True)[
+        SERIES_COLS + COLS_FORMADOS].sum()
+    cursos = por_ano.index.get_level_values("curso_nome")
+    anos = por_ano.index.get_level_values("ano").to_numpy(dtype=int)
+    codigos, nomes = pd.factorize(cursos)
+
+    # Grade densa curso x ano; uma coluna de folga antes (formatura de turma
+    # sem séries) e seis depois (diagonal das turmas mais recentes)
+    ano_base = anos.min() - 1
+    n_anos = anos.max() - ano_base + len(SERIES_COLS) + 1
+    grade = np.zeros((len(nomes), n_anos, por_ano.shape[1]))
+    pos = anos - ano_base
+    grade[codigos, pos] = por_ano.to_numpy(dtype=float, na_value=np.nan)
+
+    serie = np.arange(len(SERIES_COLS))
+    diagonal = grade[codigos[:, None], pos[:, None] + serie, serie]
+    n_series = (diagonal != 0).sum(axis=1)
+    pos_formatura = pos - 1 + n_series
+    formados = grade[codigos, pos_formatura, len(SERIES_COLS):]
+
+    turmas = pd.DataFrame(
+        diagonal, columns=SERIES_COLS,
+        index=pd.MultiIndex.from_arrays(
+            [cursos, anos], names=["curso_nome", "ano_ingresso"]))
+    turmas["ano_formatura"] = anos - 1 + n_series
+    turmas[COLS_FORMADOS] = formados
+    return turmas
+
+
+def evolucao_turma(turmas, curso, ano_ingresso):
+    # Linhas do quadro "Acompanhamento de uma Turma": uma por ano com alunos
+    # e, por último, os formados no ano de formatura
+    linha = turmas.loc[(curso, ano_ingresso)]
+    evolucao = [
+        {
+            "Ano civil": ano_ingresso + i,
+            "Ano da turma": i + 1,
+            "Matriculados": linha[col],
+            "Formados tempo mínimo": 0
+        }
+        for i, col in enumerate(SERIES_COLS) if linha[col] != 0
+    ]
+    evolucao.append({
+        "Ano civil": int(linha["ano_formatura"]),
+        "Ano da turma": "Formados",
+        "Matriculados": linha["formados_geral"],
+        "Formados tempo mínimo": linha["formados_min"]
+    })
+    return evolucao
+
+
+def curvas_retencao(turmas, curso):
+    # Matriculados de todas as turmas do curso por ano da turma (formato longo)
+    curvas = turmas.loc[curso, SERIES_COLS].reset_index().melt(
+        id_vars="ano_ingresso", var_name="serie", value_name="Matriculados")
+    curvas["Ano da turma"] = curvas["serie"].map(
+        {col: i + 1 for i, col in enumerate(SERIES_COLS)})
+    curvas = curvas[curvas["Matriculados"] != 0]
+    return curvas.sort_values(["ano_ingresso", "Ano da turma"])